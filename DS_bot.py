@@ -1,10 +1,29 @@
-from openai import OpenAI
+import asyncio
 import os
+import queue
+import threading
 import time
+from collections import namedtuple
+
+import client_pool
+import metrics
+from context_manager import ContextManager
+from response_cache import get_default_cache, make_cache_key
+from resilience import CircuitOpenError, RetryPolicy, async_call_with_retry, call_with_retry, get_breaker
+
+
+class DSBotError(Exception):
+    """调用Deepseek API失败（已重试），本轮对话已从历史中回滚"""
+
+
+# 批量请求的单条结果：index为输入中的序号，出错时response为None、error为错误信息
+BatchResult = namedtuple("BatchResult", ["index", "item", "response", "error"])
 
 
 class DS_Bot:
-    def __init__(self, api_key=None, model="deepseek-chat", temperature=0.7, max_tokens=1000):
+    def __init__(self, api_key=None, model="deepseek-chat", temperature=0.7, max_tokens=1000,
+                 system_prompt=None, context_tokens=6000, context_policy=None, cache="auto",
+                 retry_policy=None, fallback=None, base_url=None, on_usage=None):
         """
         初始化基于Deepseek API的聊天机器人
 
@@ -13,56 +32,323 @@ class DS_Bot:
             model: 使用的Deepseek模型
             temperature: 响应的采样温度
             max_tokens: 响应的最大token数
+            system_prompt: 系统提示词，始终随请求发送
+            context_tokens: 每次请求发送的对话历史token预算
+            context_policy: 超出预算的旧消息处理策略（见context_manager）
+            cache: 响应缓存，"auto"表示仅在temperature为0时启用共享缓存，
+                   也可传入True/False或ResponseCache实例
+            retry_policy: 超时与重试策略（默认RetryPolicy()）
+            fallback: 熔断期间代为回复的机器人（如SimpleBot），为None时直接报错
+            base_url: API端点（默认从DEEPSEEK_BASE_URL环境变量获取，否则为官方端点）
+            on_usage: 每次请求结束后以用量记录（dict）调用的回调，如UsageLedger.recorder(user_id)，
+                      在请求线程中调用，不应阻塞
         """
         self.api_key = api_key or os.environ.get("DEEPSEEK_API_KEY")
         if not self.api_key:
             raise ValueError("API密钥必须提供或设置为DEEPSEEK_API_KEY环境变量")
 
-        # Deepseek API使用OpenAI的客户端与基本URL
-        self.client = OpenAI(
-            api_key=self.api_key,
-            base_url="https://api.deepseek.com/v1"  # Deepseek API端点
-        )
+        # Deepseek API端点，客户端从进程内共享的连接池获取
+        self.base_url = base_url or os.environ.get("DEEPSEEK_BASE_URL") or client_pool.DEFAULT_BASE_URL
 
         self.model = model
         self.temperature = temperature
         self.max_tokens = max_tokens
+        self.system_prompt = system_prompt
+        self.context = ContextManager(max_tokens=context_tokens, policy=context_policy)
+
+        # 只有确定性的采样参数才适合复用回复
+        if cache == "auto":
+            cache = temperature == 0
+        if cache is True:
+            cache = get_default_cache()
+        self.cache = cache or None
+
+        # 同一端点的所有机器人共用一个熔断器
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.breaker = get_breaker(self.base_url)
+        self.fallback = fallback
+        self.on_usage = on_usage
+
         self.conversation_history = []
+        self.clear_history()
+
+    @property
+    def client(self):
+        """共享的OpenAI客户端，相同密钥的机器人复用同一组keep-alive连接"""
+        return client_pool.get_client(self.api_key, self.base_url)
 
     def add_message(self, role, content):
         """向对话历史添加消息"""
         self.conversation_history.append({"role": role, "content": content})
 
-    def get_response(self, user_input, stream=False):
-        """获取Deepseek API对用户输入的响应"""
+    def build_messages(self):
+        """按token预算构造本次请求发送的消息列表"""
+        return self.context.build(self.conversation_history)
+
+    def _cache_key(self, messages):
+        return make_cache_key(self.model, self.temperature, self.max_tokens, messages)
+
+    def peek_cache(self, user_input):
+        """不修改历史、不计入统计，检查这条输入是否会命中响应缓存"""
+        if self.cache is None or user_input.startswith("/"):
+            return None
+        messages = self.context.build(self.conversation_history + [{"role": "user", "content": user_input}])
+        return self.cache.get(self._cache_key(messages), count=False)
+
+    def _create_completion(self, messages, stream):
+        """带超时、重试和熔断的API调用"""
+        # 流式响应在最后一个块中返回token用量
+        extra = {"stream_options": {"include_usage": True}} if stream else {}
+
+        def attempt(timeout):
+            return self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+                stream=stream,
+                timeout=timeout,
+                **extra
+            )
+
+        return call_with_retry(attempt, self.retry_policy, self.breaker, stream=stream)
+
+    @staticmethod
+    def _usage_counts(usage):
+        """从usage中取出(输入, 输出, 命中缓存的输入)token数"""
+        if usage is None:
+            return 0, 0, 0
+        cached = getattr(usage, "prompt_cache_hit_tokens", None)  # Deepseek
+        if cached is None:
+            details = getattr(usage, "prompt_tokens_details", None)  # OpenAI
+            cached = getattr(details, "cached_tokens", None)
+        return usage.prompt_tokens or 0, usage.completion_tokens or 0, cached or 0
+
+    def _record_metrics(self, started, enqueued_at=None, first_token_at=None, usage=None,
+                        stream=False, cache_hit=False, error=None):
+        """记录本次调用的耗时和token用量（时间均为time.perf_counter()读数）"""
+        finished = time.perf_counter()
+        prompt_tokens, completion_tokens, cached_tokens = self._usage_counts(usage)
+        record = metrics.registry.record(
+            queue_ms=(started - enqueued_at) * 1000 if enqueued_at else None,
+            ttft_ms=None if error else ((first_token_at or finished) - started) * 1000,
+            latency_ms=(finished - started) * 1000,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cached_tokens=cached_tokens,
+            cache_hit=cache_hit,
+            error=error,
+            model=self.model,
+            stream=stream
+        )
+        if self.on_usage is not None:
+            self.on_usage(record)
+        return record
+
+    def _rollback(self, mark):
+        """失败的一轮对话不保留在历史中"""
+        del self.conversation_history[mark:]
+
+    def _fallback_response(self, user_input):
+        return ("（Deepseek服务暂时不可用，以下为简易模式回复）\n"
+                + self.fallback.get_response(user_input))
+
+    def get_response(self, user_input, stream=False, use_cache=True, enqueued_at=None):
+        """
+        获取Deepseek API对用户输入的响应
+
+        参数:
+            user_input: 用户输入
+            stream: 是否在控制台流式打印
+            use_cache: 为False时跳过响应缓存
+            enqueued_at: 请求进入队列的time.perf_counter()时刻，用于统计排队时间
+
+        调用失败时回滚本轮对话并抛出DSBotError；熔断期间若配置了fallback则由其回复。
+        """
         # 检查是否是命令
         if user_input.startswith("/"):
             return self.handle_command(user_input)
 
+        started = time.perf_counter()
+
         # 添加用户消息到历史记录
+        mark = len(self.conversation_history)
         self.add_message("user", user_input)
+        messages = self.build_messages()
 
+        cache_key = None
+        if self.cache is not None and use_cache:
+            cache_key = self._cache_key(messages)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                if stream:
+                    print(cached)
+                self.add_message("assistant", cached)
+                self._record_metrics(started, enqueued_at, stream=stream, cache_hit=True)
+                return cached
+
+        usage_holder = []
         try:
             # 调用Deepseek API
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=self.conversation_history,
-                temperature=self.temperature,
-                max_tokens=self.max_tokens,
-                stream=stream
-            )
+            response = self._create_completion(messages, stream)
 
             if stream:
-                return self._handle_streaming(response)
+                assistant_message = self._handle_streaming(response, usage_holder)
             else:
                 assistant_message = response.choices[0].message.content
+                usage_holder.append(response.usage)
                 self.add_message("assistant", assistant_message)
-                return assistant_message
 
+        except CircuitOpenError as e:
+            self._rollback(mark)
+            self._record_metrics(started, enqueued_at, stream=stream, error=str(e))
+            if self.fallback is not None:
+                return self._fallback_response(user_input)
+            raise DSBotError(str(e)) from e
         except Exception as e:
-            error_msg = f"调用Deepseek API时出错: {str(e)}"
-            print(error_msg)
-            return error_msg
+            self._rollback(mark)
+            self._record_metrics(started, enqueued_at, stream=stream, error=str(e))
+            raise DSBotError(f"调用Deepseek API时出错: {str(e)}") from e
+
+        self._record_metrics(started, enqueued_at, usage=usage_holder[-1] if usage_holder else None,
+                             stream=stream)
+        if cache_key is not None:
+            self.cache.put(cache_key, assistant_message)
+        return assistant_message
+
+    def _batch_messages(self, item):
+        """批量请求的输入可以是单条提示词，也可以是完整的消息列表"""
+        if isinstance(item, str):
+            messages = [{"role": "user", "content": item}]
+        else:
+            messages = list(item)
+        if self.system_prompt and (not messages or messages[0]["role"] != "system"):
+            messages.insert(0, {"role": "system", "content": self.system_prompt})
+        return messages
+
+    async def _acomplete_item(self, client, index, item, use_cache):
+        started = time.perf_counter()
+        # 缓存会读写SQLite，放到线程池执行，不阻塞批量请求的事件循环
+        loop = asyncio.get_running_loop()
+        try:
+            messages = self._batch_messages(item)
+            cache_key = None
+            if self.cache is not None and use_cache:
+                cache_key = self._cache_key(messages)
+                cached = await loop.run_in_executor(None, self.cache.get, cache_key)
+                if cached is not None:
+                    self._record_metrics(started, cache_hit=True)
+                    return BatchResult(index, item, cached, None)
+
+            def attempt(timeout):
+                return client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens,
+                    timeout=timeout
+                )
+
+            response = await async_call_with_retry(attempt, self.retry_policy, self.breaker)
+            content = response.choices[0].message.content
+            self._record_metrics(started, usage=response.usage)
+            if cache_key is not None:
+                await loop.run_in_executor(None, self.cache.put, cache_key, content)
+            return BatchResult(index, item, content, None)
+        except Exception as e:
+            self._record_metrics(started, error=str(e))
+            return BatchResult(index, item, None, str(e))
+
+    async def aget_responses(self, items, concurrency=8, use_cache=True, stop=None):
+        """
+        并发获取多条互相独立的提示词/对话的响应，按完成顺序异步产出BatchResult
+
+        items可以是任意可迭代对象，按需读取，同时在途的请求不超过concurrency个。
+        不读写本机器人的对话历史。stop为threading.Event，设置后不再提交新的请求，
+        下一次有结果时取消其余在途请求并结束。
+        """
+        client = client_pool.create_async_client(self.api_key, self.base_url, max_connections=concurrency)
+        pending = set()
+        try:
+            iterator = enumerate(items)
+            exhausted = False
+            while stop is None or not stop.is_set():
+                while not exhausted and len(pending) < concurrency and not (stop and stop.is_set()):
+                    try:
+                        index, item = next(iterator)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending.add(asyncio.ensure_future(self._acomplete_item(client, index, item, use_cache)))
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            # 等取消真正生效后再关闭客户端
+            await asyncio.gather(*pending, return_exceptions=True)
+            await client.close()
+
+    def get_responses(self, items, concurrency=8, ordered=False, use_cache=True):
+        """
+        aget_responses的同步版本，在后台事件循环中执行，结果完成即产出
+
+        参数:
+            items: 提示词字符串或消息列表的可迭代对象
+            concurrency: 同时在途的请求数
+            ordered: 为True时按输入顺序产出（先完成的结果会等待前面的结果）
+            use_cache: 为False时跳过响应缓存
+        """
+        results = queue.Queue()
+        stop = threading.Event()
+        done = object()
+        runner = {}
+
+        async def pump():
+            runner["loop"], runner["task"] = asyncio.get_running_loop(), asyncio.current_task()
+            batch = self.aget_responses(items, concurrency, use_cache, stop)
+            try:
+                async for result in batch:
+                    results.put(result)
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                results.put(e)
+            finally:
+                # 显式关闭，立即取消在途请求并关闭客户端，而不是等到垃圾回收
+                await batch.aclose()
+                results.put(done)
+
+        thread = threading.Thread(target=asyncio.run, args=(pump(),), daemon=True)
+        thread.start()
+
+        buffered = {}
+        next_index = 0
+        try:
+            while True:
+                result = results.get()
+                if result is done:
+                    break
+                if isinstance(result, Exception):
+                    raise result
+                if not ordered:
+                    yield result
+                    continue
+                buffered[result.index] = result
+                while next_index in buffered:
+                    yield buffered.pop(next_index)
+                    next_index += 1
+        finally:
+            # 调用方停止迭代后不再提交新请求；唤醒后台循环，取消正在等待的请求
+            stop.set()
+            if "task" in runner:
+                try:
+                    runner["loop"].call_soon_threadsafe(runner["task"].cancel)
+                except RuntimeError:  # 事件循环已结束
+                    pass
 
     def handle_command(self, command):
         cmd = command.lower().strip()
@@ -75,6 +361,7 @@ class DS_Bot:
                     "/restart - 重新开始对话\n"
                     "/mode - 显示当前模式\n"
                     "/model - 显示当前使用的模型\n"
+                    "/stats - 显示请求耗时与token统计\n"
                     "/image - 生成图像描述（仅高级模式）")
         elif cmd == "/clear" or cmd == "/restart":
             self.clear_history()
@@ -83,6 +370,8 @@ class DS_Bot:
             return "当前使用的是高级模式，拥有完整的AI功能。"
         elif cmd == "/model":
             return f"当前使用的模型: {self.model}"
+        elif cmd == "/stats":
+            return metrics.registry.format_summary()
         elif cmd.startswith("/image"):
             try:
                 # 简单的图像描述生成
@@ -93,22 +382,88 @@ class DS_Bot:
         else:
             return f"未知命令: {command}。输入 /help 获取可用命令列表。"
 
-    def _handle_streaming(self, response_stream):
-        """处理流式响应"""
-        collected_content = ""
+    def stream_response(self, user_input, use_cache=True, enqueued_at=None):
+        """以生成器形式逐块返回Deepseek API的响应，结束后写入对话历史"""
+        if user_input.startswith("/"):
+            yield self.handle_command(user_input)
+            return
+
+        started = time.perf_counter()
+        mark = len(self.conversation_history)
+        self.add_message("user", user_input)
+        messages = self.build_messages()
+
+        cache_key = None
+        if self.cache is not None and use_cache:
+            cache_key = self._cache_key(messages)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self.add_message("assistant", cached)
+                self._record_metrics(started, enqueued_at, stream=True, cache_hit=True)
+                yield cached
+                return
+
+        collected_chunks = []
+        usage_holder = []
+        first_token_at = None
+        try:
+            response = self._create_completion(messages, stream=True)
+            for content_chunk in self._iter_chunks(response, usage_holder):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                collected_chunks.append(content_chunk)
+                yield content_chunk
+        except GeneratorExit:
+            # 调用方提前关闭了生成器（如客户端断开），回滚本轮，不留下没有回复的用户消息
+            self._rollback(mark)
+            self._record_metrics(started, enqueued_at, first_token_at, stream=True, error="cancelled")
+            if hasattr(response, "close"):
+                response.close()  # 释放HTTP连接，不再接收剩余内容
+            raise
+        except CircuitOpenError as e:
+            self._rollback(mark)
+            self._record_metrics(started, enqueued_at, stream=True, error=str(e))
+            if self.fallback is not None:
+                yield self._fallback_response(user_input)
+                return
+            raise DSBotError(str(e)) from e
+        except Exception as e:
+            self._rollback(mark)
+            self._record_metrics(started, enqueued_at, stream=True, error=str(e))
+            raise DSBotError(f"调用Deepseek API时出错: {str(e)}") from e
+
+        assistant_message = "".join(collected_chunks)
+        self.add_message("assistant", assistant_message)
+        self._record_metrics(started, enqueued_at, first_token_at,
+                             usage_holder[-1] if usage_holder else None, stream=True)
+        if cache_key is not None:
+            self.cache.put(cache_key, assistant_message)
+
+    def _iter_chunks(self, response_stream, usage_holder=None):
+        """从流式响应中提取文本块，最后一个块带有的usage放入usage_holder"""
         for chunk in response_stream:
-            if chunk.choices[0].delta.content:
-                content_chunk = chunk.choices[0].delta.content
-                collected_content += content_chunk
-                print(content_chunk, end="", flush=True)
+            if usage_holder is not None and getattr(chunk, "usage", None):
+                usage_holder.append(chunk.usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def _handle_streaming(self, response_stream, usage_holder=None):
+        """处理流式响应"""
+        collected_chunks = []
+        for content_chunk in self._iter_chunks(response_stream, usage_holder):
+            collected_chunks.append(content_chunk)
+            print(content_chunk, end="", flush=True)
 
         print()  # 最后的换行
+        collected_content = "".join(collected_chunks)
         self.add_message("assistant", collected_content)
         return collected_content
 
     def clear_history(self):
         """清除对话历史"""
         self.conversation_history = []
+        if self.system_prompt:
+            self.add_message("system", self.system_prompt)
 
     def run_interactive(self):
         """运行交互式控制台会话"""
@@ -121,7 +476,10 @@ class DS_Bot:
                 break
 
             print("\n机器人: ", end="", flush=True)
-            self.get_response(user_input, stream=True)
+            try:
+                self.get_response(user_input, stream=True)
+            except DSBotError as e:
+                print(f"\n{e}")
 
 
 # 使用示例
@@ -1,16 +1,24 @@
 import sys
 import os
 import json
-import torch
+import html
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                            QPushButton, QLineEdit, QTextEdit, QLabel, QComboBox,
                            QTabWidget, QSplitter, QDialog, QFileDialog, QMessageBox,
-                           QFormLayout, QGroupBox, QCheckBox, QStackedWidget, QInputDialog)
-from PyQt5.QtCore import Qt, pyqtSlot,QTimer
-from PyQt5.QtGui import QFont, QIcon
+                           QFormLayout, QGroupBox, QCheckBox, QStackedWidget, QInputDialog,
+                           QListWidget, QListWidgetItem)
+from PyQt5.QtCore import Qt, pyqtSignal, pyqtSlot, QTimer
+from PyQt5.QtGui import QFont, QIcon, QTextCursor, QTextCharFormat
 from DS_bot import DS_Bot
 from simple_bot import SimpleBot
+from router import TieredRouter
 from database import UserDatabase
+from remote_client import RemoteClient
+from conversation_store import SNIPPET_END, SNIPPET_START, ConversationStore
+from usage_ledger import get_ledger
+import capabilities
+from workers import BotWorker, FunctionWorker, StreamWorker, submit
+import metrics
 
 
 class MessageInput(QTextEdit):
@@ -40,6 +48,7 @@ class LoginDialog(QDialog):
         super().__init__(parent)
         self.db = db
         self.user_data = None
+        self.worker = None
         self.setWindowTitle("登录")
         self.resize(350, 200)
         self.setup_ui()
@@ -86,13 +95,33 @@ class LoginDialog(QDialog):
             QMessageBox.warning(self, "错误", "请输入用户名和密码")
             return
 
-        user_data = self.db.authenticate(username, password)
+        # 密码校验使用慢速哈希，放到后台线程执行，避免界面卡住
+        self.set_busy(True)
+        self.worker = FunctionWorker(self.db.authenticate, username, password)
+        self.worker.signals.finished.connect(self.on_authenticated)
+        self.worker.signals.error.connect(self.on_login_error)
+        submit(self.worker)
+
+    @pyqtSlot(object)
+    def on_authenticated(self, user_data):
+        self.worker = None
+        self.set_busy(False)
         if user_data:
             self.user_data = user_data
             self.accept()
         else:
             QMessageBox.warning(self, "登录失败", "用户名或密码不正确")
 
+    @pyqtSlot(str)
+    def on_login_error(self, error):
+        self.worker = None
+        self.set_busy(False)
+        QMessageBox.warning(self, "登录失败", f"登录时出错: {error}")
+
+    def set_busy(self, busy):
+        self.login_btn.setEnabled(not busy)
+        self.login_btn.setText("登录中..." if busy else "登录")
+
     def open_register(self):
         dialog = RegisterDialog(self.db, self)
         if dialog.exec_() == QDialog.Accepted:
@@ -109,6 +138,7 @@ class RegisterDialog(QDialog):
         super().__init__(parent)
         self.db = db
         self.username = ""
+        self.worker = None
         self.setWindowTitle("注册新账号")
         self.resize(400, 250)
         self.setup_ui()
@@ -177,19 +207,38 @@ class RegisterDialog(QDialog):
             QMessageBox.warning(self, "错误", "请输入有效的电子邮箱地址")
             return
 
-        # Register the user
-        success = self.db.register_user(username, password, email, api_key)
+        # 注册时要计算密码哈希，和登录一样放到后台线程执行
+        self.set_busy(True)
+        self.worker = FunctionWorker(self.db.register_user, username, password, email, api_key)
+        self.worker.signals.finished.connect(lambda success: self.on_registered(username, success))
+        self.worker.signals.error.connect(self.on_register_error)
+        submit(self.worker)
+
+    def on_registered(self, username, success):
+        self.worker = None
+        self.set_busy(False)
         if success:
             self.username = username
             self.accept()
         else:
             QMessageBox.warning(self, "注册失败", "用户名或电子邮箱已被使用")
 
+    @pyqtSlot(str)
+    def on_register_error(self, error):
+        self.worker = None
+        self.set_busy(False)
+        QMessageBox.warning(self, "注册失败", f"注册时出错: {error}")
+
+    def set_busy(self, busy):
+        self.register_btn.setEnabled(not busy)
+        self.register_btn.setText("注册中..." if busy else "注册")
+
 
 class ForgotPasswordDialog(QDialog):
     def __init__(self, db, parent=None):
         super().__init__(parent)
         self.db = db
+        self.worker = None
         self.setWindowTitle("找回密码")
         self.resize(350, 200)
         self.setup_ui()
@@ -229,9 +278,9 @@ class ForgotPasswordDialog(QDialog):
         self.confirm_password.setEchoMode(QLineEdit.Password)
         token_layout.addWidget(self.confirm_password)
 
-        reset_btn = QPushButton("重置密码")
-        reset_btn.clicked.connect(self.reset_password)
-        token_layout.addWidget(reset_btn)
+        self.reset_btn = QPushButton("重置密码")
+        self.reset_btn.clicked.connect(self.reset_password)
+        token_layout.addWidget(self.reset_btn)
 
         self.stack.addWidget(email_widget)
         self.stack.addWidget(token_widget)
@@ -265,32 +314,82 @@ class ForgotPasswordDialog(QDialog):
             QMessageBox.warning(self, "错误", "两次输入的密码不一致")
             return
 
-        success = self.db.reset_password(token, new_password)
+        # 新密码要计算慢速哈希，放到后台线程执行
+        self.set_busy(True)
+        self.worker = FunctionWorker(self.db.reset_password, token, new_password)
+        self.worker.signals.finished.connect(self.on_password_reset)
+        self.worker.signals.error.connect(self.on_reset_error)
+        submit(self.worker)
+
+    @pyqtSlot(object)
+    def on_password_reset(self, success):
+        self.worker = None
+        self.set_busy(False)
         if success:
             QMessageBox.information(self, "成功", "密码已成功重置")
             self.accept()
         else:
             QMessageBox.warning(self, "错误", "无效的重置令牌或令牌已过期")
 
+    @pyqtSlot(str)
+    def on_reset_error(self, error):
+        self.worker = None
+        self.set_busy(False)
+        QMessageBox.warning(self, "错误", f"重置密码时出错: {error}")
+
+    def set_busy(self, busy):
+        self.reset_btn.setEnabled(not busy)
+        self.reset_btn.setText("重置中..." if busy else "重置密码")
+
+
+# 流式回复按帧合并刷新，避免每个token触发一次QTextEdit重排
+STREAM_FLUSH_INTERVAL_MS = 16
+
+# 恢复对话时每页加载的消息数
+MESSAGE_PAGE_SIZE = 50
+
+# 对话搜索每页结果数，以及输入停顿多久后开始查询
+SEARCH_PAGE_SIZE = 20
+SEARCH_DEBOUNCE_MS = 250
+
 
 class ChatTab(QWidget):
-    def __init__(self, parent=None, api_key="", title="新对话", use_advanced=True):
-        """单个聊天标签页"""
+    def __init__(self, parent=None, api_key="", title="新对话", use_advanced=True,
+                 store=None, conversation_id=None, restored=False, remote=None, on_usage=None):
+        """
+        单个聊天标签页
+
+        store/conversation_id用于持久化对话；restored为True时，
+        消息在标签页第一次获得焦点时才从数据库加载。
+        remote为RemoteClient时，回复由聊天服务器生成；on_usage传给DS_Bot用于用量记账
+        """
         super().__init__(parent)
         self.title = title
         self.api_key = api_key
         self.bot = None
+        self.worker = None
+        self.pending_message = None
         self.use_advanced = use_advanced
+        self.remote = remote
+        self.on_usage = on_usage
+        self.store = store
+        self.conversation_id = conversation_id
+        self.loaded = not restored
+        self.oldest_message_id = None
+        # 后台读取历史消息的任务，以及读完后要跳转到的消息
+        self.history_worker = None
+        self.pending_anchor = None
+
+        # 流式回复状态
+        self.stream_started = False
+        self.stream_buffer = []
+        self.stream_timer = QTimer(self)
+        self.stream_timer.setSingleShot(True)
+        self.stream_timer.setInterval(STREAM_FLUSH_INTERVAL_MS)
+        self.stream_timer.timeout.connect(self.flush_stream)
 
         # 创建机器人实例
-        if use_advanced and api_key:
-            try:
-                self.bot = DS_Bot(api_key=self.api_key)
-            except Exception as e:
-                QMessageBox.warning(self, "错误", f"初始化高级机器人时出错: {str(e)}")
-                self.bot = SimpleBot()
-        else:
-            self.bot = SimpleBot()
+        self.create_bot()
 
         # 创建UI
         self.init_ui()
@@ -309,6 +408,12 @@ class ChatTab(QWidget):
             status_label.setStyleSheet("color: orange; font-weight: bold;")
         status_layout.addWidget(status_label)
         status_layout.addStretch()
+
+        # 分页加载更早的历史消息
+        self.load_earlier_button = QPushButton("加载更早的消息")
+        self.load_earlier_button.clicked.connect(self.load_earlier)
+        self.load_earlier_button.hide()
+        status_layout.addWidget(self.load_earlier_button)
         layout.addLayout(status_layout)
 
         # 聊天历史区域
@@ -328,10 +433,10 @@ class ChatTab(QWidget):
         input_layout.addWidget(self.message_input, 4)
 
         # 发送按钮
-        send_button = QPushButton("发送")
-        send_button.setMinimumHeight(40)
-        send_button.clicked.connect(self.send_message)
-        send_button.setStyleSheet("""
+        self.send_button = QPushButton("发送")
+        self.send_button.setMinimumHeight(40)
+        self.send_button.clicked.connect(self.send_message)
+        self.send_button.setStyleSheet("""
             QPushButton {
                 background-color: #4CAF50;
                 color: white;
@@ -342,7 +447,7 @@ class ChatTab(QWidget):
                 background-color: #45a049;
             }
         """)
-        input_layout.addWidget(send_button, 1)
+        input_layout.addWidget(self.send_button, 1)
 
         layout.addLayout(input_layout)
         self.setLayout(layout)
@@ -353,67 +458,377 @@ class ChatTab(QWidget):
                 "<b>系统提示:</b> 您正在使用简易模式。如需使用高级功能，请确保提供有效的API密钥并安装GPU支持。")
 
     def send_message(self):
-        """发送消息并获取回复"""
+        """发送消息，在后台线程中获取回复"""
         if not self.bot:
             QMessageBox.warning(self, "错误", "机器人未初始化")
             return
 
+        # 同一对话的请求需按顺序进行，上一条回复返回前不接受新消息；
+        # 恢复的历史还没读完时，机器人缺少上下文，也先不发送
+        if self.worker is not None or self.history_worker is not None:
+            return
+
         message = self.message_input.toPlainText().strip()
         if not message:
             return
 
         # 显示用户消息
-        self.chat_history.append(f"<div style='text-align: right;'><b>您:</b> {message}</div>")
+        self.chat_history.append(self.message_html("user", message))
         self.message_input.clear()
+        self.pending_message = message
 
-        # 获取并显示机器人回复
+        # 显示占位符，回复返回后替换
         self.chat_history.append("<b>机器人:</b> <i>思考中...</i>")
-        QApplication.processEvents()  # 更新UI
+        self.scroll_to_bottom()
+        self.set_busy(True)
 
-        try:
-            if isinstance(self.bot, DS_Bot):
-                response = self.bot.get_response(message)
-            else:
-                response = self.bot.get_response(message)
+        # 支持流式输出的机器人逐块显示回复
+        if hasattr(self.bot, "stream_response"):
+            self.worker = StreamWorker(self.bot, message)
+            self.worker.signals.chunk.connect(self.on_chunk)
+        else:
+            self.worker = BotWorker(self.bot, message)
+        self.worker.signals.finished.connect(self.on_response)
+        self.worker.signals.error.connect(self.on_error)
+        submit(self.worker)
+
+    @pyqtSlot(str)
+    def on_chunk(self, chunk):
+        """收到流式文本块，缓存后按帧刷新"""
+        if not self.stream_started:
+            self.stream_started = True
+            self.remove_placeholder()
+            self.chat_history.append("<b>机器人:</b> ")
+        self.stream_buffer.append(chunk)
+        if not self.stream_timer.isActive():
+            self.stream_timer.start()
+
+    def flush_stream(self):
+        """将缓存的文本块一次性写入聊天记录"""
+        if not self.stream_buffer:
+            return
+        text = "".join(self.stream_buffer)
+        self.stream_buffer = []
+
+        scrollbar = self.chat_history.verticalScrollBar()
+        at_bottom = scrollbar.value() >= scrollbar.maximum() - 4
+
+        cursor = QTextCursor(self.chat_history.document())
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(text, QTextCharFormat())
+
+        # 用户向上翻阅时不强制滚动
+        if at_bottom:
+            self.scroll_to_bottom()
+
+    @pyqtSlot(object)
+    def on_response(self, response):
+        """后台线程返回回复"""
+        if self.stream_started:
+            self.stream_timer.stop()
+            self.flush_stream()
+        else:
+            self.remove_placeholder()
+            self.chat_history.append(self.message_html("assistant", response))
+        self.save_turn(self.pending_message, response)
+        self.finish_request()
+
+    @pyqtSlot(str)
+    def on_error(self, error):
+        """后台线程抛出异常"""
+        if self.stream_started:
+            self.stream_timer.stop()
+            self.flush_stream()
+        else:
+            self.remove_placeholder()
+        self.chat_history.append(f"<b>错误:</b> {error}")
+        self.finish_request()
+
+    def remove_placeholder(self):
+        """删除"思考中"占位行"""
+        cursor = self.chat_history.textCursor()
+        cursor.movePosition(cursor.End)
+        cursor.select(cursor.LineUnderCursor)
+        cursor.removeSelectedText()
+        cursor.deletePreviousChar()  # 删除额外的换行符
+
+    def finish_request(self):
+        self.worker = None
+        self.pending_message = None
+        self.stream_started = False
+        self.set_busy(False)
+        self.scroll_to_bottom()
+
+    def set_busy(self, busy):
+        self.send_button.setEnabled(not busy)
+
+    def scroll_to_bottom(self):
+        self.chat_history.verticalScrollBar().setValue(
+            self.chat_history.verticalScrollBar().maximum())
 
-            # 更新最后一行，删除"思考中"并添加回复
-            cursor = self.chat_history.textCursor()
-            cursor.movePosition(cursor.End)
-            cursor.select(cursor.LineUnderCursor)
-            cursor.removeSelectedText()
-            cursor.deletePreviousChar()  # 删除额外的换行符
-            self.chat_history.append(f"<b>机器人:</b> {response}")
+    def message_html(self, role, content, message_id=None):
+        """聊天记录中一条消息的HTML；已保存的消息带锚点，搜索结果可以跳转到这里"""
+        content = content.replace("\n", "<br>")
+        label = "<b>您:</b>" if role == "user" else "<b>机器人:</b>"
+        if message_id is not None:
+            label = f"<a name='msg-{message_id}'>{label}</a>"
+        if role == "user":
+            return f"<div style='text-align: right;'>{label} {content}</div>"
+        return f"{label} {content}"
+
+    def save_turn(self, message, response):
+        """持久化一轮成功的对话（命令不保存），写入在后台批量完成"""
+        if self.store is None or self.conversation_id is None:
+            return
+        if not message or message.startswith("/"):
+            return
+        self.store.append_message(self.conversation_id, "user", message)
+        self.store.append_message(self.conversation_id, "assistant", response)
 
-        except Exception as e:
-            self.chat_history.append(f"<b>错误:</b> {str(e)}")
+    def ensure_loaded(self):
+        """第一次获得焦点时在后台加载最近一页消息"""
+        if self.loaded:
+            return
+        self.loaded = True
+        # 多取一条，用来判断是否还有更早的消息
+        self.load_history(self.on_recent_loaded, self.store.load_messages, self.conversation_id,
+                          limit=MESSAGE_PAGE_SIZE + 1)
+
+    def load_history(self, on_loaded, fn, *args, **kwargs):
+        """在线程池中读取历史消息（读取前要等待未写完的消息落盘），完成后在GUI线程调用on_loaded"""
+        self.load_earlier_button.setEnabled(False)
+        self.history_worker = FunctionWorker(fn, *args, **kwargs)
+        self.history_worker.signals.finished.connect(on_loaded)
+        self.history_worker.signals.error.connect(self.on_history_error)
+        submit(self.history_worker)
+
+    def history_loaded(self, has_more):
+        self.history_worker = None
+        self.load_earlier_button.setEnabled(True)
+        self.load_earlier_button.setVisible(has_more)
+        if self.pending_anchor is not None:
+            message_id, self.pending_anchor = self.pending_anchor, None
+            self.show_message(message_id)
+
+    @pyqtSlot(str)
+    def on_history_error(self, error):
+        self.history_worker = None
+        self.pending_anchor = None
+        self.load_earlier_button.setEnabled(True)
+        self.chat_history.append(f"<b>系统提示:</b> 加载历史消息失败: {error}")
+
+    @pyqtSlot(object)
+    def on_recent_loaded(self, messages):
+        has_more = len(messages) > MESSAGE_PAGE_SIZE
+        messages = messages[-MESSAGE_PAGE_SIZE:]
+        for message in messages:
+            self.chat_history.append(self.message_html(message["role"], message["content"], message["id"]))
+            # 最近的消息作为机器人的上下文
+            if hasattr(self.bot, "add_message"):
+                self.bot.add_message(message["role"], message["content"])
+        if messages:
+            self.oldest_message_id = messages[0]["id"]
+            self.scroll_to_bottom()
+        self.history_loaded(has_more)
+
+    def load_earlier(self):
+        """在后台加载更早的一页消息，插入到聊天记录顶部"""
+        if self.history_worker is not None:
+            return
+        self.load_history(self.on_earlier_loaded, self.store.load_messages, self.conversation_id,
+                          before_id=self.oldest_message_id, limit=MESSAGE_PAGE_SIZE + 1)
 
-        # 滚动到底部
-        self.chat_history.verticalScrollBar().setValue(
-            self.chat_history.verticalScrollBar().maximum())
+    @pyqtSlot(object)
+    def on_earlier_loaded(self, messages):
+        self.prepend_messages(messages[-MESSAGE_PAGE_SIZE:])
+        self.history_loaded(len(messages) > MESSAGE_PAGE_SIZE)
 
-    def update_api_key(self, api_key, use_advanced=True):
-        """更新API密钥和模式"""
-        self.api_key = api_key
-        self.use_advanced = use_advanced
+    def prepend_messages(self, messages):
+        if not messages:
+            return
+        cursor = QTextCursor(self.chat_history.document())
+        cursor.movePosition(QTextCursor.Start)
+        for message in messages:
+            cursor.insertHtml(self.message_html(message["role"], message["content"], message["id"]))
+            cursor.insertBlock()
+        self.oldest_message_id = messages[0]["id"]
+
+    def show_message(self, message_id):
+        """滚动到指定的已保存消息，必要时先在后台加载它之后的所有更早消息"""
+        self.ensure_loaded()
+        if self.history_worker is not None:
+            # 等正在进行的加载完成后再跳转
+            self.pending_anchor = message_id
+            return
+        if self.oldest_message_id is not None and message_id < self.oldest_message_id:
+            self.load_history(lambda result: self.on_range_loaded(message_id, result),
+                              self.load_through, self.conversation_id, message_id, self.oldest_message_id)
+            return
+        self.scroll_to_message(message_id)
+
+    def load_through(self, conversation_id, message_id, before_id):
+        """（工作线程）从message_id到before_id之前的消息，以及更早是否还有消息"""
+        messages = self.store.load_messages_range(conversation_id, message_id, before_id=before_id)
+        older = self.store.load_messages(conversation_id, before_id=message_id, limit=1)
+        return messages, bool(older)
+
+    def on_range_loaded(self, message_id, result):
+        messages, has_more = result
+        self.prepend_messages(messages)
+        self.history_loaded(has_more)
+        self.scroll_to_message(message_id)
+
+    def scroll_to_message(self, message_id):
+        # 等新插入的内容完成布局后再滚动
+        QTimer.singleShot(0, lambda: self.chat_history.scrollToAnchor(f"msg-{message_id}"))
+
+    def create_bot(self):
+        """按当前模式创建机器人；连接服务器时由服务器选择模式"""
+        if self.remote is not None:
+            if self.bot is not None:
+                self.bot.close()
+            self.bot = self.remote.create_bot()
+            return
 
         try:
-            if use_advanced and api_key:
-                self.bot = DS_Bot(api_key=self.api_key)
+            if self.use_advanced and self.api_key:
+                self.bot = TieredRouter(SimpleBot(), DS_Bot(api_key=self.api_key, fallback=SimpleBot(),
+                                                            on_usage=self.on_usage))
             else:
                 self.bot = SimpleBot()
         except Exception as e:
-            QMessageBox.warning(self, "错误", f"更新机器人时出错: {str(e)}")
+            QMessageBox.warning(self, "错误", f"初始化高级机器人时出错: {str(e)}")
             self.bot = SimpleBot()
 
+    def update_api_key(self, api_key, use_advanced=True):
+        """更新API密钥和模式"""
+        self.api_key = api_key
+        self.use_advanced = use_advanced
+        self.create_bot()
+
+
+class SearchPanel(QWidget):
+    """
+    在已保存的对话中全文搜索
+
+    查询在后台线程执行，输入停止片刻后才发起；结果分页加载，
+    双击结果打开对应的对话并跳转到该消息
+    """
+    result_activated = pyqtSignal(str, int, str)  # conversation_id, message_id, title
+
+    def __init__(self, store, user_id, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.user_id = user_id
+        self.query = ""
+        self.offset = 0
+        self.generation = 0
+        # 进行中的查询，保留引用直到结束
+        self.workers = set()
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("搜索对话...")
+        self.search_input.textChanged.connect(self.schedule_search)
+        layout.addWidget(self.search_input)
+
+        self.results = QListWidget()
+        self.results.setWordWrap(True)
+        self.results.itemActivated.connect(self.open_result)
+        layout.addWidget(self.results)
+
+        self.more_button = QPushButton("更多结果")
+        self.more_button.clicked.connect(self.load_more)
+        self.more_button.setVisible(False)
+        layout.addWidget(self.more_button)
+
+        # 输入停顿后再查询，避免每个按键都查一次
+        self.debounce_timer = QTimer(self)
+        self.debounce_timer.setSingleShot(True)
+        self.debounce_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.debounce_timer.timeout.connect(self.start_search)
+
+    def schedule_search(self):
+        self.debounce_timer.start()
+
+    def start_search(self):
+        self.query = self.search_input.text().strip()
+        self.offset = 0
+        self.results.clear()
+        self.more_button.setVisible(False)
+        if self.query:
+            self.run_query()
+
+    def load_more(self):
+        self.more_button.setEnabled(False)
+        self.run_query()
+
+    def run_query(self):
+        # 旧查询的结果可能晚于新查询返回，用generation丢弃过期结果
+        self.generation += 1
+        generation = self.generation
+        worker = FunctionWorker(self.store.search_messages, self.user_id, self.query,
+                                SEARCH_PAGE_SIZE, self.offset)
+        worker.signals.finished.connect(lambda results: self.show_results(worker, generation, results))
+        worker.signals.error.connect(lambda error: self.show_error(worker, generation, error))
+        self.workers.add(worker)
+        submit(worker)
+
+    def show_results(self, worker, generation, results):
+        self.workers.discard(worker)
+        if generation != self.generation:
+            return
+        for result in results:
+            snippet = html.escape(result["snippet"].replace("\n", " "))
+            snippet = snippet.replace(SNIPPET_START, "<b>").replace(SNIPPET_END, "</b>")
+            role = "您" if result["role"] == "user" else "机器人"
+            label = QLabel(f"<i>{html.escape(result['title'])}</i> · {role}<br>{snippet}")
+            label.setWordWrap(True)
+            item = QListWidgetItem()
+            item.setData(Qt.UserRole, (result["conversation_id"], result["id"], result["title"]))
+            item.setSizeHint(label.sizeHint())
+            self.results.addItem(item)
+            self.results.setItemWidget(item, label)
+        if not results and not self.offset:
+            self.results.addItem("没有找到匹配的消息")
+        self.offset += len(results)
+        self.more_button.setEnabled(True)
+        self.more_button.setVisible(len(results) == SEARCH_PAGE_SIZE)
+
+    def show_error(self, worker, generation, error):
+        self.workers.discard(worker)
+        if generation == self.generation:
+            self.more_button.setEnabled(True)
+            self.results.addItem(f"搜索出错: {error}")
+
+    def open_result(self, item):
+        data = item.data(Qt.UserRole)
+        if data:
+            self.result_activated.emit(*data)
+
 
 class ChatBotUI(QMainWindow):
     def __init__(self):
         """主应用窗口"""
         super().__init__()
-        self.db = UserDatabase()
+        # 设置CHATBOT_SERVER_URL后作为瘦客户端连接聊天服务器，登录和回复都在服务器完成
+        server_url = os.environ.get("CHATBOT_SERVER_URL")
+        self.remote = RemoteClient(server_url) if server_url else None
+        self.db = self.remote or UserDatabase()
+
+        # 设置CHATBOT_METRICS_FILE后，每次请求的指标追加写入该文件
+        metrics_file = os.environ.get("CHATBOT_METRICS_FILE")
+        if metrics_file:
+            metrics.registry.enable_export(metrics_file)
         self.api_key = ""
         self.username = ""
         self.use_advanced = False
+        # torch导入很慢，启动时只读缓存的GPU探测结果；缓存缺失、过期或环境变化时为None，
+        # 窗口显示后在后台探测
+        gpu = capabilities.cached("gpu")
+        self.gpu_available = gpu["available"] if gpu else None
         self.check_login()
 
     def change_bot_type(self, index):
@@ -454,8 +869,13 @@ class ChatBotUI(QMainWindow):
 
         if result == QDialog.Accepted:
             self.user_data = dialog.user_data
+            self.user_id = dialog.user_data["id"]
             self.username = dialog.user_data["username"]
             self.api_key = dialog.user_data["api_key"]
+            # 对话记录始终保存在本地
+            self.store = ConversationStore(getattr(self.db, "db_path", "user_database.db"))
+            # 连接服务器时由服务器记账，本地只记录自己发出的Deepseek请求
+            self.on_usage = None if self.remote else get_ledger(self.db.db_path).recorder(self.user_id)
 
             # 检查GPU和API密钥
             self.check_requirements()
@@ -466,7 +886,8 @@ class ChatBotUI(QMainWindow):
 
     def check_requirements(self):
         """检查高级模式所需的条件"""
-        gpu_available = torch.cuda.is_available()
+        # 连接服务器时模型在服务器端运行，不需要本机GPU；探测结果未知时先按可用处理
+        gpu_available = self.remote is not None or self.gpu_available is not False
         api_valid = bool(self.api_key)
 
         self.use_advanced = gpu_available and api_valid
@@ -548,7 +969,13 @@ class ChatBotUI(QMainWindow):
         api_btn.clicked.connect(self.show_api_settings)
         left_layout.addWidget(api_btn)
 
-        left_layout.addStretch()
+        # Conversation search
+        search_label = QLabel("搜索对话")
+        search_label.setStyleSheet("font-weight: bold; font-size: 14px;")
+        left_layout.addWidget(search_label)
+        self.search_panel = SearchPanel(self.store, self.user_id)
+        self.search_panel.result_activated.connect(self.open_search_result)
+        left_layout.addWidget(self.search_panel, 1)
 
         # Right content area
         right_widget = QWidget()
@@ -610,14 +1037,63 @@ class ChatBotUI(QMainWindow):
         splitter.addWidget(right_widget)
         splitter.setSizes([200, 700])  # Set initial sizes
 
-        # Create initial chat
+        # Status bar readout of request metrics
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.timeout.connect(self.update_metrics_status)
+        self.metrics_timer.start(1000)
+        self.update_metrics_status()
+
+        # Restore saved chats, or create the initial one
         self.current_bot_type = "simple" if not self.use_advanced else "advanced"
-        self.create_new_chat()
+        self.restore_conversations()
+        self.tab_widget.currentChanged.connect(self.on_tab_changed)
 
         # Prompt for API setup if needed
         if hasattr(self, 'needs_api_setup') and self.needs_api_setup:
             QTimer.singleShot(100, self.prompt_api_settings)
 
+        # 缓存有效时不再探测；否则等事件循环开始（窗口显示）后再探测GPU
+        if self.remote is None and self.gpu_available is None:
+            QTimer.singleShot(0, self.start_gpu_probe)
+
+    def start_gpu_probe(self):
+        """在后台线程探测GPU并刷新缓存"""
+        self.probe_worker = FunctionWorker(capabilities.probe, "gpu")
+        self.probe_worker.signals.finished.connect(self.on_gpu_probed)
+        self.probe_worker.signals.error.connect(self.on_gpu_probe_error)
+        submit(self.probe_worker)
+
+    @pyqtSlot(object)
+    def on_gpu_probed(self, result):
+        self.probe_worker = None
+        available = bool(result["available"])
+        # 未知时按可用处理，所以只有结果为不可用时高级模式才会变化；没有API密钥时本来就是简易模式
+        changed = available != (self.gpu_available is not False) and bool(self.api_key)
+        self.gpu_available = available
+        if changed:
+            # 重新检查会弹出提示并重建机器人，只在高级模式确实变化时执行
+            self.refresh_requirements()
+
+    @pyqtSlot(str)
+    def on_gpu_probe_error(self, error):
+        self.probe_worker = None
+        # 临时消息会被每秒刷新的指标读数覆盖，改用常驻的状态栏控件
+        label = QLabel(f"GPU检测失败: {error}")
+        label.setToolTip(error)
+        label.setStyleSheet("color: #c62828;")
+        self.statusBar().addPermanentWidget(label)
+
+    def refresh_requirements(self):
+        """重新检查需求并更新所有标签页"""
+        self.check_requirements()
+        for i in range(self.tab_widget.count()):
+            tab = self.tab_widget.widget(i)
+            tab.update_api_key(self.api_key, self.use_advanced)
+
+    def update_metrics_status(self):
+        """在状态栏显示请求耗时与token统计"""
+        self.statusBar().showMessage(metrics.registry.status_line())
+
     def prompt_api_settings(self):
         """提示用户设置API密钥"""
         response = QMessageBox.question(
@@ -633,18 +1109,82 @@ class ChatBotUI(QMainWindow):
     def create_new_chat(self):
         """创建新的对话标签页"""
         count = self.tab_widget.count()
+        title = f"对话 {count + 1}"
+        conversation_id = self.store.create_conversation(
+            self.user_id, title, "advanced" if self.use_advanced else "simple")
         chat_tab = ChatTab(
             api_key=self.api_key,
-            title=f"对话 {count + 1}",
-            use_advanced=self.use_advanced
+            title=title,
+            use_advanced=self.use_advanced,
+            store=self.store,
+            conversation_id=conversation_id,
+            remote=self.remote,
+            on_usage=self.on_usage
         )
-        self.tab_widget.addTab(chat_tab, f"对话 {count + 1}")
+        self.tab_widget.addTab(chat_tab, title)
         self.tab_widget.setCurrentIndex(count)
 
+    def restore_conversations(self):
+        """按元数据恢复已保存的对话标签页，消息在标签页获得焦点时再加载"""
+        conversations = self.store.list_conversations(self.user_id)
+        if not conversations:
+            self.create_new_chat()
+            return
+
+        for conversation in conversations:
+            chat_tab = ChatTab(
+                api_key=self.api_key,
+                title=conversation["title"],
+                use_advanced=self.use_advanced,
+                store=self.store,
+                conversation_id=conversation["id"],
+                restored=True,
+                remote=self.remote,
+                on_usage=self.on_usage
+            )
+            self.tab_widget.addTab(chat_tab, conversation["title"])
+        self.tab_widget.setCurrentIndex(self.tab_widget.count() - 1)
+        self.on_tab_changed(self.tab_widget.currentIndex())
+
+    def open_search_result(self, conversation_id, message_id, title):
+        """打开搜索结果所在的对话（已关闭的对话会恢复）并跳转到该消息"""
+        for i in range(self.tab_widget.count()):
+            tab = self.tab_widget.widget(i)
+            if tab.conversation_id == conversation_id:
+                self.tab_widget.setCurrentIndex(i)
+                break
+        else:
+            self.store.restore_conversation(conversation_id)
+            tab = ChatTab(
+                api_key=self.api_key,
+                title=title,
+                use_advanced=self.use_advanced,
+                store=self.store,
+                conversation_id=conversation_id,
+                restored=True,
+                remote=self.remote,
+                on_usage=self.on_usage
+            )
+            self.tab_widget.addTab(tab, title)
+            self.tab_widget.setCurrentWidget(tab)
+        tab.show_message(message_id)
+
+    def on_tab_changed(self, index):
+        """切换到的标签页按需加载消息"""
+        tab = self.tab_widget.widget(index)
+        if tab is not None:
+            tab.ensure_loaded()
+
     def close_tab(self, index):
         """关闭对话标签页"""
         if self.tab_widget.count() > 1:
+            tab = self.tab_widget.widget(index)
+            if tab.conversation_id is not None:
+                self.store.archive_conversation(tab.conversation_id)
+            if tab.remote is not None:
+                tab.bot.close()
             self.tab_widget.removeTab(index)
+            tab.deleteLater()
         else:
             # 至少保留一个对话
             QMessageBox.information(self, "提示", "至少需要保留一个对话")
@@ -664,16 +1204,17 @@ class ChatBotUI(QMainWindow):
             # 更新数据库中的API密钥
             self.db.update_api_key(self.username, self.api_key)
 
-            # 重新检查需求
-            self.check_requirements()
-
-            # 更新所有标签页
-            for i in range(self.tab_widget.count()):
-                tab = self.tab_widget.widget(i)
-                tab.update_api_key(self.api_key, self.use_advanced)
+            # 重新检查需求（沿用已有的GPU探测结果，不重新探测）
+            self.refresh_requirements()
 
             QMessageBox.information(self, "成功", "API设置已更新")
 
+    def closeEvent(self, event):
+        """关闭窗口前写完未保存的对话"""
+        if hasattr(self, "store"):
+            self.store.close()
+        super().closeEvent(event)
+
     def logout(self):
         """注销当前用户"""
         reply = QMessageBox.question(
@@ -684,6 +1225,11 @@ class ChatBotUI(QMainWindow):
         )
 
         if reply == QMessageBox.Yes:
+            # os.execl不会执行退出处理，先写完未保存的对话和用量记录
+            self.store.close()
+            if not self.remote:
+                get_ledger(self.db.db_path).close()
+
             # 重启应用程序逻辑
             QApplication.quit()
             program = sys.executable
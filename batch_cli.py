@@ -0,0 +1,196 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from DS_bot import BatchResult, DS_Bot
+from simple_bot import SimpleBot
+
+
+class Checkpoint:
+    """
+    记录已完成的输入行号，用于中断后继续处理
+
+    保存为低水位线（该行号之前全部完成）加上水位线之后零散完成的行号；
+    乱序完成的行数不超过并发数，所以文件大小与输入行数无关。
+    先刷新输出再原子替换检查点文件，中断时最多重复输出检查点之后的几行。
+
+    参数:
+        path: 检查点文件路径，None表示不记录
+        interval: 两次写入之间的最短秒数
+    """
+
+    def __init__(self, path, interval=1.0):
+        self.path = path
+        self.interval = interval
+        self.watermark = 0
+        self.done = set()
+        self._last_save = time.monotonic()
+
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+            self.watermark = state["watermark"]
+            self.done = set(state["done"])
+
+    def is_done(self, line_no):
+        return line_no < self.watermark or line_no in self.done
+
+    def mark(self, line_no):
+        self.done.add(line_no)
+        while self.watermark in self.done:
+            self.done.remove(self.watermark)
+            self.watermark += 1
+
+    def save(self, output, force=False):
+        if not self.path:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_save < self.interval:
+            return
+        self._last_save = now
+        output.flush()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"watermark": self.watermark, "done": sorted(self.done)}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+def parse_line(line):
+    """
+    解析一行输入，返回(记录id, 提示词或消息列表)
+
+    每行可以是JSON字符串，或包含prompt或messages字段的对象（可选id字段）
+    """
+    record = json.loads(line)
+    if isinstance(record, str):
+        return None, record
+    if not isinstance(record, dict):
+        raise ValueError("每行必须是字符串或对象")
+    if "messages" in record:
+        messages = record["messages"]
+        if not isinstance(messages, list) or not messages:
+            raise ValueError("messages必须是非空列表")
+        return record.get("id"), messages
+    if "prompt" in record:
+        return record.get("id"), str(record["prompt"])
+    raise ValueError("缺少prompt或messages字段")
+
+
+def last_user_message(item):
+    if isinstance(item, str):
+        return item
+    for message in reversed(item):
+        if message.get("role") == "user":
+            return message.get("content", "")
+    return ""
+
+
+async def simple_results(bot, items):
+    """SimpleBot是纯CPU计算，逐条处理即可，接口与DS_Bot.aget_responses一致"""
+    for index, item in enumerate(items):
+        try:
+            yield BatchResult(index, item, bot.get_response(last_user_message(item)), None)
+        except Exception as e:
+            yield BatchResult(index, item, None, str(e))
+        await asyncio.sleep(0)
+
+
+async def process(lines, backend, output, checkpoint, concurrency=8, use_cache=True):
+    """
+    流式处理输入行，结果完成即写出一行JSON
+
+    输入按需读取，同时在途的请求不超过concurrency个，内存占用与输入大小无关。
+    返回(成功数, 失败数)。
+    """
+    counts = {"ok": 0, "failed": 0}
+    # aget_responses的序号 -> (行号, 记录id)，只保存在途的请求
+    in_flight = {}
+
+    def emit(line_no, record_id, response, error):
+        result = {"line": line_no, "response": response, "error": error}
+        if record_id is not None:
+            result["id"] = record_id
+        output.write(json.dumps(result, ensure_ascii=False) + "\n")
+        counts["failed" if error else "ok"] += 1
+        checkpoint.mark(line_no)
+        checkpoint.save(output)
+
+    def items():
+        index = 0
+        for line_no, line in enumerate(lines):
+            if checkpoint.is_done(line_no):
+                continue
+            if not line.strip():
+                # 空行也要记为完成，否则水位线停在这里，done集合随输入增长
+                checkpoint.mark(line_no)
+                continue
+            try:
+                record_id, item = parse_line(line)
+            except ValueError as e:
+                # 无效的行直接输出错误，不发送请求
+                emit(line_no, None, None, f"无效的输入: {e}")
+                continue
+            in_flight[index] = (line_no, record_id)
+            index += 1
+            yield item
+
+    if isinstance(backend, DS_Bot):
+        results = backend.aget_responses(items(), concurrency=concurrency, use_cache=use_cache)
+    else:
+        results = simple_results(backend, items())
+
+    async for result in results:
+        line_no, record_id = in_flight.pop(result.index)
+        emit(line_no, record_id, result.response, result.error)
+
+    checkpoint.save(output, force=True)
+    return counts["ok"], counts["failed"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量处理JSONL格式的提示词，结果以JSONL输出到标准输出")
+    parser.add_argument("input", nargs="?", default="-", help="输入文件，默认从标准输入读取")
+    parser.add_argument("--backend", choices=("simple", "deepseek"), default="deepseek")
+    parser.add_argument("--concurrency", type=int, default=8, help="同时在途的请求数")
+    parser.add_argument("--checkpoint", help="检查点文件，存在时跳过已完成的行")
+    parser.add_argument("--model", default="deepseek-chat")
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--max-tokens", type=int, default=1000)
+    parser.add_argument("--system-prompt")
+    parser.add_argument("--no-cache", action="store_true", help="不使用响应缓存")
+    args = parser.parse_args()
+
+    if args.backend == "deepseek":
+        # DS_Bot在没有密钥时直接抛出ValueError，先检查以给出用法提示
+        if not os.environ.get("DEEPSEEK_API_KEY"):
+            parser.error("需要设置DEEPSEEK_API_KEY环境变量")
+        backend = DS_Bot(model=args.model, temperature=args.temperature, max_tokens=args.max_tokens,
+                         system_prompt=args.system_prompt)
+    else:
+        backend = SimpleBot(hot_reload=False)
+
+    checkpoint = Checkpoint(args.checkpoint)
+    lines = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    started = time.perf_counter()
+    try:
+        ok, failed = asyncio.run(process(lines, backend, sys.stdout, checkpoint,
+                                         args.concurrency, not args.no_cache))
+    except KeyboardInterrupt:
+        checkpoint.save(sys.stdout, force=True)
+        sys.exit(130)
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"完成 {ok} 条，失败 {failed} 条，用时 {elapsed:.1f}s", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from DS_bot import DS_Bot  # noqa: E402
+from mock_server import MockConfig, start_mock_server  # noqa: E402
+from resilience import RetryPolicy  # noqa: E402
+
+
+def percentile(values, p):
+    """最近秩法百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(mode, latencies, wall_time, tokens, ttfts=None, errors=0):
+    result = {
+        "mode": mode,
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_latency_ms": percentile(latencies, 50) * 1000,
+        "p99_latency_ms": percentile(latencies, 99) * 1000,
+        "requests_per_sec": len(latencies) / wall_time if wall_time else 0.0,
+        "tokens_per_sec": tokens / wall_time if wall_time else 0.0,
+    }
+    if ttfts is not None:
+        result["p50_ttft_ms"] = percentile(ttfts, 50) * 1000
+        result["p99_ttft_ms"] = percentile(ttfts, 99) * 1000
+    return result
+
+
+def make_bot(base_url, on_usage=None):
+    # 关闭缓存和重试，测量的是单次请求本身
+    return DS_Bot(api_key="benchmark", base_url=base_url, cache=False,
+                  retry_policy=RetryPolicy(max_attempts=1), on_usage=on_usage)
+
+
+def count_tokens(text):
+    return len(text.split())
+
+
+def bench_single(base_url, n):
+    bot = make_bot(base_url)
+    latencies = []
+    tokens = 0
+    start = time.perf_counter()
+    for i in range(n):
+        bot.clear_history()
+        t0 = time.perf_counter()
+        reply = bot.get_response(f"benchmark prompt {i}")
+        latencies.append(time.perf_counter() - t0)
+        tokens += count_tokens(reply)
+    return summarize("single", latencies, time.perf_counter() - start, tokens)
+
+
+def bench_streaming(base_url, n):
+    bot = make_bot(base_url)
+    latencies = []
+    ttfts = []
+    tokens = 0
+    start = time.perf_counter()
+    for i in range(n):
+        bot.clear_history()
+        t0 = time.perf_counter()
+        first = None
+        for chunk in bot.stream_response(f"benchmark prompt {i}"):
+            if first is None:
+                first = time.perf_counter() - t0
+            tokens += count_tokens(chunk)
+        latencies.append(time.perf_counter() - t0)
+        ttfts.append(first or 0.0)
+    return summarize("streaming", latencies, time.perf_counter() - start, tokens, ttfts)
+
+
+def bench_concurrent(base_url, n, concurrency):
+    """多个机器人在线程中同时请求（对应GUI中多个标签页同时等待回复）"""
+    def one(i):
+        bot = make_bot(base_url)
+        t0 = time.perf_counter()
+        reply = bot.get_response(f"benchmark prompt {i}")
+        return time.perf_counter() - t0, count_tokens(reply)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one, range(n)))
+    wall_time = time.perf_counter() - start
+    return summarize(f"concurrent(x{concurrency})", [r[0] for r in results], wall_time,
+                     sum(r[1] for r in results))
+
+
+def bench_batch(base_url, n, concurrency):
+    """
+    get_responses批量接口
+
+    延迟取每条请求自身的耗时（DS_Bot在发出请求到收到回复之间计时，经on_usage回调取得），
+    与其他模式可比；不是从批量开始到该条完成的时间
+    """
+    latencies = []
+    bot = make_bot(base_url, on_usage=lambda record: latencies.append(record["latency_ms"] / 1000))
+    tokens = 0
+    errors = 0
+    start = time.perf_counter()
+    for result in bot.get_responses((f"benchmark prompt {i}" for i in range(n)), concurrency=concurrency):
+        if result.error:
+            errors += 1
+        else:
+            tokens += count_tokens(result.response)
+    return summarize(f"batch(x{concurrency})", latencies, time.perf_counter() - start, tokens, errors=errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DS_Bot延迟/吞吐量基准测试")
+    parser.add_argument("--base-url", help="使用外部的兼容接口（默认在进程内启动模拟服务器）")
+    parser.add_argument("--requests", type=int, default=50, help="每种模式的请求数")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟服务器首字节延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="模拟服务器每秒token数")
+    parser.add_argument("--tokens", type=int, default=64, help="模拟服务器每个回复的token数")
+    parser.add_argument("--modes", default="single,streaming,concurrent,batch")
+    parser.add_argument("--json", help="将结果写入JSON文件")
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        server, base_url = start_mock_server(config=MockConfig(
+            latency=args.latency, token_rate=args.token_rate, response_tokens=args.tokens))
+
+    modes = args.modes.split(",")
+    results = []
+    try:
+        if "single" in modes:
+            results.append(bench_single(base_url, args.requests))
+        if "streaming" in modes:
+            results.append(bench_streaming(base_url, args.requests))
+        if "concurrent" in modes:
+            results.append(bench_concurrent(base_url, args.requests, args.concurrency))
+        if "batch" in modes:
+            results.append(bench_batch(base_url, args.requests, args.concurrency))
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    print(f"{'mode':<18}{'req':>6}{'err':>5}{'p50 ms':>10}{'p99 ms':>10}{'ttft p50':>10}{'req/s':>9}{'tok/s':>10}")
+    for r in results:
+        ttft = f"{r['p50_ttft_ms']:.1f}" if "p50_ttft_ms" in r else "-"
+        print(f"{r['mode']:<18}{r['requests']:>6}{r['errors']:>5}{r['p50_latency_ms']:>10.1f}"
+              f"{r['p99_latency_ms']:>10.1f}{ttft:>10}{r['requests_per_sec']:>9.1f}{r['tokens_per_sec']:>10.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"base_url": base_url, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
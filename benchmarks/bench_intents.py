@@ -0,0 +1,80 @@
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent_matcher import IntentMatcher  # noqa: E402
+
+
+def make_intents(count, vocabulary, rng):
+    """与默认意图包同样形式的关键词模式：\\b(?:w1|w2|w3)\\b"""
+    return [r"\b(?:%s)\b" % "|".join(rng.sample(vocabulary, 3)) for _ in range(count)]
+
+
+def loop_match(compiled, text):
+    """对照组：按优先级逐个re.search"""
+    for index, regex in enumerate(compiled):
+        if regex.search(text):
+            return index
+    return None
+
+
+def time_call(fn, text, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(text)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="意图匹配耗时基准测试（IntentMatcher对比逐个匹配）")
+    parser.add_argument("--sizes", default="100,500,2000", help="逗号分隔的意图数量")
+    parser.add_argument("--length", type=int, default=80, help="输入文本长度（字符）")
+    parser.add_argument("--repeats", type=int, default=200, help="每项测量次数，取中位数")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="将结果写入JSON文件")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = sorted({"".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 8)))
+                         for _ in range(20000)})
+
+    results = []
+    for size in (int(text) for text in args.sizes.split(",")):
+        patterns = make_intents(size, vocabulary, rng)
+        matcher = IntentMatcher(patterns)
+        compiled = [re.compile(pattern) for pattern in patterns]
+        # 不命中的输入要扫描全部意图，命中最后一个意图的输入同理，都是最坏情况
+        miss = " ".join(rng.choice(vocabulary) for _ in range(args.length))[:args.length]
+        last_word = patterns[-1][len(r"\b(?:"):].split("|")[0]
+        hit = (miss[:args.length - len(last_word) - 1] + " " + last_word)
+        for name, text in (("miss", miss), ("hit_last", hit)):
+            if matcher.match_index(text) != loop_match(compiled, text):
+                raise AssertionError(f"结果不一致: {name}")
+            results.append({
+                "intents": size,
+                "input": name,
+                "matcher_ms": time_call(matcher.match_index, text, args.repeats),
+                "loop_ms": time_call(lambda t: loop_match(compiled, t), text, args.repeats),
+            })
+
+    print(f"{'intents':>8}{'input':>10}{'matcher ms':>12}{'loop ms':>10}")
+    for r in results:
+        print(f"{r['intents']:>8}{r['input']:>10}{r['matcher_ms']:>12.3f}{r['loop_ms']:>10.3f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"length": args.length, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
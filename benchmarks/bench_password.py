@@ -0,0 +1,80 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import passwords  # noqa: E402
+
+
+def parse_cost(text):
+    """预设名（见passwords.COSTS），或 scrypt:N:r:p / pbkdf2:迭代次数"""
+    if text in passwords.COSTS:
+        return text, passwords.COSTS[text]
+    parts = text.split(":")
+    if parts[0] == "scrypt" and len(parts) == 4:
+        return text, {"algorithm": "scrypt", "n": int(parts[1]), "r": int(parts[2]), "p": int(parts[3])}
+    if parts[0] == "pbkdf2" and len(parts) == 2:
+        return text, {"algorithm": "pbkdf2_sha256", "iterations": int(parts[1])}
+    raise argparse.ArgumentTypeError(f"无法识别的强度设置: {text}")
+
+
+def bench_cost(name, params, seconds, threads):
+    stored = passwords.hash_password("correct horse battery staple", params)
+
+    def verify_for(duration):
+        count = 0
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            passwords.verify_password("correct horse battery staple", stored)
+            count += 1
+        return count
+
+    # 单线程：每核每秒可完成的登录数
+    start = time.perf_counter()
+    single = verify_for(seconds)
+    single_elapsed = time.perf_counter() - start
+
+    # 多线程：hashlib在计算时释放GIL，线程数接近核数时吞吐量应近似线性增长
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        total = sum(pool.map(verify_for, [seconds] * threads))
+    multi_elapsed = time.perf_counter() - start
+
+    return {
+        "cost": name,
+        "params": params,
+        "verify_ms": single_elapsed / single * 1000,
+        "logins_per_sec_per_core": single / single_elapsed,
+        "threads": threads,
+        "logins_per_sec": total / multi_elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="密码哈希强度与登录吞吐量基准测试")
+    parser.add_argument("--costs", default=",".join(passwords.COSTS),
+                        help="逗号分隔的强度设置：预设名、scrypt:N:r:p 或 pbkdf2:迭代次数")
+    parser.add_argument("--seconds", type=float, default=2.0, help="每种设置的测量时长")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1, help="多线程测量的线程数")
+    parser.add_argument("--json", help="将结果写入JSON文件")
+    args = parser.parse_args()
+
+    costs = [parse_cost(text) for text in args.costs.split(",")]
+    results = [bench_cost(name, params, args.seconds, args.threads) for name, params in costs]
+
+    print(f"{'cost':<22}{'verify ms':>11}{'/s/core':>10}{'threads':>9}{'/s total':>10}")
+    for r in results:
+        print(f"{r['cost']:<22}{r['verify_ms']:>11.1f}{r['logins_per_sec_per_core']:>10.1f}"
+              f"{r['threads']:>9}{r['logins_per_sec']:>10.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"cpu_count": os.cpu_count(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
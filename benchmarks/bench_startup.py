@@ -0,0 +1,252 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_MODULES = "PyQt5.QtWidgets,openai,torch,DS_bot,database,conversation_store,UI"
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "startup_baseline.json")
+
+# 超出基线的比例和绝对量同时满足才算回退，避免毫秒级抖动误报
+TOLERANCE = 0.20
+MIN_REGRESSION_MS = 50.0
+MIN_REGRESSION_KB = 10 * 1024
+
+
+def child_env(workdir):
+    """子进程环境：无界面Qt平台，数据库和能力缓存都放在临时目录"""
+    env = dict(os.environ)
+    env["QT_QPA_PLATFORM"] = "offscreen"
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    env["XDG_CACHE_HOME"] = os.path.join(workdir, "cache")
+    env["LOCALAPPDATA"] = os.path.join(workdir, "cache")
+    for name in ("CHATBOT_SERVER_URL", "CHATBOT_METRICS_FILE", "CHATBOT_REPROBE"):
+        env.pop(name, None)
+    return env
+
+
+def parse_importtime(stderr, module):
+    """
+    从 -X importtime 输出中取出模块的累计导入时间和自身耗时最多的模块
+
+    返回: (累计毫秒, [(模块, 自身毫秒), ...])
+    """
+    cumulative = None
+    selfs = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        self_us, cumulative_us, name = int(parts[0]), int(parts[1]), parts[2]
+        selfs.append((name.strip(), self_us / 1000))
+        # 顶层导入没有缩进，出现在它所有子模块之后
+        if name.strip() == module and name == " " + module:
+            cumulative = cumulative_us / 1000
+    selfs.sort(key=lambda item: item[1], reverse=True)
+    return cumulative, selfs
+
+
+def bench_import(module, workdir, repeats):
+    """在全新的解释器中导入模块，取多次的中位数"""
+    times = []
+    top = []
+    for _ in range(repeats):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                cwd=workdir, env=child_env(workdir), capture_output=True, text=True)
+        if result.returncode != 0:
+            return {"module": module, "ms": None, "error": result.stderr.strip().splitlines()[-1:]}
+        cumulative, top = parse_importtime(result.stderr, module)
+        times.append(cumulative)
+    return {"module": module, "ms": statistics.median(times), "slowest": top[:10]}
+
+
+def run_ui_once(workdir):
+    """启动一次界面子进程，返回各阶段相对于进程创建的毫秒数"""
+    spawned = time.time()
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child"],
+                            cwd=workdir, env=child_env(workdir), capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"界面子进程失败:\n{result.stderr}")
+    marks = json.loads(result.stdout.strip().splitlines()[-1])
+    return {
+        "interpreter_ms": (marks["started"] - spawned) * 1000,
+        "import_ui_ms": (marks["imported"] - marks["started"]) * 1000,
+        "login_dialog_ms": (marks["login_dialog"] - spawned) * 1000,
+        "first_tab_ms": (marks["first_tab"] - marks["login_accepted"]) * 1000,
+        "total_ms": (marks["first_tab"] - spawned) * 1000,
+        "peak_rss_kb": marks["peak_rss_kb"],
+        "modules_loaded": marks["modules_loaded"],
+        "torch_loaded": marks["torch_loaded"],
+    }
+
+
+def bench_ui(workdir, repeats, warmup):
+    # 预热一次：建库、迁移和GPU探测缓存都只在首次启动时发生
+    for _ in range(warmup):
+        run_ui_once(workdir)
+    runs = [run_ui_once(workdir) for _ in range(repeats)]
+    summary = {}
+    for key in runs[0]:
+        values = [run[key] for run in runs]
+        if key in ("modules_loaded", "torch_loaded") or values[0] is None:
+            summary[key] = values[-1]
+        else:
+            summary[key] = statistics.median(values)
+    summary["runs"] = repeats
+    return summary
+
+
+def child():
+    """子进程：走真实的启动流程，在登录框出现和首个标签页可用时打点"""
+    started = time.time()
+    marks = {"started": started}
+
+    from PyQt5.QtWidgets import QApplication, QDialog, QMessageBox
+    import UI
+    marks["imported"] = time.time()
+
+    app = QApplication(sys.argv)
+
+    def show_login(dialog):
+        # 登录框显示出来即视为可交互，随后跳过输入直接以测试用户登录
+        dialog.show()
+        app.processEvents()
+        marks["login_dialog"] = time.time()
+        dialog.user_data = {"id": 1, "username": "benchmark", "api_key": "benchmark"}
+        marks["login_accepted"] = time.time()
+        return QDialog.Accepted
+
+    UI.LoginDialog.exec_ = show_login
+    # 功能受限等提示框是模态的，会阻塞启动
+    QMessageBox.warning = staticmethod(lambda *args, **kwargs: QMessageBox.Ok)
+    QMessageBox.information = staticmethod(lambda *args, **kwargs: QMessageBox.Ok)
+    QMessageBox.question = staticmethod(lambda *args, **kwargs: QMessageBox.No)
+
+    window = UI.ChatBotUI()
+    window.show()
+    app.processEvents()
+    if window.tab_widget.count() == 0:
+        raise RuntimeError("没有创建对话标签页")
+    marks["first_tab"] = time.time()
+
+    marks["peak_rss_kb"] = peak_rss_kb()
+    marks["modules_loaded"] = len(sys.modules)
+    marks["torch_loaded"] = "torch" in sys.modules
+    print(json.dumps(marks), flush=True)
+
+    window.store.close()
+    # 后台的GPU探测线程不需要等待
+    os._exit(0)
+
+
+def peak_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS以字节为单位，Linux以KB为单位
+    return peak / 1024 if sys.platform == "darwin" else peak
+
+
+def metrics_of(results):
+    """展平成 指标名 -> 数值，用于和基线比较"""
+    flat = {}
+    for item in results["imports"]:
+        if item["ms"] is not None:
+            flat[f"import.{item['module']}.ms"] = item["ms"]
+    for key in ("login_dialog_ms", "first_tab_ms", "total_ms", "peak_rss_kb"):
+        if results["ui"].get(key) is not None:
+            flat[f"ui.{key}"] = results["ui"][key]
+    return flat
+
+
+def compare(current, baseline, tolerance):
+    """返回 [(指标, 基线, 当前, 是否回退), ...]"""
+    rows = []
+    for name, value in metrics_of(current).items():
+        base = metrics_of(baseline).get(name)
+        if base is None:
+            continue
+        slack = MIN_REGRESSION_KB if name.endswith("_kb") else MIN_REGRESSION_MS
+        regressed = value > base * (1 + tolerance) and value - base > slack
+        rows.append((name, base, value, regressed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动耗时与导入耗时基准测试（无界面运行）")
+    parser.add_argument("--modules", default=DEFAULT_MODULES, help="逗号分隔的要测量导入耗时的模块")
+    parser.add_argument("--repeats", type=int, default=5, help="每项测量的重复次数，取中位数")
+    parser.add_argument("--warmup", type=int, default=1, help="界面启动的预热次数")
+    parser.add_argument("--json", help="将结果写入JSON文件")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基线文件，存在时与之比较")
+    parser.add_argument("--save-baseline", action="store_true", help="将本次结果保存为基线")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="允许超出基线的比例")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        imports = [bench_import(module, workdir, args.repeats) for module in args.modules.split(",")]
+        ui = bench_ui(workdir, args.repeats, args.warmup)
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "created_at": time.time(),
+        "imports": imports,
+        "ui": ui,
+    }
+
+    print(f"{'import':<24}{'ms':>10}")
+    for item in imports:
+        ms = "未安装" if item["ms"] is None else f"{item['ms']:.1f}"
+        print(f"{item['module']:<24}{ms:>10}")
+    print(f"\n登录框出现 {ui['login_dialog_ms']:.0f} ms（其中解释器启动 {ui['interpreter_ms']:.0f} ms，"
+          f"导入UI {ui['import_ui_ms']:.0f} ms）")
+    print(f"登录到首个标签页 {ui['first_tab_ms']:.0f} ms，合计 {ui['total_ms']:.0f} ms")
+    if ui["peak_rss_kb"] is not None:
+        print(f"峰值内存 {ui['peak_rss_kb'] / 1024:.1f} MB，已加载模块 {ui['modules_loaded']}，"
+              f"torch{'已' if ui['torch_loaded'] else '未'}加载")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n基线已保存到 {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        return
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    rows = compare(results, baseline, args.tolerance)
+    print(f"\n{'metric':<34}{'baseline':>12}{'current':>12}{'change':>9}")
+    for name, base, value, regressed in rows:
+        change = (value - base) / base * 100 if base else 0.0
+        flag = "  回退" if regressed else ""
+        print(f"{name:<34}{base:>12.1f}{value:>12.1f}{change:>8.1f}%{flag}")
+    # 有回退时以非零状态退出，便于在CI中使用
+    if any(regressed for *_rest, regressed in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import hashlib
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+
+# 探测结果的缓存有效期；机器指纹变化（换了解释器、升级torch等）时立即失效
+CACHE_TTL = 7 * 24 * 3600
+PROBE_TIMEOUT = 60
+
+_probes = {}
+_lock = threading.Lock()
+
+
+def default_cache_path():
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "bot_for_homework", "capabilities.json")
+
+
+def register_probe(name, fn, fingerprint=None):
+    """
+    注册一个能力探测
+
+    参数:
+        name: 能力名，如"gpu"
+        fn: 无参函数，返回可JSON序列化的结果，可能较慢，不在GUI线程调用
+        fingerprint: 无参函数，返回影响结果的环境信息（字符串），变化时缓存失效；
+                     必须很快，且不能导入重量级模块
+    """
+    _probes[name] = (fn, fingerprint)
+
+
+def _module_fingerprint(module):
+    # find_spec只查找模块位置，不会执行导入
+    spec = importlib.util.find_spec(module)
+    if spec is None or not spec.origin:
+        return f"{module}:missing"
+    try:
+        mtime = os.stat(spec.origin).st_mtime_ns
+    except OSError:
+        mtime = 0
+    return f"{module}:{spec.origin}:{mtime}"
+
+
+def _machine_fingerprint():
+    return "|".join([platform.node(), platform.machine(), sys.executable, platform.python_version()])
+
+
+def probe_gpu():
+    """
+    在子进程中检查torch能否使用CUDA，torch不会加载进界面进程
+
+    没有安装torch时直接返回不可用；子进程失败时退回nvidia-smi检测显卡
+    """
+    if importlib.util.find_spec("torch") is None:
+        return {"available": False, "source": "torch", "detail": "未安装torch"}
+    try:
+        result = subprocess.run(
+            [sys.executable, "-c", "import torch; print(torch.cuda.is_available())"],
+            capture_output=True, text=True, timeout=PROBE_TIMEOUT
+        )
+        if result.returncode == 0:
+            return {"available": result.stdout.strip() == "True", "source": "torch", "detail": ""}
+        detail = result.stderr.strip().splitlines()[-1:] or [""]
+    except (OSError, subprocess.TimeoutExpired) as e:
+        detail = [str(e)]
+
+    if shutil.which("nvidia-smi"):
+        try:
+            result = subprocess.run(["nvidia-smi", "-L"], capture_output=True, text=True, timeout=10)
+            return {"available": result.returncode == 0 and "GPU" in result.stdout,
+                    "source": "nvidia-smi", "detail": detail[0]}
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+    return {"available": False, "source": "torch", "detail": detail[0]}
+
+
+def _gpu_fingerprint():
+    return "|".join([_module_fingerprint("torch"), os.environ.get("CUDA_VISIBLE_DEVICES", "")])
+
+
+register_probe("gpu", probe_gpu, _gpu_fingerprint)
+
+
+class CapabilityCache:
+    """按机器缓存探测结果的JSON文件，写入时原子替换"""
+
+    def __init__(self, path=None, ttl=CACHE_TTL):
+        self.path = path or default_cache_path()
+        self.ttl = ttl
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _key(self, name):
+        _fn, fingerprint = _probes[name]
+        parts = [_machine_fingerprint(), fingerprint() if fingerprint else ""]
+        return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, name):
+        """缓存的结果；没有、过期或指纹不符时返回None"""
+        entry = self._load().get(name)
+        if not entry or entry.get("key") != self._key(name):
+            return None
+        if time.time() - entry.get("probed_at", 0) > self.ttl:
+            return None
+        return entry["result"]
+
+    def put(self, name, result):
+        with _lock:
+            data = self._load()
+            data[name] = {"key": self._key(name), "probed_at": time.time(), "result": result}
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                pass
+
+    def invalidate(self, name=None):
+        with _lock:
+            data = self._load()
+            if name is None:
+                data = {}
+            else:
+                data.pop(name, None)
+            try:
+                with open(self.path, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+            except OSError:
+                pass
+
+
+_default_cache = None
+
+
+def get_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = CapabilityCache()
+    return _default_cache
+
+
+def cached(name):
+    """不执行探测，只读缓存；设置CHATBOT_REPROBE=1时总是返回None"""
+    if os.environ.get("CHATBOT_REPROBE"):
+        return None
+    return get_cache().get(name)
+
+
+def probe(name):
+    """执行探测并写入缓存（较慢，应在后台线程调用）"""
+    fn, _fingerprint = _probes[name]
+    result = fn()
+    get_cache().put(name, result)
+    return result
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="检测本机能力并更新缓存")
+    parser.add_argument("names", nargs="*", help="要探测的能力（默认全部）")
+    parser.add_argument("--invalidate", action="store_true", help="清除缓存")
+    args = parser.parse_args()
+
+    if args.invalidate:
+        get_cache().invalidate()
+        return
+    for name in args.names or sorted(_probes):
+        print(f"{name}: {json.dumps(probe(name), ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    main()
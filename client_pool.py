@@ -0,0 +1,122 @@
+import atexit
+import threading
+import time
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+
+DEFAULT_BASE_URL = "https://api.deepseek.com/v1"
+
+# 连接池配置，可通过configure()调整
+_config = {
+    "max_connections": 20,           # 每个客户端的最大连接数
+    "max_keepalive_connections": 10,  # 保持空闲的最大连接数
+    "keepalive_expiry": 60.0,        # 空闲连接保留的秒数
+    "connect_timeout": 10.0,         # 建立连接的超时
+    "read_timeout": 120.0,           # 等待响应的超时
+    "client_idle_timeout": 600.0,    # 客户端长时间未使用后关闭
+}
+
+_clients = {}
+_last_used = {}
+_lock = threading.Lock()
+
+
+def configure(**options):
+    """
+    调整连接池参数，只影响之后新建的客户端
+
+    参数:
+        max_connections: 每个客户端的最大连接数
+        max_keepalive_connections: 保持空闲的最大连接数
+        keepalive_expiry: 空闲连接保留的秒数
+        connect_timeout: 建立连接的超时秒数
+        read_timeout: 等待响应的超时秒数
+        client_idle_timeout: 客户端多久未被使用后关闭
+    """
+    unknown = set(options) - set(_config)
+    if unknown:
+        raise ValueError(f"未知的连接池参数: {', '.join(sorted(unknown))}")
+    with _lock:
+        _config.update(options)
+
+
+def _limits_and_timeout(max_connections=None):
+    max_connections = max_connections or _config["max_connections"]
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=min(max_connections, _config["max_keepalive_connections"]),
+        keepalive_expiry=_config["keepalive_expiry"],
+    )
+    timeout = httpx.Timeout(
+        _config["read_timeout"],
+        connect=_config["connect_timeout"],
+    )
+    return limits, timeout
+
+
+def _build_http_client():
+    limits, timeout = _limits_and_timeout()
+    return httpx.Client(limits=limits, timeout=timeout)
+
+
+def get_client(api_key, base_url=DEFAULT_BASE_URL):
+    """获取共享的OpenAI客户端，相同API密钥和端点复用同一个连接池"""
+    key = (api_key, base_url)
+    now = time.monotonic()
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=_build_http_client(),
+                max_retries=0,  # 重试由resilience统一处理
+            )
+            _clients[key] = client
+        _last_used[key] = now
+        _close_idle_locked(now, exclude=key)
+    return client
+
+
+def create_async_client(api_key, base_url=DEFAULT_BASE_URL, max_connections=None):
+    """
+    新建异步客户端，用于批量请求
+
+    异步连接池绑定在创建它的事件循环上，不能放入全局注册表共享，
+    调用方用完后需要await client.close()。
+    """
+    limits, timeout = _limits_and_timeout(max_connections)
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=httpx.AsyncClient(limits=limits, timeout=timeout),
+        max_retries=0,
+    )
+
+
+def _close_idle_locked(now, exclude=None):
+    idle_timeout = _config["client_idle_timeout"]
+    for key, last_used in list(_last_used.items()):
+        if key != exclude and now - last_used > idle_timeout:
+            _clients.pop(key).close()
+            del _last_used[key]
+
+
+def close_idle_clients():
+    """关闭长时间未使用的客户端（例如更换API密钥后遗留的旧客户端）"""
+    with _lock:
+        _close_idle_locked(time.monotonic())
+
+
+def close_all():
+    """关闭所有客户端及其连接"""
+    with _lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+        _last_used.clear()
+
+
+atexit.register(close_all)
@@ -0,0 +1,149 @@
+import re
+
+
+# 中日韩字符大约每字一个token，其他文本大约每4个字符一个token
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+# 每条消息在角色、分隔符上的额外开销
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text):
+    """粗略估算文本的token数，不依赖分词器"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    other = len(text) - cjk
+    return cjk + (other + 3) // 4
+
+
+def estimate_message_tokens(message, estimator=estimate_tokens):
+    return estimator(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+
+
+class DropOldestPolicy:
+    """直接丢弃超出预算的旧消息"""
+
+    def reserve(self, budget):
+        """发生裁剪时为fold的输出预留的token数"""
+        return 0
+
+    def fold(self, dropped, budget, estimator):
+        return []
+
+
+class SummaryPolicy:
+    """
+    将超出预算的旧消息折叠成一条简短的系统消息，保留早期对话的线索
+
+    参数:
+        max_tokens: 折叠后摘要的token上限
+        snippet_chars: 每条旧消息保留的字符数
+    """
+
+    def __init__(self, max_tokens=300, snippet_chars=60):
+        self.max_tokens = max_tokens
+        self.snippet_chars = snippet_chars
+
+    def reserve(self, budget):
+        # 最多占用一半预算，留给最近的对话
+        return min(self.max_tokens, budget // 2)
+
+    def fold(self, dropped, budget, estimator):
+        limit = min(self.max_tokens, budget)
+        header = "以下是较早对话的摘要:"
+        lines = []
+        used = estimator(header) + MESSAGE_OVERHEAD_TOKENS
+        # 优先保留离当前最近的旧消息
+        for message in reversed(dropped):
+            content = " ".join((message.get("content") or "").split())
+            if len(content) > self.snippet_chars:
+                content = content[:self.snippet_chars] + "…"
+            line = f"{message['role']}: {content}"
+            cost = estimator(line) + 1
+            if used + cost > limit:
+                break
+            lines.append(line)
+            used += cost
+        if not lines:
+            return []
+        lines.reverse()
+        return [{"role": "system", "content": header + "\n" + "\n".join(lines)}]
+
+
+class ContextManager:
+    """
+    按token预算裁剪发送给API的对话历史
+
+    参数:
+        max_tokens: 发送的消息总token预算
+        policy: 处理被裁剪旧消息的策略（默认直接丢弃）
+        estimator: token估算函数
+    """
+
+    def __init__(self, max_tokens=6000, policy=None, estimator=estimate_tokens):
+        self.max_tokens = max_tokens
+        self.policy = policy or DropOldestPolicy()
+        self.estimator = estimator
+        self._messages = []
+        self._counts = []
+
+    def _sync(self, history):
+        """增量更新每条消息的token数，历史只在末尾追加或回退"""
+        known = len(self._messages)
+        if known <= len(history) and (known == 0 or history[known - 1] is self._messages[-1]):
+            keep = known
+        else:
+            keep = 0
+        limit = min(len(history), known)
+        while keep < limit and history[keep] is self._messages[keep]:
+            keep += 1
+        del self._messages[keep:]
+        del self._counts[keep:]
+        for message in history[keep:]:
+            self._messages.append(message)
+            self._counts.append(estimate_message_tokens(message, self.estimator))
+
+    def total_tokens(self, history):
+        """整段历史的估算token数"""
+        self._sync(history)
+        return sum(self._counts)
+
+    def build(self, history):
+        """返回预算内要发送的消息：开头的系统消息 + 最近的对话"""
+        self._sync(history)
+
+        pinned = 0
+        while pinned < len(history) and history[pinned]["role"] == "system":
+            pinned += 1
+
+        budget = self.max_tokens - sum(self._counts[:pinned])
+        start, used = self._window(history, pinned, budget)
+        if start == pinned:
+            return list(history)
+
+        # 需要裁剪时先给折叠结果留出空间，否则最近的对话会占满预算
+        reserve = self.policy.reserve(budget)
+        if reserve:
+            start, used = self._window(history, pinned, budget - reserve)
+
+        folded = self.policy.fold(history[pinned:start], budget - used, self.estimator)
+        return history[:pinned] + folded + history[start:]
+
+    def _window(self, history, pinned, budget):
+        """预算内最近对话的起始位置和所用token数"""
+        start = len(history)
+        used = 0
+        while start > pinned:
+            cost = self._counts[start - 1]
+            # 最新的一条消息总是发送
+            if used + cost > budget and start < len(history):
+                break
+            used += cost
+            start -= 1
+
+        # 不以助手消息开头，保持用户/助手轮次完整
+        while start < len(history) - 1 and history[start]["role"] == "assistant":
+            used -= self._counts[start]
+            start += 1
+        return start, used
@@ -0,0 +1,293 @@
+import math
+import queue
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+import migrations
+from database import get_connection_manager
+
+
+# Marks around matched text in search snippets; callers escape the text and replace these
+SNIPPET_START = "\x02"
+SNIPPET_END = "\x03"
+
+# Newest index matches ranked by bm25 for each query
+RANK_WINDOW = 500
+
+# The trigram tokenizer can only match terms of at least three characters
+TRIGRAM_MIN_CHARS = 3
+
+
+class ConversationStore:
+    def __init__(self, db_path="user_database.db", flush_interval=0.5, batch_size=200):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.connections = get_connection_manager(db_path)
+        self._trigram = None
+        self.create_tables()
+
+        # Writes are queued and committed in batches by a background thread,
+        # so sending a message never waits on disk
+        self._queue = queue.Queue()
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name="ConversationStoreWriter", daemon=True)
+        self._writer.start()
+
+    def create_tables(self):
+        migrations.migrate(self.connections)
+
+    def _write_loop(self):
+        while True:
+            op = self._queue.get()
+            if op is None:
+                break
+
+            batch = [op]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size and not isinstance(batch[-1], threading.Event):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    op = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if op is None:
+                    stop = True
+                    break
+                batch.append(op)
+
+            self._write_batch(batch)
+            if stop:
+                break
+        self.connections.close()
+
+    def _write_batch(self, batch):
+        waiters = [op for op in batch if isinstance(op, threading.Event)]
+        statements = [op for op in batch if not isinstance(op, threading.Event)]
+        try:
+            with self.connections.transaction() as conn:
+                for sql, params in statements:
+                    conn.execute(sql, params)
+        except sqlite3.Error as e:
+            print(f"Failed to save conversation data: {e}")
+        finally:
+            for waiter in waiters:
+                waiter.set()
+
+    def _enqueue(self, sql, params):
+        if self._closed:
+            raise RuntimeError("ConversationStore is closed")
+        self._queue.put((sql, params))
+
+    def flush(self, timeout=None):
+        """Block until every queued write has been committed"""
+        if self._closed:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+
+    def create_conversation(self, user_id, title, mode=None):
+        conversation_id = uuid.uuid4().hex
+        now = time.time()
+        self._enqueue(
+            "INSERT INTO conversations (id, user_id, title, mode, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (conversation_id, user_id, title, mode, now, now)
+        )
+        return conversation_id
+
+    def append_message(self, conversation_id, role, content):
+        now = time.time()
+        self._enqueue(
+            "INSERT INTO messages (conversation_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+            (conversation_id, role, content, now)
+        )
+        self._enqueue(
+            "UPDATE conversations SET updated_at = ?, message_count = message_count + 1 WHERE id = ?",
+            (now, conversation_id)
+        )
+
+    def restore_conversation(self, conversation_id):
+        self._enqueue(
+            "UPDATE conversations SET archived = 0 WHERE id = ?",
+            (conversation_id,)
+        )
+
+    def archive_conversation(self, conversation_id):
+        self._enqueue(
+            "UPDATE conversations SET archived = 1 WHERE id = ?",
+            (conversation_id,)
+        )
+
+    def list_conversations(self, user_id):
+        """Conversation metadata only; messages are loaded per conversation on demand"""
+        self.flush()
+        cursor = self.connections.execute(
+            "SELECT id, title, mode, created_at, updated_at, message_count FROM conversations "
+            "WHERE user_id = ? AND archived = 0 ORDER BY created_at",
+            (user_id,)
+        )
+        rows = cursor.fetchall()
+
+        return [
+            {"id": row[0], "title": row[1], "mode": row[2], "created_at": row[3],
+             "updated_at": row[4], "message_count": row[5]}
+            for row in rows
+        ]
+
+    def load_messages(self, conversation_id, before_id=None, limit=50):
+        """Return up to `limit` messages older than `before_id`, oldest first"""
+        self.flush()
+        if before_id is None:
+            cursor = self.connections.execute(
+                "SELECT id, role, content, created_at FROM messages WHERE conversation_id = ? "
+                "ORDER BY id DESC LIMIT ?",
+                (conversation_id, limit)
+            )
+        else:
+            cursor = self.connections.execute(
+                "SELECT id, role, content, created_at FROM messages WHERE conversation_id = ? AND id < ? "
+                "ORDER BY id DESC LIMIT ?",
+                (conversation_id, before_id, limit)
+            )
+        rows = cursor.fetchall()
+
+        rows.reverse()
+        return [{"id": row[0], "role": row[1], "content": row[2], "created_at": row[3]} for row in rows]
+
+    def load_messages_range(self, conversation_id, from_id, before_id=None):
+        """All messages from `from_id` (inclusive) up to `before_id`, oldest first"""
+        self.flush()
+        if before_id is None:
+            rows = self.connections.execute(
+                "SELECT id, role, content, created_at FROM messages "
+                "WHERE conversation_id = ? AND id >= ? ORDER BY id",
+                (conversation_id, from_id)
+            ).fetchall()
+        else:
+            rows = self.connections.execute(
+                "SELECT id, role, content, created_at FROM messages "
+                "WHERE conversation_id = ? AND id >= ? AND id < ? ORDER BY id",
+                (conversation_id, from_id, before_id)
+            ).fetchall()
+        return [{"id": row[0], "role": row[1], "content": row[2], "created_at": row[3]} for row in rows]
+
+    def _uses_trigram(self):
+        if self._trigram is None:
+            row = self.connections.execute(
+                "SELECT sql FROM sqlite_master WHERE name = 'messages_fts'"
+            ).fetchone()
+            self._trigram = bool(row) and "trigram" in row[0]
+        return self._trigram
+
+    def search_messages(self, user_id, query, limit=20, offset=0):
+        """
+        Messages of all of a user's conversations (archived ones included)
+        containing every whitespace-separated term.
+
+        The user's newest RANK_WINDOW matches are ranked by BM25 and come
+        first; older matches follow newest first. FTS5's own bm25() scans
+        every match of a term to compute its IDF, which makes common terms
+        slow on large histories, so the window is scored here with
+        statistics from the window itself. With the trigram
+        tokenizer, terms shorter than three characters can't use the index,
+        so they become LIKE filters, or a newest-first scan when the query
+        has no longer term.
+        """
+        self.flush()
+        terms = query.split()
+        if not terms:
+            return []
+
+        min_chars = TRIGRAM_MIN_CHARS if self._uses_trigram() else 1
+        indexed = [term for term in terms if len(term) >= min_chars]
+        short = [term for term in terms if len(term) < min_chars]
+
+        filter_sql = "".join(" AND m.content LIKE ? ESCAPE '\\'" for _ in short)
+        filter_params = ["%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                         for term in short]
+        columns = "SELECT m.id, m.conversation_id, c.title, c.archived, m.role, m.created_at, m.content "
+
+        if not indexed:
+            rows = self.connections.execute(
+                columns + "FROM conversations c JOIN messages m ON m.conversation_id = c.id "
+                f"WHERE c.user_id = ?{filter_sql} ORDER BY m.id DESC LIMIT ? OFFSET ?",
+                [user_id] + filter_params + [limit, offset]
+            ).fetchall()
+            return [_search_result(row, terms) for row in rows]
+
+        match = " ".join('"' + term.replace('"', '""') + '"' for term in indexed)
+        # The window is taken from this user's matches only, so other users'
+        # recent messages can't crowd theirs out of the ranking
+        matches_sql = (columns + "FROM messages_fts "
+                       "JOIN messages m ON m.id = messages_fts.rowid "
+                       "JOIN conversations c ON c.id = m.conversation_id "
+                       "WHERE messages_fts MATCH ? AND c.user_id = ?")
+        window = self.connections.execute(
+            matches_sql + f"{filter_sql} ORDER BY messages_fts.rowid DESC LIMIT ?",
+            [match, user_id] + filter_params + [RANK_WINDOW]
+        ).fetchall()
+        ranked = bm25_sort(window, terms, content_index=6)
+
+        rows = ranked[offset:offset + limit]
+        if len(window) == RANK_WINDOW and len(rows) < limit:
+            # Matches older than the ranked window, newest first
+            rows += self.connections.execute(
+                matches_sql + f" AND messages_fts.rowid < ?{filter_sql} "
+                "ORDER BY messages_fts.rowid DESC LIMIT ? OFFSET ?",
+                [match, user_id, window[-1][0]] + filter_params
+                + [limit - len(rows), max(0, offset - len(ranked))]
+            ).fetchall()
+        return [_search_result(row, terms) for row in rows]
+
+
+def bm25_sort(rows, terms, content_index, k1=1.2, b=0.75):
+    """Sort rows by BM25 over substring counts, best first; ties keep the newest first"""
+    if not rows:
+        return rows
+    terms = [term.lower() for term in terms]
+    texts = [row[content_index].lower() for row in rows]
+    counts = [[text.count(term) for term in terms] for text in texts]
+    average_length = sum(len(text) for text in texts) / len(texts) or 1
+    idf = []
+    for i in range(len(terms)):
+        df = sum(1 for row_counts in counts if row_counts[i])
+        idf.append(math.log((len(rows) - df + 0.5) / (df + 0.5) + 1))
+
+    def score(i):
+        norm = k1 * (1 - b + b * len(texts[i]) / average_length)
+        return sum(w * tf * (k1 + 1) / (tf + norm) for w, tf in zip(idf, counts[i]) if tf)
+
+    order = sorted(range(len(rows)), key=lambda i: (-score(i), -rows[i][0]))
+    return [rows[i] for i in order]
+
+
+def _search_result(row, terms):
+    return {"id": row[0], "conversation_id": row[1], "title": row[2], "archived": bool(row[3]),
+            "role": row[4], "created_at": row[5], "snippet": make_snippet(row[6], terms)}
+
+
+def make_snippet(content, terms, context=40):
+    """Text around the first matched term, with every term occurrence wrapped in SNIPPET_START/END"""
+    pattern = re.compile("|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    first = pattern.search(content)
+    if first is None:
+        return content[:2 * context]
+    start = max(0, first.start() - context)
+    end = min(len(content), first.end() + 2 * context)
+    text = pattern.sub(lambda m: SNIPPET_START + m.group(0) + SNIPPET_END, content[start:end])
+    return ("…" if start else "") + text + ("…" if end < len(content) else "")
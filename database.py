@@ -1,129 +1,409 @@
 import sqlite3
-import hashlib
+import csv
+import json
 import os
+import threading
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+
+import migrations
+import passwords
+
+
+class ConnectionManager:
+    # One long-lived connection per thread: no reopening or schema parsing per
+    # call, and each connection keeps its own prepared statement cache.
+    # WAL lets readers run alongside the single writer.
+    def __init__(self, db_path, cache_size_kb=8192, busy_timeout=5.0, cached_statements=256):
+        self.db_path = db_path
+        self.cache_size_kb = cache_size_kb
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self.migrated = False
+        self._local = threading.local()
+
+    def _connect(self):
+        # Autocommit mode; transaction() opens transactions explicitly
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout,
+            isolation_level=None,
+            cached_statements=self.cached_statements,
+        )
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA cache_size = {-int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def execute(self, sql, params=()):
+        return self.connection().execute(sql, params)
+
+    @contextmanager
+    def transaction(self):
+        """Run the enclosed statements as one write transaction; nested calls join the outer one"""
+        conn = self.connection()
+        if conn.in_transaction:
+            yield conn
+            return
+
+        # Take the write lock up front so a read-then-write can't fail with SQLITE_BUSY halfway
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def close(self):
+        """Close the calling thread's connection; other threads' connections close when they exit"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_connection_manager(db_path="user_database.db"):
+    """Shared manager per database file"""
+    key = os.path.abspath(db_path)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = ConnectionManager(db_path)
+            _managers[key] = manager
+        return manager
+
+
+RESET_TOKEN_TTL = 3600
+
+
+def purge_expired_tokens(connections, batch_size=500):
+    """Delete expired reset tokens a batch per transaction, so writers are never blocked for long"""
+    purged = 0
+    while True:
+        with connections.transaction() as conn:
+            cursor = conn.execute(
+                "DELETE FROM password_reset_tokens WHERE token_hash IN ("
+                "SELECT token_hash FROM password_reset_tokens WHERE expires_at <= ? LIMIT ?)",
+                (int(time.time()), batch_size)
+            )
+        purged += cursor.rowcount
+        if cursor.rowcount < batch_size:
+            return purged
+
+
+class TokenSweeper:
+    # Holds only the ConnectionManager, not a UserDatabase, so the thread
+    # doesn't keep any database instance alive
+    def __init__(self, connections, interval=300.0):
+        self.connections = connections
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="ResetTokenSweeper", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                purge_expired_tokens(self.connections)
+            except sqlite3.Error as e:
+                print(f"Failed to purge expired reset tokens: {e}")
+            if self._stop.wait(self.interval):
+                break
+        self.connections.close()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._thread.join(timeout)
+
+
+_sweepers = {}
+_sweepers_lock = threading.Lock()
+
+
+def start_token_sweeper(connections, interval=300.0):
+    """One sweeper per database file, however many UserDatabase instances use it"""
+    with _sweepers_lock:
+        sweeper = _sweepers.get(connections)
+        if sweeper is None:
+            sweeper = TokenSweeper(connections, interval)
+            _sweepers[connections] = sweeper
+        return sweeper
+
+
+def stop_token_sweeper(connections, timeout=None):
+    with _sweepers_lock:
+        sweeper = _sweepers.pop(connections, None)
+    if sweeper is not None:
+        sweeper.stop(timeout)
+
+EXPORT_FIELDS = ("id", "username", "email")
+SECRET_EXPORT_FIELDS = ("api_key", "password_hash")
+
+
+def read_user_rows(path):
+    """Stream user dicts from a .jsonl or .csv file"""
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def write_user_rows(path, rows, fields):
+    """Write user dicts to a .jsonl or .csv file as they arrive; returns the row count"""
+    count = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        if path.endswith(".jsonl"):
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+                count += 1
+        else:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+    return count
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
 
 
 class UserDatabase:
-    def __init__(self, db_path="user_database.db"):
+    def __init__(self, db_path="user_database.db", password_cost=None, sweep_interval=300.0):
         self.db_path = db_path
+        # Name of a preset in passwords.COSTS or a params dict; None uses the default
+        self.password_cost = password_cost
+        self.connections = get_connection_manager(db_path)
         self.create_tables()
 
-    def create_tables(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Create users table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            api_key TEXT,
-            reset_token TEXT,
-            reset_token_expiry TEXT
-        )
-        ''')
+        # Expired reset tokens are purged in the background by a sweeper shared
+        # by every instance on this file; None disables it
+        if sweep_interval is not None:
+            self.start_token_sweeper(sweep_interval)
 
-        conn.commit()
-        conn.close()
+    def create_tables(self):
+        migrations.migrate(self.connections)
 
     def hash_password(self, password):
-        return hashlib.sha256(password.encode()).hexdigest()
+        return passwords.hash_password(password, self.password_cost)
 
     def register_user(self, username, password, email, api_key=""):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
+        password_hash = self.hash_password(password)
         try:
-            password_hash = self.hash_password(password)
-            cursor.execute(
-                "INSERT INTO users (username, password_hash, email, api_key) VALUES (?, ?, ?, ?)",
-                (username, password_hash, email, api_key)
-            )
-            conn.commit()
+            with self.connections.transaction() as conn:
+                conn.execute(
+                    "INSERT INTO users (username, password_hash, email, api_key) VALUES (?, ?, ?, ?)",
+                    (username, password_hash, email, api_key)
+                )
             return True
         except sqlite3.IntegrityError:
             return False
-        finally:
-            conn.close()
 
     def authenticate(self, username, password):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        # The KDF is deliberately slow; callers should run this off the GUI thread
+        user = self.connections.execute(
+            "SELECT id, username, api_key, email, password_hash FROM users WHERE username = ?",
+            (username,)
+        ).fetchone()
 
-        password_hash = self.hash_password(password)
-        cursor.execute(
-            "SELECT id, username, api_key, email FROM users WHERE username = ? AND password_hash = ?",
-            (username, password_hash)
-        )
-        user = cursor.fetchone()
-        conn.close()
+        if not user:
+            passwords.dummy_verify(password, self.password_cost)
+            return None
+        if not passwords.verify_password(password, user[4]):
+            return None
 
-        if user:
-            return {"id": user[0], "username": user[1], "api_key": user[2], "email": user[3]}
-        return None
+        # Upgrade legacy SHA-256 hashes and outdated cost settings now that we know the password
+        if passwords.needs_rehash(user[4], self.password_cost):
+            new_hash = self.hash_password(password)
+            with self.connections.transaction() as conn:
+                conn.execute(
+                    "UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?",
+                    (new_hash, user[0], user[4])
+                )
 
-    def update_api_key(self, username, api_key):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        return {"id": user[0], "username": user[1], "api_key": user[2], "email": user[3]}
 
-        cursor.execute(
-            "UPDATE users SET api_key = ? WHERE username = ?",
-            (api_key, username)
-        )
-        conn.commit()
-        conn.close()
+    def update_api_key(self, username, api_key):
+        with self.connections.transaction() as conn:
+            conn.execute(
+                "UPDATE users SET api_key = ? WHERE username = ?",
+                (api_key, username)
+            )
 
     def generate_reset_token(self, email):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Check if email exists
-        cursor.execute("SELECT id FROM users WHERE email = ?", (email,))
-        if not cursor.fetchone():
-            conn.close()
-            return None
-
         # Generate token
         token = str(uuid.uuid4())
-        import datetime
-        expiry = datetime.datetime.now() + datetime.timedelta(hours=1)
-        expiry_str = expiry.isoformat()
+        expires_at = int(time.time()) + RESET_TOKEN_TTL
 
-        cursor.execute(
-            "UPDATE users SET reset_token = ?, reset_token_expiry = ? WHERE email = ?",
-            (token, expiry_str, email)
-        )
-        conn.commit()
-        conn.close()
+        with self.connections.transaction() as conn:
+            # Check if email exists
+            user = conn.execute("SELECT id FROM users WHERE email = ?", (email,)).fetchone()
+            if not user:
+                return None
+
+            # A new token replaces any outstanding one
+            conn.execute("DELETE FROM password_reset_tokens WHERE user_id = ?", (user[0],))
+            conn.execute(
+                "INSERT INTO password_reset_tokens (token_hash, user_id, expires_at) VALUES (?, ?, ?)",
+                (passwords.hash_token(token), user[0], expires_at)
+            )
 
         return token
 
     def reset_password(self, token, new_password):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        now = int(time.time())
+        password_hash = self.hash_password(new_password)
 
-        import datetime
-        now = datetime.datetime.now().isoformat()
+        # Lookup and update in one transaction, so a token can only be used once
+        with self.connections.transaction() as conn:
+            row = conn.execute(
+                "SELECT user_id FROM password_reset_tokens WHERE token_hash = ? AND expires_at > ?",
+                (passwords.hash_token(token), now)
+            ).fetchone()
 
-        cursor.execute(
-            "SELECT id FROM users WHERE reset_token = ? AND reset_token_expiry > ?",
-            (token, now)
-        )
-        user = cursor.fetchone()
+            if not row:
+                return False
 
-        if not user:
-            conn.close()
-            return False
+            conn.execute("UPDATE users SET password_hash = ? WHERE id = ?", (password_hash, row[0]))
+            conn.execute("DELETE FROM password_reset_tokens WHERE user_id = ?", (row[0],))
 
-        password_hash = self.hash_password(new_password)
-        cursor.execute(
-            "UPDATE users SET password_hash = ?, reset_token = NULL, reset_token_expiry = NULL WHERE id = ?",
-            (password_hash, user[0])
-        )
-        conn.commit()
-        conn.close()
+        return True
+
+    def purge_expired_tokens(self, batch_size=500):
+        return purge_expired_tokens(self.connections, batch_size)
+
+    def start_token_sweeper(self, interval=300.0):
+        return start_token_sweeper(self.connections, interval)
+
+    def stop_token_sweeper(self, timeout=None):
+        stop_token_sweeper(self.connections, timeout)
+
+    def import_users(self, rows, cost=None, batch_size=2000, workers=None):
+        """
+        Create many users from an iterable of dicts (username, email, and
+        password or a precomputed password_hash; api_key optional).
+
+        Rows are processed in batches: conflicts are filtered out and reported
+        per row, passwords are hashed on a thread pool (hashlib releases the
+        GIL, so this uses every core), and each batch is inserted with one
+        executemany in one transaction. Passwords use the database's normal
+        cost unless cost is given; a cheaper cost such as "bulk" is upgraded
+        on each user's first login. Precomputed hashes must be in a format
+        passwords.py can verify, otherwise the row is reported as a conflict.
+
+        Returns {"imported": count, "conflicts": [(row number, username, reason)]}.
+        """
+        imported = 0
+        conflicts = []
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            for batch in _batches(enumerate(rows, 1), batch_size):
+                pending = self._check_import_batch(batch, conflicts)
+
+                def password_hash(row):
+                    return row[4] or passwords.hash_password(row[3], cost or self.password_cost)
+
+                hashes = list(pool.map(password_hash, pending))
+                imported += self._insert_import_batch(pending, hashes, conflicts)
+        conflicts.sort()
+        return {"imported": imported, "conflicts": conflicts}
+
+    def _check_import_batch(self, batch, conflicts):
+        pending = []
+        seen_usernames, seen_emails = set(), set()
+        for row_no, row in batch:
+            username = (row.get("username") or "").strip()
+            email = (row.get("email") or "").strip()
+            if not username or not email or not (row.get("password") or row.get("password_hash")):
+                conflicts.append((row_no, username, "missing username, email or password"))
+            elif row.get("password_hash") and not passwords.is_valid_hash(row["password_hash"]):
+                conflicts.append((row_no, username, "unrecognized password_hash format"))
+            elif username in seen_usernames:
+                conflicts.append((row_no, username, "duplicate username in input"))
+            elif email in seen_emails:
+                conflicts.append((row_no, username, "duplicate email in input"))
+            else:
+                seen_usernames.add(username)
+                seen_emails.add(email)
+                pending.append((row_no, username, email, row.get("password"), row.get("password_hash"),
+                                row.get("api_key") or ""))
+
+        taken_usernames = self._existing("username", [row[1] for row in pending])
+        taken_emails = self._existing("email", [row[2] for row in pending])
+        checked = []
+        for row in pending:
+            if row[1] in taken_usernames:
+                conflicts.append((row[0], row[1], "username already exists"))
+            elif row[2] in taken_emails:
+                conflicts.append((row[0], row[1], "email already exists"))
+            else:
+                checked.append(row)
+        return checked
+
+    def _existing(self, column, values, chunk_size=500):
+        found = set()
+        for chunk in _batches(values, chunk_size):
+            placeholders = ",".join("?" * len(chunk))
+            found.update(row[0] for row in self.connections.execute(
+                f"SELECT {column} FROM users WHERE {column} IN ({placeholders})", chunk
+            ))
+        return found
+
+    def _insert_import_batch(self, pending, hashes, conflicts):
+        sql = "INSERT INTO users (username, password_hash, email, api_key) VALUES (?, ?, ?, ?)"
+        params = [(row[1], password_hash, row[2], row[5]) for row, password_hash in zip(pending, hashes)]
+        try:
+            with self.connections.transaction() as conn:
+                conn.executemany(sql, params)
+            return len(params)
+        except sqlite3.IntegrityError:
+            pass
+
+        # Someone registered one of these names since the check; retry row by row
+        inserted = 0
+        with self.connections.transaction() as conn:
+            for row, values in zip(pending, params):
+                try:
+                    conn.execute(sql, values)
+                    inserted += 1
+                except sqlite3.IntegrityError as e:
+                    conflicts.append((row[0], row[1], str(e)))
+        return inserted
 
-        return True
\ No newline at end of file
+    def export_users(self, include_secrets=False, chunk_size=1000):
+        """Yield user dicts in id order, reading chunk_size rows at a time"""
+        fields = EXPORT_FIELDS + (SECRET_EXPORT_FIELDS if include_secrets else ())
+        cursor = self.connections.execute(f"SELECT {', '.join(fields)} FROM users ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            for row in rows:
+                yield dict(zip(fields, row))
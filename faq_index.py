@@ -0,0 +1,231 @@
+import argparse
+import csv
+import json
+import os
+import zlib
+
+import numpy as np
+import scipy.sparse as sp
+
+
+INDEX_FORMAT = 1
+
+
+def normalize(text):
+    return " ".join(text.lower().split())
+
+
+def char_ngrams(text, ngram_range=(1, 3)):
+    """Character n-grams; spaces-only grams are skipped"""
+    text = f" {normalize(text)} "
+    low, high = ngram_range
+    for n in range(low, high + 1):
+        for i in range(len(text) - n + 1):
+            gram = text[i:i + n]
+            if not gram.isspace():
+                yield gram
+
+
+def hash_features(text, n_features, ngram_range=(1, 3)):
+    """Hashed n-gram counts as (feature ids, counts); crc32 keeps ids stable across processes"""
+    grams = [zlib.crc32(gram.encode("utf-8")) % n_features for gram in char_ngrams(text, ngram_range)]
+    if not grams:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+    features, counts = np.unique(np.asarray(grams, dtype=np.int32), return_counts=True)
+    return features, counts.astype(np.float32)
+
+
+def read_corpus(path):
+    """Stream (question, answer) pairs from a .jsonl, .csv or .tsv file"""
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                line = line.strip()
+                if line:
+                    record = json.loads(line)
+                    yield record["question"], record["answer"]
+        else:
+            delimiter = "\t" if path.endswith(".tsv") else ","
+            for row in csv.DictReader(f, delimiter=delimiter):
+                yield row["question"], row["answer"]
+
+
+class StringTable:
+    """Strings packed into one UTF-8 blob plus offsets, so they can be memory-mapped"""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+
+class FAQIndex:
+    """
+    TF-IDF retrieval over a FAQ corpus using hashed character n-grams.
+
+    The document-term matrix is stored feature-major (one CSR row per hashed
+    n-gram, i.e. an inverted index), so a query only touches the posting
+    lists of its own n-grams. Scores are cosine similarities because every
+    document vector is L2-normalised at build time.
+    """
+
+    def __init__(self, postings, idf, questions, answers, n_features, ngram_range=(1, 3)):
+        self.postings = postings
+        self.idf = idf
+        self.questions = questions
+        self.answers = answers
+        self.n_features = n_features
+        self.ngram_range = tuple(ngram_range)
+
+    def __len__(self):
+        return len(self.questions)
+
+    @classmethod
+    def build(cls, pairs, n_features=2 ** 20, ngram_range=(1, 3)):
+        questions, answers = [], []
+        row_features, row_counts = [], []
+        for question, answer in pairs:
+            features, counts = hash_features(question, n_features, ngram_range)
+            questions.append(question)
+            answers.append(answer)
+            row_features.append(features)
+            row_counts.append(counts)
+
+        n_docs = len(questions)
+        lengths = np.fromiter((len(f) for f in row_features), dtype=np.int64, count=n_docs)
+        indptr = np.zeros(n_docs + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        indices = np.concatenate(row_features) if n_docs else np.empty(0, dtype=np.int32)
+        tf = np.concatenate(row_counts) if n_docs else np.empty(0, dtype=np.float32)
+
+        # Smoothed idf, sublinear tf, then L2-normalise each document
+        df = np.bincount(indices, minlength=n_features).astype(np.float32)
+        idf = (np.log((1 + n_docs) / (1 + df)) + 1).astype(np.float32)
+        data = (1 + np.log(tf)) * idf[indices]
+        row_ids = np.repeat(np.arange(n_docs), lengths)
+        norms = np.sqrt(np.bincount(row_ids, weights=data.astype(np.float64) ** 2, minlength=n_docs))
+        norms[norms == 0] = 1
+        data = (data / norms[row_ids]).astype(np.float32)
+
+        docs = sp.csr_matrix((data, indices, indptr), shape=(n_docs, n_features))
+        postings = docs.T.tocsr()
+        postings.sort_indices()
+        return cls(postings, idf, StringTable.from_strings(questions), StringTable.from_strings(answers),
+                   n_features, ngram_range)
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "data.npy"), self.postings.data.astype(np.float32))
+        np.save(os.path.join(directory, "indices.npy"), self.postings.indices.astype(np.int32))
+        np.save(os.path.join(directory, "indptr.npy"), self.postings.indptr.astype(np.int64))
+        np.save(os.path.join(directory, "idf.npy"), self.idf)
+        for name, table in (("questions", self.questions), ("answers", self.answers)):
+            np.save(os.path.join(directory, f"{name}_blob.npy"), np.asarray(table.blob))
+            np.save(os.path.join(directory, f"{name}_offsets.npy"), np.asarray(table.offsets))
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "format": INDEX_FORMAT,
+                "n_docs": len(self),
+                "n_features": self.n_features,
+                "ngram_range": list(self.ngram_range),
+            }, f)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Load a saved index; with mmap the arrays are paged in lazily and shared between processes"""
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != INDEX_FORMAT:
+            raise ValueError(f"Unsupported FAQ index format in {directory}")
+
+        mode = "r" if mmap else None
+
+        def array(name):
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mode)
+
+        postings = sp.csr_matrix(
+            (array("data"), array("indices"), array("indptr")),
+            shape=(meta["n_features"], meta["n_docs"]),
+            copy=False,
+        )
+        return cls(
+            postings,
+            array("idf"),
+            StringTable(array("questions_blob"), array("questions_offsets")),
+            StringTable(array("answers_blob"), array("answers_offsets")),
+            meta["n_features"],
+            meta["ngram_range"],
+        )
+
+    def _query_vector(self, query):
+        features, counts = hash_features(query, self.n_features, self.ngram_range)
+        weights = (1 + np.log(counts)) * self.idf[features]
+        norm = np.linalg.norm(weights)
+        if norm:
+            weights /= norm
+        return features, weights.astype(np.float32)
+
+    def scores(self, query):
+        """Cosine similarity of the query against every document"""
+        features, weights = self._query_vector(query)
+        if not len(features) or not len(self):
+            return np.zeros(len(self), dtype=np.float32)
+        return np.asarray(self.postings[features].T @ weights).ravel()
+
+    def search(self, query, k=5):
+        """Top-k (score, question, answer) tuples, best first"""
+        scores = self.scores(query)
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.questions[i], self.answers[i]) for i in top if scores[i] > 0]
+
+    def best_answer(self, query, min_score=0.0):
+        """(score, answer) of the best match above min_score, or None"""
+        results = self.search(query, k=1)
+        if results and results[0][0] >= min_score:
+            return results[0][0], results[0][2]
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query a FAQ retrieval index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Build an index from a .jsonl/.csv/.tsv corpus")
+    build_parser.add_argument("corpus")
+    build_parser.add_argument("index_dir")
+    build_parser.add_argument("--features", type=int, default=2 ** 20, help="Number of hashed features")
+
+    query_parser = subparsers.add_parser("query", help="Query a saved index")
+    query_parser.add_argument("index_dir")
+    query_parser.add_argument("text")
+    query_parser.add_argument("-k", type=int, default=5)
+
+    args = parser.parse_args()
+    if args.command == "build":
+        index = FAQIndex.build(read_corpus(args.corpus), n_features=args.features)
+        index.save(args.index_dir)
+        print(f"Indexed {len(index)} questions into {args.index_dir}")
+    else:
+        index = FAQIndex.load(args.index_dir)
+        for score, question, answer in index.search(args.text, args.k):
+            print(f"{score:.3f}\t{question}\t{answer}")
+
+
+if __name__ == "__main__":
+    main()
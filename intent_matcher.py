@@ -0,0 +1,220 @@
+import re
+from collections import deque
+
+
+# Characters that make a regex alternative more than a plain literal
+_META = set(".^$*+?{}[]()|\\")
+
+
+def _split_alternatives(pattern):
+    """Split on top-level '|', or return None if the groups/classes don't balance"""
+    parts, depth, in_class, start, i = [], 0, False, 0, 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            i += 2
+            continue
+        if in_class:
+            in_class = char != "]"
+        elif char == "[":
+            in_class = True
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            parts.append(pattern[start:i])
+            start = i + 1
+        i += 1
+    if depth or in_class:
+        return None
+    parts.append(pattern[start:])
+    return parts
+
+
+def _group_end(pattern):
+    """Index of the ')' closing the group opened at pattern[0]"""
+    depth, in_class, i = 0, False, 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            i += 2
+            continue
+        if in_class:
+            in_class = char != "]"
+        elif char == "[":
+            in_class = True
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return -1
+
+
+def _unwrap(pattern):
+    """Strip surrounding \\b anchors and enclosing (?:...) groups"""
+    while True:
+        if pattern.startswith(r"\b"):
+            pattern = pattern[2:]
+        elif pattern.endswith(r"\b") and not pattern.endswith(r"\\b"):
+            pattern = pattern[:-2]
+        elif pattern.startswith("(?:") and _group_end(pattern) == len(pattern) - 1:
+            pattern = pattern[3:-1]
+        else:
+            return pattern
+
+
+def _literal(alternative):
+    """The text an alternative matches if it is a plain literal, else None"""
+    alternative = _unwrap(alternative)
+    chars, i = [], 0
+    while i < len(alternative):
+        char = alternative[i]
+        if char == "\\":
+            escaped = alternative[i + 1:i + 2]
+            # Only escaped punctuation is literal; \d, \w, \b etc. are not
+            if not escaped or escaped.isalnum() or escaped == "_":
+                return None
+            chars.append(escaped)
+            i += 2
+            continue
+        if char in _META:
+            return None
+        chars.append(char)
+        i += 1
+    return "".join(chars) or None
+
+
+def required_literals(pattern):
+    """
+    Literals one of which must occur in any match of pattern, or None.
+
+    Only handles alternations of plain words such as "hello|hi" or
+    r"\\b(?:api|key)\\b"; anything else returns None and is always checked.
+    """
+    alternatives = _split_alternatives(_unwrap(pattern))
+    if alternatives is None:
+        return None
+    literals = [_literal(alternative) for alternative in alternatives]
+    if any(literal is None for literal in literals):
+        return None
+    return literals
+
+
+class KeywordTrie:
+    """Aho-Corasick automaton reporting which keyword ids occur in a text"""
+
+    def __init__(self, keywords):
+        self._goto = [{}]
+        self._output = [set()]
+        for keyword, key_id in keywords:
+            state = 0
+            for char in keyword:
+                state = self._goto[state].setdefault(char, len(self._goto))
+                if state == len(self._goto):
+                    self._goto.append({})
+                    self._output.append(set())
+            self._output[state].add(key_id)
+
+        # Breadth-first failure links; outputs are merged along them
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                if state:
+                    fallback = self._fail[state]
+                    while fallback and char not in self._goto[fallback]:
+                        fallback = self._fail[fallback]
+                    self._fail[child] = self._goto[fallback].get(char, 0)
+                self._output[child] |= self._output[self._fail[child]]
+
+    def find(self, text):
+        """Set of ids of every keyword occurring in text"""
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found |= output[state]
+        return found
+
+
+class IntentMatcher:
+    """
+    Find the first intent pattern, in priority order, that matches a text.
+
+    Patterns that are alternations of plain keywords (the usual case) are
+    indexed in a keyword trie, so one pass over the text yields the few
+    patterns that can possibly match; only those, plus any patterns too
+    complex to index, are confirmed with re.search. Matching cost therefore
+    grows with the text and the number of candidates, not with the size of
+    the intent set, and the result is the same as trying every pattern in
+    order.
+
+    Matchers pickle without their compiled patterns; an unpickled matcher
+    keeps its keyword trie and compiles each pattern the first time it is a
+    candidate.
+    """
+
+    def __init__(self, patterns, flags=0):
+        self.patterns = list(patterns)
+        self.flags = flags
+        self._compiled = [re.compile(pattern, flags) for pattern in self.patterns]
+        self._fold = bool(flags & re.IGNORECASE)
+
+        keywords = []
+        self._always = []
+        for index, pattern in enumerate(self.patterns):
+            # Under re.VERBOSE whitespace in a pattern isn't literal
+            literals = None if flags & re.VERBOSE else required_literals(pattern)
+            # str.lower() and re's case folding only agree reliably on ASCII
+            if literals is None or (self._fold and not all(literal.isascii() for literal in literals)):
+                self._always.append(index)
+                continue
+            keywords.extend((literal.lower() if self._fold else literal, index) for literal in literals)
+        self._trie = KeywordTrie(keywords)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_compiled"] = [None] * len(self.patterns)
+        return state
+
+    def _pattern(self, index):
+        compiled = self._compiled[index]
+        if compiled is None:
+            compiled = self._compiled[index] = re.compile(self.patterns[index], self.flags)
+        return compiled
+
+    def search(self, text, accept=None):
+        """
+        (index, match span) of the winning pattern, or None.
+
+        accept(index, match), if given, can reject individual matches; the
+        next occurrence of the same pattern, then the next pattern, is tried.
+        """
+        candidates = self._trie.find(text.lower() if self._fold else text)
+        if self._always:
+            candidates.update(self._always)
+        for index in sorted(candidates):
+            if accept is None:
+                match = self._pattern(index).search(text)
+                if match is not None:
+                    return index, match.span()
+                continue
+            for match in self._pattern(index).finditer(text):
+                if accept(index, match):
+                    return index, match.span()
+        return None
+
+    def match_index(self, text):
+        """Index of the first pattern (in priority order) found in text, or None"""
+        result = self.search(text)
+        return result[0] if result else None
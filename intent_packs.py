@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import pickle
+import re
+import threading
+import time
+
+from intent_matcher import IntentMatcher
+
+try:
+    import yaml
+except ImportError:  # YAML packs are optional
+    yaml = None
+
+
+DEFAULT_INTENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intents")
+PACK_EXTENSIONS = (".json", ".yaml", ".yml")
+
+# Bump when IntentSet or IntentMatcher change in a way old pickles can't satisfy
+CACHE_FORMAT = 3
+
+
+class IntentSet:
+    """An immutable, compiled snapshot of all intent packs"""
+
+    def __init__(self, names, patterns, responses, default_responses, source_hash, routable=None):
+        self.names = names
+        self.patterns = patterns
+        self.responses = responses
+        # False for intents whose replies only make sense in simple mode, so the
+        # advanced-mode router sends them to the remote model instead
+        self.routable = routable if routable is not None else [True] * len(patterns)
+        self.default_responses = default_responses
+        self.source_hash = source_hash
+        self.matcher = IntentMatcher(patterns)
+
+
+def list_pack_files(pack_dir):
+    if not os.path.isdir(pack_dir):
+        return []
+    return sorted(
+        os.path.join(pack_dir, name) for name in os.listdir(pack_dir)
+        if name.endswith(PACK_EXTENSIONS) and not name.startswith(".")
+    )
+
+
+def load_pack(path, data=None):
+    if data is None:
+        with open(path, "rb") as f:
+            data = f.read()
+    if path.endswith(".json"):
+        return json.loads(data.decode("utf-8"))
+    if yaml is None:
+        raise ImportError(f"PyYAML is required to load {path}")
+    return yaml.safe_load(data)
+
+
+def _merge_packs(packs):
+    """Merge packs into one ordered table; higher-priority packs are matched first"""
+    packs = sorted(packs, key=lambda item: -item[1].get("priority", 0))
+
+    names, patterns, responses, default_responses, routable = [], [], [], [], []
+    for path, pack in packs:
+        for intent in pack.get("intents", []):
+            pattern = intent["pattern"]
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f"Invalid pattern {pattern!r} in {path}: {e}")
+            if not intent.get("responses"):
+                raise ValueError(f"Intent {intent.get('name', pattern)!r} in {path} has no responses")
+            names.append(intent.get("name", pattern))
+            patterns.append(pattern)
+            responses.append(list(intent["responses"]))
+            routable.append(bool(intent.get("routable", True)))
+        # The highest-priority pack that defines fallbacks wins
+        if not default_responses:
+            default_responses = list(pack.get("default_responses", []))
+    return names, patterns, responses, default_responses, routable
+
+
+def default_cache_dir():
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "bot_for_homework", "intents")
+
+
+def pack_signature(pack_dir):
+    """(file name, mtime, size) of every pack; changes whenever a pack is edited, added or removed"""
+    signature = []
+    for path in list_pack_files(pack_dir):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        signature.append((os.path.basename(path), stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def build_intent_set(pack_dir=DEFAULT_INTENT_DIR, cache_dir=None):
+    """
+    Load every pack in pack_dir into an IntentSet.
+
+    The whole IntentSet, including the matcher's keyword trie, is pickled in
+    the user cache directory and validated against the pack files' mtimes and
+    sizes, so an unchanged set of packs loads without reading, parsing or
+    indexing any pack.
+    """
+    signature = pack_signature(pack_dir)
+    source_hash = hashlib.sha256(repr((CACHE_FORMAT, signature)).encode("utf-8")).hexdigest()
+
+    # One cache file per pack directory, replaced whenever its packs change
+    dir_key = hashlib.sha256(os.path.abspath(pack_dir).encode("utf-8")).hexdigest()[:16]
+    cache_dir = cache_dir or default_cache_dir()
+    cache_path = os.path.join(cache_dir, f"intents-{dir_key}.pickle")
+    try:
+        with open(cache_path, "rb") as f:
+            cached = pickle.load(f)
+        if isinstance(cached, IntentSet) and cached.source_hash == source_hash:
+            return cached
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, TypeError, ValueError):
+        # Missing, truncated or written by an incompatible version; rebuild it
+        pass
+
+    packs = [(path, load_pack(path)) for path in list_pack_files(pack_dir)]
+    names, patterns, responses, default_responses, routable = _merge_packs(packs)
+    intent_set = IntentSet(names, patterns, responses, default_responses, source_hash, routable)
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(intent_set, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+
+    return intent_set
+
+
+class IntentPackRegistry:
+    """
+    Holds the current IntentSet for a pack directory and hot-reloads it.
+
+    A watcher thread polls the pack files; when they change it builds a new
+    IntentSet off to the side and swaps it in with a single reference
+    assignment, so readers always see either the old or the new set.
+    """
+
+    def __init__(self, pack_dir=DEFAULT_INTENT_DIR, poll_interval=2.0):
+        self.pack_dir = pack_dir
+        self.poll_interval = poll_interval
+        self._signature = self._scan()
+        self.current = build_intent_set(pack_dir)
+        self._watcher = None
+
+    def _scan(self):
+        return pack_signature(self.pack_dir)
+
+    def reload_if_changed(self):
+        signature = self._scan()
+        if signature == self._signature:
+            return False
+        self._signature = signature
+        try:
+            self.current = build_intent_set(self.pack_dir)
+        except Exception as e:
+            # Keep serving the previous packs until the broken one is fixed
+            print(f"Failed to reload intent packs: {e}")
+            return False
+        return True
+
+    def start_watching(self):
+        if self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, name="IntentPackWatcher", daemon=True)
+        self._watcher.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            self.reload_if_changed()
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(pack_dir=DEFAULT_INTENT_DIR, hot_reload=True):
+    """Shared registry per pack directory, so all bots use one watcher"""
+    pack_dir = os.path.abspath(pack_dir)
+    with _registries_lock:
+        registry = _registries.get(pack_dir)
+        if registry is None:
+            registry = IntentPackRegistry(pack_dir)
+            _registries[pack_dir] = registry
+        if hot_reload:
+            registry.start_watching()
+        return registry
@@ -0,0 +1,130 @@
+import json
+import math
+import threading
+import time
+from collections import deque
+
+
+class RollingHistogram:
+    """保留最近window个样本的滚动直方图"""
+
+    def __init__(self, window=500):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def percentile(self, p):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        rank = max(1, math.ceil(p / 100 * len(ordered)))
+        return ordered[rank - 1]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "mean": sum(self.samples) / len(self.samples) if self.samples else 0.0,
+        }
+
+
+class MetricsRegistry:
+    """
+    进程内的请求指标注册表
+
+    每次API调用记录排队时间、首token时间、总延迟和token用量，
+    时间类指标保存在滚动直方图中，计数类指标累加。
+    """
+
+    TIMINGS = ("queue_ms", "ttft_ms", "latency_ms")
+    COUNTERS = ("requests", "errors", "cache_hits", "prompt_tokens", "completion_tokens", "cached_tokens")
+
+    def __init__(self, window=500):
+        self._lock = threading.Lock()
+        self.histograms = {name: RollingHistogram(window) for name in self.TIMINGS}
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.export_path = None
+
+    def record(self, queue_ms=None, ttft_ms=None, latency_ms=None, prompt_tokens=0, completion_tokens=0,
+               cached_tokens=0, cache_hit=False, error=None, **extra):
+        """记录一次请求"""
+        record = {
+            "ts": time.time(),
+            "queue_ms": queue_ms,
+            "ttft_ms": ttft_ms,
+            "latency_ms": latency_ms,
+            "prompt_tokens": prompt_tokens or 0,
+            "completion_tokens": completion_tokens or 0,
+            "cached_tokens": cached_tokens or 0,
+            "cache_hit": cache_hit,
+            "error": error,
+        }
+        record.update(extra)
+
+        with self._lock:
+            for name in self.TIMINGS:
+                if record[name] is not None:
+                    self.histograms[name].add(record[name])
+            self.counters["requests"] += 1
+            self.counters["errors"] += 1 if error else 0
+            self.counters["cache_hits"] += 1 if cache_hit else 0
+            self.counters["prompt_tokens"] += record["prompt_tokens"]
+            self.counters["completion_tokens"] += record["completion_tokens"]
+            self.counters["cached_tokens"] += record["cached_tokens"]
+
+            if self.export_path:
+                with open(self.export_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return record
+
+    def enable_export(self, path):
+        """之后的每条记录以JSON Lines格式追加到文件，便于离线分析"""
+        with self._lock:
+            self.export_path = path
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "timings": {name: h.summary() for name, h in self.histograms.items()},
+            }
+
+    def status_line(self):
+        """状态栏上的简短读数"""
+        snap = self.snapshot()
+        counters = snap["counters"]
+        if not counters["requests"]:
+            return "暂无API请求"
+        latency = snap["timings"]["latency_ms"]
+        ttft = snap["timings"]["ttft_ms"]
+        return (f"请求 {counters['requests']} | 延迟 p50 {latency['p50']:.0f}ms p99 {latency['p99']:.0f}ms"
+                f" | 首token p50 {ttft['p50']:.0f}ms"
+                f" | token {counters['prompt_tokens']}+{counters['completion_tokens']}")
+
+    def format_summary(self):
+        """/stats命令输出"""
+        snap = self.snapshot()
+        counters = snap["counters"]
+        lines = [
+            "请求统计:",
+            f"请求数: {counters['requests']}（错误 {counters['errors']}，缓存命中 {counters['cache_hits']}）",
+            f"token: 输入 {counters['prompt_tokens']}（缓存 {counters['cached_tokens']}），"
+            f"输出 {counters['completion_tokens']}",
+        ]
+        labels = {"queue_ms": "排队时间", "ttft_ms": "首token时间", "latency_ms": "总延迟"}
+        for name in self.TIMINGS:
+            h = snap["timings"][name]
+            lines.append(f"{labels[name]}: p50 {h['p50']:.0f}ms，p90 {h['p90']:.0f}ms，"
+                         f"p99 {h['p99']:.0f}ms（样本 {h['count']}）")
+        return "\n".join(lines)
+
+
+# 进程内共享的注册表
+registry = MetricsRegistry()
@@ -0,0 +1,230 @@
+import datetime
+import sqlite3
+import time
+
+import passwords
+
+
+# (version, description, function(conn)) in ascending version order
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def register(fn):
+        if MIGRATIONS and MIGRATIONS[-1][0] >= version:
+            raise ValueError(f"Migration {version} registered out of order")
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+
+def current_version(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at REAL NOT NULL
+    )
+    ''')
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(connections):
+    """
+    Apply pending migrations in one write transaction.
+
+    BEGIN IMMEDIATE serializes concurrent startups: the second process waits,
+    then sees the new version and has nothing left to do.
+    """
+    if getattr(connections, "migrated", False):
+        return
+    with connections.transaction() as conn:
+        version = current_version(conn)
+        for target, description, fn in MIGRATIONS:
+            if target <= version:
+                continue
+            fn(conn)
+            conn.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (target, description, time.time())
+            )
+    connections.migrated = True
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _drop_column(conn, table, column):
+    # DROP COLUMN needs SQLite 3.35; older builds just keep the unused column
+    if sqlite3.sqlite_version_info >= (3, 35, 0) and column in _columns(conn, table):
+        conn.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+
+
+@migration(1, "baseline users, conversations and messages tables")
+def _baseline(conn):
+    # IF NOT EXISTS adopts databases created before migrations existed
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        api_key TEXT,
+        reset_token TEXT,
+        reset_token_expiry TEXT
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS conversations (
+        id TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        mode TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        message_count INTEGER NOT NULL DEFAULT 0,
+        archived INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_conversations_user
+    ON conversations (user_id, archived, created_at)
+    ''')
+
+    # Append-only message log
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        conversation_id TEXT NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        created_at REAL NOT NULL
+    )
+    ''')
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_messages_conversation
+    ON messages (conversation_id, id)
+    ''')
+
+
+@migration(2, "integer reset token expiry and reset token index")
+def _reset_token_index(conn):
+    conn.execute("ALTER TABLE users ADD COLUMN reset_token_expires_at INTEGER")
+
+    # Carry over outstanding tokens from the ISO-8601 text column
+    rows = conn.execute(
+        "SELECT id, reset_token_expiry FROM users WHERE reset_token IS NOT NULL"
+    ).fetchall()
+    for user_id, expiry in rows:
+        try:
+            expires_at = int(datetime.datetime.fromisoformat(expiry).timestamp())
+        except (TypeError, ValueError):
+            expires_at = 0
+        conn.execute(
+            "UPDATE users SET reset_token_expires_at = ? WHERE id = ?",
+            (expires_at, user_id)
+        )
+    _drop_column(conn, "users", "reset_token_expiry")
+
+    # Partial index: only the few users with an outstanding token are indexed.
+    # username and email already have indexes through their UNIQUE constraints.
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_users_reset_token
+    ON users (reset_token) WHERE reset_token IS NOT NULL
+    ''')
+
+
+@migration(3, "dedicated password reset token table")
+def _reset_token_table(conn):
+    # Only hashes are stored, so a leaked database can't be used to reset passwords
+    conn.execute('''
+    CREATE TABLE password_reset_tokens (
+        token_hash TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        expires_at INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX idx_reset_tokens_expires ON password_reset_tokens (expires_at)")
+    conn.execute("CREATE INDEX idx_reset_tokens_user ON password_reset_tokens (user_id)")
+
+    now = int(time.time())
+    rows = conn.execute(
+        "SELECT id, reset_token, reset_token_expires_at FROM users "
+        "WHERE reset_token IS NOT NULL AND reset_token_expires_at > ?",
+        (now,)
+    ).fetchall()
+    conn.executemany(
+        "INSERT OR IGNORE INTO password_reset_tokens (token_hash, user_id, expires_at) VALUES (?, ?, ?)",
+        [(passwords.hash_token(token), user_id, expires_at) for user_id, token, expires_at in rows]
+    )
+
+    conn.execute("DROP INDEX IF EXISTS idx_users_reset_token")
+    conn.execute("UPDATE users SET reset_token = NULL, reset_token_expires_at = NULL")
+    _drop_column(conn, "users", "reset_token")
+    _drop_column(conn, "users", "reset_token_expires_at")
+
+
+@migration(4, "usage ledger and daily rollups")
+def _usage_ledger(conn):
+    # Raw events for auditing and billing disputes
+    conn.execute('''
+    CREATE TABLE usage_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        model TEXT,
+        prompt_tokens INTEGER NOT NULL,
+        completion_tokens INTEGER NOT NULL,
+        latency_ms REAL NOT NULL,
+        cache_hit INTEGER NOT NULL,
+        error INTEGER NOT NULL
+    )
+    ''')
+    conn.execute("CREATE INDEX idx_usage_events_user ON usage_events (user_id, created_at)")
+
+    # One row per user and UTC day, kept up to date on every flush
+    conn.execute('''
+    CREATE TABLE usage_daily (
+        user_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        requests INTEGER NOT NULL,
+        errors INTEGER NOT NULL,
+        cache_hits INTEGER NOT NULL,
+        prompt_tokens INTEGER NOT NULL,
+        completion_tokens INTEGER NOT NULL,
+        latency_ms REAL NOT NULL,
+        PRIMARY KEY (user_id, day)
+    ) WITHOUT ROWID
+    ''')
+
+
+@migration(5, "full-text index over messages")
+def _messages_fts(conn):
+    # trigram (SQLite 3.34+) matches substrings, which also works for Chinese
+    # text without word boundaries; unicode61 is the fallback on older builds
+    for tokenizer in ("trigram", "unicode61"):
+        try:
+            conn.execute(f'''
+            CREATE VIRTUAL TABLE messages_fts USING fts5(
+                content, content='messages', content_rowid='id', tokenize='{tokenizer}'
+            )
+            ''')
+            break
+        except sqlite3.OperationalError:
+            continue
+
+    # External-content index: the text lives only in messages, the triggers keep the index in step
+    conn.execute('''
+    CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END
+    ''')
+    conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
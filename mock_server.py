@@ -0,0 +1,186 @@
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockConfig:
+    """
+    模拟服务器的行为参数
+
+    参数:
+        latency: 首个字节返回前的延迟秒数
+        token_rate: 每秒生成的token数（0表示不限速）
+        response_tokens: 每个回复的token数（受请求的max_tokens限制）
+        error_rate: 随机返回错误的概率
+        error_status: 注入错误时的HTTP状态码
+        retry_after: 注入429/503错误时返回的Retry-After秒数
+    """
+
+    def __init__(self, latency=0.05, token_rate=200.0, response_tokens=64,
+                 error_rate=0.0, error_status=503, retry_after=None):
+        self.latency = latency
+        self.token_rate = token_rate
+        self.response_tokens = response_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 头和正文分两次写出，不关闭Nagle算法会叠加约40ms的延迟确认
+    disable_nagle_algorithm = True
+    config = MockConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if self.path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "invalid json", "type": "invalid_request_error"}})
+            return
+
+        config = self.config
+        time.sleep(config.latency)
+
+        if config.error_rate and random.random() < config.error_rate:
+            headers = {}
+            if config.retry_after is not None:
+                headers["Retry-After"] = str(config.retry_after)
+            self._send_json(config.error_status,
+                            {"error": {"message": "injected error", "type": "server_error"}}, headers)
+            return
+
+        n_tokens = min(config.response_tokens, body.get("max_tokens") or config.response_tokens)
+        prompt_tokens = sum(len((m.get("content") or "").split()) + 4 for m in body.get("messages", []))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = body.get("model", "deepseek-chat")
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": n_tokens,
+            "total_tokens": prompt_tokens + n_tokens,
+        }
+
+        if body.get("stream"):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            self._stream(completion_id, model, n_tokens, usage if include_usage else None)
+            return
+
+        self._pace(n_tokens)
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "token " * n_tokens},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        })
+
+    def _pace(self, n_tokens):
+        if self.config.token_rate:
+            time.sleep(n_tokens / self.config.token_rate)
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _write_event(self, payload):
+        self._write_chunk(b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n")
+
+    def _stream(self, completion_id, model, n_tokens, usage):
+        """以SSE格式逐token返回"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(delta, finish_reason=None):
+            return {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+
+        interval = 1.0 / self.config.token_rate if self.config.token_rate else 0
+        self._write_event(event({"role": "assistant", "content": ""}))
+        for _ in range(n_tokens):
+            if interval:
+                time.sleep(interval)
+            self._write_event(event({"content": "token "}))
+        self._write_event(event({}, "stop"))
+        if usage is not None:
+            final = event({})
+            final["choices"] = []
+            final["usage"] = usage
+            self._write_event(final)
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+
+def start_mock_server(host="127.0.0.1", port=0, config=None):
+    """在后台线程启动模拟服务器，返回(server, base_url)"""
+    handler = type("ConfiguredMockHandler", (MockHandler,), {"config": config or MockConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟的Deepseek兼容接口")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8008)
+    parser.add_argument("--latency", type=float, default=0.05, help="首字节延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="每秒生成token数，0为不限速")
+    parser.add_argument("--tokens", type=int, default=64, help="每个回复的token数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机错误概率")
+    parser.add_argument("--error-status", type=int, default=503, help="注入错误的状态码")
+    parser.add_argument("--retry-after", type=float, default=None, help="错误响应的Retry-After秒数")
+    args = parser.parse_args()
+
+    config = MockConfig(args.latency, args.token_rate, args.tokens,
+                        args.error_rate, args.error_status, args.retry_after)
+    handler = type("ConfiguredMockHandler", (MockHandler,), {"config": config})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    print(f"模拟服务器已启动: http://{args.host}:{args.port}/v1 （设置DEEPSEEK_BASE_URL即可使用）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import base64
+import hashlib
+import hmac
+import os
+import re
+
+
+# Cost presets; the hash stores its own parameters, so changing the default
+# only affects new hashes and rehashes on the next successful login
+COSTS = {
+    "interactive": {"algorithm": "scrypt", "n": 2 ** 14, "r": 8, "p": 1},
+    "strong": {"algorithm": "scrypt", "n": 2 ** 15, "r": 8, "p": 1},
+    "pbkdf2": {"algorithm": "pbkdf2_sha256", "iterations": 600000},
+    # Cheap enough to provision thousands of accounts at once; upgraded on first login
+    "bulk": {"algorithm": "scrypt", "n": 2 ** 8, "r": 8, "p": 1},
+}
+DEFAULT_COST = "interactive"
+
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+LEGACY_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode("ascii").rstrip("=")
+
+
+def _b64decode(text):
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _resolve_cost(cost):
+    if cost is None:
+        cost = DEFAULT_COST
+    if isinstance(cost, str):
+        cost = COSTS[cost]
+    # Fall back to PBKDF2 on OpenSSL builds without scrypt
+    if cost["algorithm"] == "scrypt" and not hasattr(hashlib, "scrypt"):
+        cost = COSTS["pbkdf2"]
+    return cost
+
+
+def _derive(password, salt, params):
+    if params["algorithm"] == "scrypt":
+        n, r, p = params["n"], params["r"], params["p"]
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r + 1024 * 1024, dklen=KEY_BYTES)
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, params["iterations"], dklen=KEY_BYTES)
+
+
+def _encode(params, salt, key):
+    if params["algorithm"] == "scrypt":
+        prefix = f"scrypt${params['n']}${params['r']}${params['p']}"
+    else:
+        prefix = f"pbkdf2_sha256${params['iterations']}"
+    return f"{prefix}${_b64encode(salt)}${_b64encode(key)}"
+
+
+def _decode(stored):
+    parts = stored.split("$")
+    if parts[0] == "scrypt" and len(parts) == 6:
+        params = {"algorithm": "scrypt", "n": int(parts[1]), "r": int(parts[2]), "p": int(parts[3])}
+    elif parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+        params = {"algorithm": "pbkdf2_sha256", "iterations": int(parts[1])}
+    else:
+        raise ValueError("Unknown password hash format")
+    return params, _b64decode(parts[-2]), _b64decode(parts[-1])
+
+
+def hash_password(password, cost=None):
+    """Salted KDF hash encoded with its algorithm and cost, e.g. scrypt$16384$8$1$salt$key"""
+    params = _resolve_cost(cost)
+    salt = os.urandom(SALT_BYTES)
+    return _encode(params, salt, _derive(password, salt, params))
+
+
+def verify_password(password, stored):
+    """Check a password against a stored hash, including legacy unsalted SHA-256 hashes"""
+    if not stored:
+        return False
+    if LEGACY_SHA256.match(stored):
+        candidate = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(candidate, stored)
+    try:
+        params, salt, key = _decode(stored)
+    except ValueError:
+        return False
+    return hmac.compare_digest(_derive(password, salt, params), key)
+
+
+def is_valid_hash(stored):
+    """True if stored is a hash this module can verify, e.g. one exported from another database"""
+    if LEGACY_SHA256.match(stored or ""):
+        return True
+    try:
+        params, salt, key = _decode(stored or "")
+    except (ValueError, TypeError):  # binascii.Error is a ValueError
+        return False
+    if params["algorithm"] == "scrypt":
+        n, r, p = params["n"], params["r"], params["p"]
+        valid_params = n > 1 and n & (n - 1) == 0 and r > 0 and p > 0
+    else:
+        valid_params = params["iterations"] > 0
+    return valid_params and bool(salt) and len(key) == KEY_BYTES
+
+
+def needs_rehash(stored, cost=None):
+    """True for legacy hashes and hashes made with different cost parameters"""
+    if LEGACY_SHA256.match(stored or ""):
+        return True
+    try:
+        params, _salt, _key = _decode(stored)
+    except ValueError:
+        return True
+    return params != _resolve_cost(cost)
+
+
+def hash_token(token):
+    """Reset tokens are long and random, so a fast unsalted hash is enough to keep them out of the database"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+# Verified for unknown usernames so a failed lookup costs as much as a wrong password
+_DUMMY_HASHES = {}
+
+
+def dummy_verify(password, cost=None):
+    params = _resolve_cost(cost)
+    key = tuple(sorted(params.items()))
+    if key not in _DUMMY_HASHES:
+        _DUMMY_HASHES[key] = hash_password("", params)
+    verify_password(password, _DUMMY_HASHES[key])
@@ -0,0 +1,209 @@
+import http.client
+import json
+import threading
+from urllib.parse import urlsplit
+
+
+class RemoteError(Exception):
+    pass
+
+
+class RemoteClient:
+    """
+    聊天服务(server.py)的客户端，接口与UserDatabase一致，供界面在瘦客户端模式下使用
+
+    每个线程复用一条keep-alive连接。登录令牌过期或服务器重启后（401），用上次登录的
+    凭据自动重新登录一次。密码重置需要在服务器上操作，这里不支持。
+
+    参数:
+        base_url: 服务地址，例如 http://127.0.0.1:8080
+        timeout: 请求超时秒数
+    """
+
+    def __init__(self, base_url, timeout=120.0):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme or "http"
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port
+        self.timeout = timeout
+        self.token = None
+        self._credentials = None
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+            conn = cls(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _reset_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def request(self, method, path, payload=None):
+        """发送请求并返回HTTP响应对象；令牌失效时重新登录后重发一次"""
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else None
+        response = self._send(method, path, body)
+        if response.status == 401 and self._credentials and path != "/api/login":
+            response.read()
+            if self.authenticate(*self._credentials):
+                response = self._send(method, path, body)
+        return response
+
+    def _send(self, method, path, body):
+        """发送一次请求；复用的连接已被服务器关闭时重连一次"""
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                return conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self._reset_connection()
+                if attempt:
+                    raise
+            except OSError:
+                self._reset_connection()
+                raise
+
+    def call(self, method, path, payload=None):
+        """发送请求并解析JSON结果，非2xx状态抛出RemoteError"""
+        response = self.request(method, path, payload)
+        data = json.loads(response.read() or b"{}")
+        if response.status >= 300:
+            raise RemoteError(data.get("error") or f"HTTP {response.status}")
+        return data
+
+    # ---- 与UserDatabase相同的接口 ----
+
+    def authenticate(self, username, password):
+        try:
+            data = self.call("POST", "/api/login", {"username": username, "password": password})
+        except RemoteError:
+            return None
+        self.token = data["token"]
+        self._credentials = (username, password)
+        return data["user"]
+
+    def register_user(self, username, password, email, api_key=""):
+        try:
+            self.call("POST", "/api/register",
+                      {"username": username, "password": password, "email": email, "api_key": api_key})
+        except RemoteError:
+            return False
+        return True
+
+    def update_api_key(self, username, api_key):
+        self.call("POST", "/api/api_key", {"api_key": api_key})
+
+    def generate_reset_token(self, email):
+        return None
+
+    def reset_password(self, token, new_password):
+        return False
+
+    def create_bot(self):
+        return RemoteBot(self)
+
+
+class RemoteBot:
+    """
+    服务器上一个对话的代理，提供与本地机器人相同的get_response/stream_response
+
+    对话在第一次发送消息时才在服务器上创建；恢复的历史消息随第一条消息一起发送，
+    服务器确认收到后才清空。服务器上的对话丢失（404，例如服务重启）时重建对话并补发
+    全部历史。
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.chat_id = None
+        self.pending_history = []
+        self.history = []  # 服务器已确认的上下文，重建对话时补发
+        self._lock = threading.Lock()
+
+    def add_message(self, role, content):
+        self.pending_history.append({"role": role, "content": content})
+
+    def _send(self, user_input, stream):
+        """发送消息，返回状态为2xx的HTTP响应"""
+        for attempt in range(2):
+            if self.chat_id is None:
+                self.chat_id = self.client.call("POST", "/api/chats")["chat_id"]
+            payload = {"message": user_input, "stream": stream}
+            if self.pending_history:
+                payload["history"] = self.pending_history
+            response = self.client.request("POST", f"/api/chats/{self.chat_id}/messages", payload)
+
+            if response.status == 404 and not attempt:
+                response.read()
+                self.chat_id = None
+                self.pending_history, self.history = self.history + self.pending_history, []
+                continue
+            if response.status >= 300:
+                data = json.loads(response.read() or b"{}")
+                raise RemoteError(data.get("error") or f"HTTP {response.status}")
+
+            self.history.extend(self.pending_history)
+            self.pending_history = []
+            return response
+
+    def _remember_turn(self, user_input, reply):
+        self.history.append({"role": "user", "content": user_input})
+        self.history.append({"role": "assistant", "content": reply})
+
+    def get_response(self, user_input, **kwargs):
+        with self._lock:
+            response = self._send(user_input, False)
+            reply = json.loads(response.read())["response"]
+            self._remember_turn(user_input, reply)
+            return reply
+
+    def stream_response(self, user_input, **kwargs):
+        with self._lock:
+            response = self._send(user_input, True)
+            chunks = []
+            for event, data in iter_events(response):
+                if event == "delta":
+                    chunks.append(data["content"])
+                    yield data["content"]
+                elif event == "error":
+                    raise RemoteError(data["error"])
+                elif event == "done":
+                    self._remember_turn(user_input, data.get("response", "".join(chunks)))
+                    break
+            # 读完剩余的结束块，连接才能复用
+            response.read()
+
+    def close(self):
+        if self.chat_id is not None:
+            try:
+                self.client.call("DELETE", f"/api/chats/{self.chat_id}")
+            except (RemoteError, OSError):
+                pass
+            self.chat_id = None
+
+
+def iter_events(response):
+    """把SSE响应解析为(事件名, JSON数据)"""
+    event, data = "message", []
+    while True:
+        line = response.readline()
+        if not line:
+            return
+        line = line.decode("utf-8").rstrip("\r\n")
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].lstrip())
@@ -0,0 +1,269 @@
+import asyncio
+import email.utils
+import random
+import threading
+import time
+
+import openai
+
+
+# 值得重试的HTTP状态码
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求被直接拒绝"""
+
+    def __init__(self, name, retry_in):
+        super().__init__(f"{name} 暂时不可用，{retry_in:.0f}秒后重试")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class DeadlineExceeded(Exception):
+    """重试总时长超出截止时间"""
+
+
+def is_retryable(exc):
+    """判断异常是否为可重试的临时错误（限流、服务端错误、网络错误）"""
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    return isinstance(exc, (openai.APIConnectionError, TimeoutError, ConnectionError))
+
+
+def retry_after(exc):
+    """从响应头中读取服务端建议的等待秒数"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class RetryPolicy:
+    """
+    重试策略：带抖动的指数退避，单次请求超时和总截止时间
+
+    参数:
+        max_attempts: 最多尝试次数
+        base_delay: 第一次重试前的基础等待秒数
+        max_delay: 单次退避等待的上限（不限制服务端Retry-After给出的等待）
+        attempt_timeout: 单次请求的超时秒数
+        deadline: 包含重试在内的总时长上限
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=8.0, attempt_timeout=60.0, deadline=120.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+
+    def backoff(self, attempt, exc=None):
+        """
+        第attempt次失败后的等待时间（full jitter）
+
+        服务端给出Retry-After时原样等待（负值按0处理），提前重试多半会再次被限流并计入熔断器；
+        等待超出截止时间时由调用方放弃重试
+        """
+        suggested = retry_after(exc) if exc is not None else None
+        if suggested is not None:
+            return max(0.0, suggested)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    熔断器：连续失败达到阈值后打开，冷却期内直接拒绝请求，
+    冷却结束后放行一个试探请求（半开状态）
+
+    参数:
+        name: 名称，用于错误信息
+        failure_threshold: 打开熔断器所需的连续失败次数
+        reset_timeout: 打开后的冷却秒数
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """请求前检查，熔断器打开时抛出CircuitOpenError"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            elapsed = time.monotonic() - self.opened_at
+            if self.state == self.OPEN and elapsed >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return
+            raise CircuitOpenError(self.name, max(0.0, self.reset_timeout - elapsed))
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_inconclusive(self):
+        """
+        请求结束但不能说明端点是否健康（如参数错误、调用方中途放弃）时调用
+
+        不改变失败计数；半开状态下恢复为打开，下一个请求可以立即再次试探
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name, **options):
+    """获取进程内共享的熔断器，同一端点的所有机器人共用一个"""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name, **options)
+            _breakers[name] = breaker
+        return breaker
+
+
+def guard_stream(stream, breaker):
+    """
+    逐块转发流式响应，流结束时才把结果计入熔断器
+
+    读完算成功，中途出现可重试的错误算失败；调用方提前关闭时关闭底层响应，不计入结果
+    """
+    try:
+        yield from stream
+    except GeneratorExit:
+        breaker.record_inconclusive()
+        if hasattr(stream, "close"):
+            stream.close()
+        raise
+    except Exception as e:
+        if is_retryable(e):
+            breaker.record_failure()
+        else:
+            breaker.record_inconclusive()
+        raise
+    breaker.record_success()
+
+
+def call_with_retry(fn, policy, breaker=None, stream=False):
+    """
+    按重试策略调用fn(timeout)，timeout为本次尝试可用的秒数
+
+    不可重试的错误立即抛出，不改变熔断器状态；可重试的错误计入熔断器并在退避后重试。
+    stream为True时fn返回流式响应，只有建立连接的过程会重试，结果在流读完时才计入熔断器。
+    """
+    start = time.monotonic()
+    attempt = 0
+    while True:
+        if breaker is not None:
+            breaker.before_call()
+
+        remaining = policy.deadline - (time.monotonic() - start)
+        if remaining <= 0:
+            raise DeadlineExceeded(f"请求超出截止时间（{policy.deadline:.0f}秒）")
+
+        try:
+            result = fn(min(policy.attempt_timeout, remaining))
+        except Exception as e:
+            if not is_retryable(e):
+                # 端点给出了明确答复（如参数错误、密钥无效），既不算故障也不能证明端点已恢复
+                if breaker is not None:
+                    breaker.record_inconclusive()
+                raise
+            if breaker is not None:
+                breaker.record_failure()
+            attempt += 1
+            if attempt >= policy.max_attempts:
+                raise
+            delay = policy.backoff(attempt - 1, e)
+            if time.monotonic() - start + delay >= policy.deadline:
+                raise
+            time.sleep(delay)
+        else:
+            if breaker is None:
+                return result
+            if stream:
+                return guard_stream(result, breaker)
+            breaker.record_success()
+            return result
+
+
+async def async_call_with_retry(fn, policy, breaker=None):
+    """call_with_retry的异步版本，fn(timeout)返回awaitable"""
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    attempt = 0
+    while True:
+        if breaker is not None:
+            breaker.before_call()
+
+        remaining = policy.deadline - (loop.time() - start)
+        if remaining <= 0:
+            raise DeadlineExceeded(f"请求超出截止时间（{policy.deadline:.0f}秒）")
+
+        try:
+            result = await fn(min(policy.attempt_timeout, remaining))
+        except Exception as e:
+            if not is_retryable(e):
+                if breaker is not None:
+                    breaker.record_inconclusive()
+                raise
+            if breaker is not None:
+                breaker.record_failure()
+            attempt += 1
+            if attempt >= policy.max_attempts:
+                raise
+            delay = policy.backoff(attempt - 1, e)
+            if loop.time() - start + delay >= policy.deadline:
+                raise
+            await asyncio.sleep(delay)
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            return result
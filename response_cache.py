@@ -0,0 +1,148 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+# 与user_database.db放在同一目录
+DEFAULT_CACHE_PATH = "response_cache.db"
+
+
+def make_cache_key(model, temperature, max_tokens, messages):
+    """根据模型参数和规范化后的消息列表计算缓存键"""
+    normalized = [
+        [message["role"], " ".join((message.get("content") or "").split())]
+        for message in messages
+    ]
+    payload = json.dumps(
+        [model, float(temperature), max_tokens, normalized],
+        ensure_ascii=False, separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    两级响应缓存：内存LRU + SQLite持久化
+
+    参数:
+        path: SQLite缓存文件路径（None则只使用内存）
+        max_entries: 内存中最多缓存的条目数
+        max_bytes: 内存缓存的总字节上限
+        ttl: 缓存条目的有效秒数
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=512, max_bytes=8 * 1024 * 1024, ttl=24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._memory = OrderedDict()  # key -> (expires_at, value, size)
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            ''')
+            self._conn.commit()
+
+    def get(self, key, count=True):
+        """查找缓存，未命中返回None；count为False时不计入命中统计"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1 if count else 0
+                    return entry[1]
+                self._evict(key)
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row and row[1] > now:
+                    self._remember(key, row[0], row[1])
+                    if count:
+                        self.hits += 1
+                        self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1 if count else 0
+            return None
+
+    def put(self, key, value):
+        """写入缓存"""
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, value, expires_at)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at)
+                )
+                self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+                self._conn.commit()
+
+    def _remember(self, key, value, expires_at):
+        if key in self._memory:
+            self._evict(key)
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        self._memory[key] = (expires_at, value, size)
+        self._memory_bytes += size
+        while len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes:
+            self._evict(next(iter(self._memory)))
+
+    def _evict(self, key):
+        self._memory_bytes -= self._memory.pop(key)[2]
+
+    def clear(self):
+        """清空两级缓存"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM responses")
+                self._conn.commit()
+
+    def stats(self):
+        """命中/未命中统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._memory),
+                "bytes": self._memory_bytes,
+            }
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_default_cache():
+    """进程内共享的默认缓存"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
@@ -0,0 +1,126 @@
+import threading
+from collections import Counter, deque
+
+
+class RoutingStats:
+    """记录路由决策，用于统计各层命中率和调整置信度阈值"""
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self.counts = Counter()
+        self.decisions = deque(maxlen=window)  # (tier, confidence)
+
+    def record(self, tier, confidence):
+        with self._lock:
+            self.counts[tier] += 1
+            self.decisions.append((tier, confidence))
+
+    def snapshot(self):
+        with self._lock:
+            total = sum(self.counts.values())
+            # 按置信度分桶，看阈值附近有多少请求被升级到远端
+            buckets = Counter()
+            for tier, confidence in self.decisions:
+                if confidence is not None:
+                    bucket = min(int(confidence * 10), 9) / 10
+                    buckets[(bucket, tier == "remote")] += 1
+            return {
+                "total": total,
+                "counts": dict(self.counts),
+                "hit_rates": {tier: n / total for tier, n in self.counts.items()} if total else {},
+                "buckets": buckets,
+            }
+
+    def format_summary(self, threshold):
+        snap = self.snapshot()
+        if not snap["total"]:
+            return "暂无路由记录。"
+        labels = {"intent": "本地意图", "faq": "FAQ检索", "cache": "缓存", "remote": "Deepseek"}
+        lines = [f"路由统计（阈值 {threshold:.2f}，共 {snap['total']} 条）:"]
+        for tier, rate in sorted(snap["hit_rates"].items(), key=lambda item: -item[1]):
+            lines.append(f"{labels.get(tier, tier)}: {snap['counts'][tier]}（{rate:.0%}）")
+        lines.append("本地置信度分布（本地回答/升级）:")
+        for i in range(10):
+            bucket = i / 10
+            local = snap["buckets"].get((bucket, False), 0)
+            remote = snap["buckets"].get((bucket, True), 0)
+            if local or remote:
+                lines.append(f"  {bucket:.1f}-{bucket + 0.1:.1f}: {local}/{remote}")
+        return "\n".join(lines)
+
+
+# 进程内共享的路由统计
+routing_stats = RoutingStats()
+
+
+class TieredRouter:
+    """
+    分层路由：先尝试本地快速路径（SimpleBot意图、FAQ检索、响应缓存），
+    本地置信度低于阈值时才调用Deepseek API
+
+    参数:
+        local: 本地机器人，需提供classify()（SimpleBot）
+        remote: 远端机器人（DS_Bot）
+        threshold: 本地回答所需的最低置信度
+        stats: 路由统计（默认进程内共享）
+    """
+
+    def __init__(self, local, remote, threshold=0.6, stats=None):
+        self.local = local
+        self.remote = remote
+        self.threshold = threshold
+        self.stats = stats or routing_stats
+
+    def route(self, user_input):
+        """返回(层级, 本地回答或None, 本地置信度)"""
+        # 已缓存的问题直接交给远端机器人，由其从缓存返回
+        if self.remote.peek_cache(user_input) is not None:
+            return "cache", None, None
+
+        local = self.local.classify(user_input)
+        if local is not None:
+            response, confidence, source = local
+            if confidence >= self.threshold:
+                return source, response, confidence
+            return "remote", None, confidence
+        return "remote", None, None
+
+    def _answer_locally(self, user_input, response):
+        # 本地回答也写入远端机器人的历史，保持上下文连贯
+        self.remote.add_message("user", user_input)
+        self.remote.add_message("assistant", response)
+        return response
+
+    def add_message(self, role, content):
+        self.remote.add_message(role, content)
+
+    def handle_command(self, command):
+        cmd = command.lower().strip()
+        if cmd == "/route":
+            return self.stats.format_summary(self.threshold)
+        response = self.remote.handle_command(command)
+        if cmd == "/help":
+            response += "\n/route - 显示本地/远端路由统计"
+        return response
+
+    def get_response(self, user_input, **kwargs):
+        if user_input.startswith("/"):
+            return self.handle_command(user_input)
+
+        tier, response, confidence = self.route(user_input)
+        self.stats.record(tier, confidence)
+        if response is not None:
+            return self._answer_locally(user_input, response)
+        return self.remote.get_response(user_input, **kwargs)
+
+    def stream_response(self, user_input, **kwargs):
+        if user_input.startswith("/"):
+            yield self.handle_command(user_input)
+            return
+
+        tier, response, confidence = self.route(user_input)
+        self.stats.record(tier, confidence)
+        if response is not None:
+            yield self._answer_locally(user_input, response)
+            return
+        yield from self.remote.stream_response(user_input, **kwargs)
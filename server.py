@@ -0,0 +1,432 @@
+import argparse
+import asyncio
+import json
+import re
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import metrics
+from database import UserDatabase
+from DS_bot import DS_Bot
+from router import TieredRouter
+from simple_bot import SimpleBot
+from usage_ledger import get_ledger
+
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+
+CHAT_PATH = re.compile(r"^/api/chats/([0-9a-f]{32})(/messages)?$")
+CONTENT_LENGTH = re.compile(r"^[0-9]{1,12}$")
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+class Request:
+    def __init__(self, method, path, headers, body):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        if not self.body:
+            return {}
+        try:
+            data = json.loads(self.body)
+        except ValueError:
+            raise HTTPError(400, "请求体不是有效的JSON")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "请求体必须是JSON对象")
+        return data
+
+    @property
+    def keep_alive(self):
+        return self.headers.get("connection", "").lower() != "close"
+
+
+class ChatSession:
+    """一个对话的机器人状态，同一对话的请求按顺序执行"""
+
+    def __init__(self, user_id, bot):
+        self.user_id = user_id
+        self.bot = bot
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+
+class ChatServer:
+    """
+    无界面的多用户聊天服务（HTTP + SSE流式输出）
+
+    连接由asyncio处理，空闲连接几乎不占资源；阻塞的机器人调用和数据库操作
+    放到线程池中执行。
+
+    参数:
+        db: UserDatabase，用于登录认证
+        worker_threads: 执行机器人调用的线程数
+        per_user_limit: 每个用户同时进行的请求数上限，超出返回429
+        idle_timeout: keep-alive连接的空闲超时秒数
+        session_ttl: 登录令牌和对话的闲置过期秒数
+    """
+
+    def __init__(self, db=None, worker_threads=64, per_user_limit=2, idle_timeout=300.0, session_ttl=24 * 3600):
+        self.db = db or UserDatabase()
+        self.executor = ThreadPoolExecutor(max_workers=worker_threads, thread_name_prefix="chat-worker")
+        self.per_user_limit = per_user_limit
+        self.idle_timeout = idle_timeout
+        self.session_ttl = session_ttl
+
+        self.tokens = {}      # token -> {"user": user_data, "last_used": t}
+        self.chats = {}       # chat_id -> ChatSession
+        self.in_flight = {}   # user_id -> 当前请求数
+
+    async def run_blocking(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    # ---- 连接处理 ----
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.idle_timeout)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self.send_json(writer, 431, {"error": "请求头过大"}, keep_alive=False)
+                    break
+
+                try:
+                    request = await self.read_request(head, reader)
+                except HTTPError as e:
+                    await self.send_json(writer, e.status, {"error": e.message}, keep_alive=False)
+                    break
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                try:
+                    await self.dispatch(request, writer)
+                except HTTPError as e:
+                    await self.send_json(writer, e.status, {"error": e.message}, e.headers, request.keep_alive)
+                except ConnectionError:
+                    break
+                except Exception as e:
+                    await self.send_json(writer, 500, {"error": str(e)}, keep_alive=False)
+                    break
+
+                if not request.keep_alive:
+                    break
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def read_request(self, head, reader):
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, path, _version = lines[0].split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "无效的请求行")
+
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        value = headers.get("content-length") or "0"
+        if not CONTENT_LENGTH.match(value):
+            raise HTTPError(400, "无效的Content-Length")
+        length = int(value)
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, "请求体过大")
+        body = await reader.readexactly(length) if length else b""
+        return Request(method.upper(), path.split("?", 1)[0], headers, body)
+
+    async def send_json(self, writer, status, payload, headers=None, keep_alive=True):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = [
+            f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+            "Content-Type: application/json; charset=utf-8",
+            f"Content-Length: {len(data)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        head += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+        await writer.drain()
+
+    # ---- 路由 ----
+
+    async def dispatch(self, request, writer):
+        method, path = request.method, request.path
+
+        if method == "GET" and path == "/health":
+            return await self.send_json(writer, 200, {"status": "ok"})
+        if method == "POST" and path == "/api/login":
+            return await self.login(request, writer)
+        if method == "POST" and path == "/api/register":
+            return await self.register(request, writer)
+
+        user = self.authenticate_request(request)
+
+        if method == "POST" and path == "/api/api_key":
+            return await self.update_api_key(user, request, writer)
+        if method == "GET" and path == "/api/stats":
+            return await self.send_json(writer, 200, metrics.registry.snapshot())
+        if method == "GET" and path == "/api/usage":
+            usage = await self.run_blocking(get_ledger(self.db.db_path).usage_for_day, user["id"])
+            return await self.send_json(writer, 200, usage)
+        if method == "POST" and path == "/api/chats":
+            return await self.create_chat(user, writer)
+
+        match = CHAT_PATH.match(path)
+        if match:
+            chat = self.chats.get(match.group(1))
+            if chat is None or chat.user_id != user["id"]:
+                raise HTTPError(404, "对话不存在")
+            if method == "DELETE" and not match.group(2):
+                del self.chats[match.group(1)]
+                return await self.send_json(writer, 200, {"deleted": True})
+            if method == "POST" and match.group(2):
+                return await self.send_message(user, chat, request, writer)
+
+        raise HTTPError(404, "未找到")
+
+    def authenticate_request(self, request):
+        auth = request.headers.get("authorization", "")
+        token = auth[7:] if auth.lower().startswith("bearer ") else ""
+        session = self.tokens.get(token)
+        if session is None:
+            raise HTTPError(401, "未登录或登录已过期")
+        session["last_used"] = time.monotonic()
+        return session["user"]
+
+    # ---- 接口 ----
+
+    async def login(self, request, writer):
+        data = request.json()
+        user = await self.run_blocking(self.db.authenticate, data.get("username", ""), data.get("password", ""))
+        if not user:
+            raise HTTPError(401, "用户名或密码不正确")
+        token = secrets.token_urlsafe(32)
+        self.tokens[token] = {"user": user, "last_used": time.monotonic()}
+        await self.send_json(writer, 200, {"token": token, "user": user})
+
+    async def register(self, request, writer):
+        data = request.json()
+        if not data.get("username") or not data.get("password") or not data.get("email"):
+            raise HTTPError(400, "请填写所有必填字段")
+        success = await self.run_blocking(
+            self.db.register_user, data["username"], data["password"], data["email"], data.get("api_key", ""))
+        if not success:
+            raise HTTPError(409, "用户名或电子邮箱已被使用")
+        await self.send_json(writer, 200, {"registered": True})
+
+    async def update_api_key(self, user, request, writer):
+        api_key = request.json().get("api_key", "")
+        await self.run_blocking(self.db.update_api_key, user["username"], api_key)
+        # 之后新建的对话使用新密钥
+        for session in self.tokens.values():
+            if session["user"]["id"] == user["id"]:
+                session["user"] = dict(session["user"], api_key=api_key)
+        await self.send_json(writer, 200, {"updated": True})
+
+    def create_bot(self, user):
+        if user.get("api_key"):
+            on_usage = get_ledger(self.db.db_path).recorder(user["id"])
+            return TieredRouter(SimpleBot(), DS_Bot(api_key=user["api_key"], fallback=SimpleBot(),
+                                                    on_usage=on_usage))
+        return SimpleBot()
+
+    async def create_chat(self, user, writer):
+        chat_id = secrets.token_hex(16)
+        # 创建DS_Bot会建立客户端、打开缓存和账本数据库，不能在事件循环里执行
+        bot = await self.run_blocking(self.create_bot, user)
+        self.chats[chat_id] = ChatSession(user["id"], bot)
+        await self.send_json(writer, 200, {"chat_id": chat_id, "advanced": not isinstance(bot, SimpleBot)})
+
+    async def send_message(self, user, chat, request, writer):
+        data = request.json()
+        message = (data.get("message") or "").strip()
+        if not message:
+            raise HTTPError(400, "消息不能为空")
+
+        # 每个用户同时进行的请求数有上限，超出时立即拒绝
+        user_id = user["id"]
+        if self.in_flight.get(user_id, 0) >= self.per_user_limit:
+            raise HTTPError(429, "请求过于频繁，请稍后再试", {"Retry-After": "1"})
+        self.in_flight[user_id] = self.in_flight.get(user_id, 0) + 1
+
+        try:
+            async with chat.lock:
+                chat.last_used = time.monotonic()
+                # 客户端恢复历史对话时随消息带上之前的上下文
+                for item in data.get("history") or []:
+                    if hasattr(chat.bot, "add_message") and item.get("role") in ("user", "assistant"):
+                        chat.bot.add_message(item["role"], item.get("content", ""))
+
+                if data.get("stream"):
+                    await self.stream_reply(chat.bot, message, writer, request.keep_alive)
+                else:
+                    try:
+                        response = await self.run_blocking(chat.bot.get_response, message)
+                    except Exception as e:
+                        raise HTTPError(502, str(e))
+                    await self.send_json(writer, 200, {"response": response}, keep_alive=request.keep_alive)
+        finally:
+            self.in_flight[user_id] -= 1
+            if not self.in_flight[user_id]:
+                del self.in_flight[user_id]
+
+    async def stream_reply(self, bot, message, writer, keep_alive):
+        """
+        以SSE事件逐块发送回复，线程池中的生成器通过队列把文本块交给事件循环
+
+        调用方持有对话锁；客户端中途断开时通知生成器停止，并等它真正结束后才返回，
+        避免下一个请求与仍在运行的生成器同时使用同一个机器人
+        """
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        done = object()
+        cancelled = threading.Event()
+        enqueued_at = time.perf_counter()
+
+        def put(item):
+            try:
+                loop.call_soon_threadsafe(chunks.put_nowait, item)
+            except RuntimeError:  # 事件循环已关闭
+                pass
+
+        def produce():
+            chunks_iter = None
+            try:
+                if hasattr(bot, "stream_response"):
+                    chunks_iter = bot.stream_response(message, enqueued_at=enqueued_at)
+                else:
+                    chunks_iter = iter([bot.get_response(message)])
+                for chunk in chunks_iter:
+                    if cancelled.is_set():
+                        break
+                    put(chunk)
+            except Exception as e:
+                put(e)
+            finally:
+                # 提前关闭生成器，让机器人回滚或记录未完成的回复
+                if hasattr(chunks_iter, "close"):
+                    chunks_iter.close()
+                put(done)
+
+        head = [
+            "HTTP/1.1 200 OK",
+            "Content-Type: text/event-stream; charset=utf-8",
+            "Cache-Control: no-cache",
+            "Transfer-Encoding: chunked",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+
+        def write_event(event, payload):
+            data = f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+            writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+        future = loop.run_in_executor(self.executor, produce)
+        collected = []
+        try:
+            while True:
+                item = await chunks.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    write_event("error", {"error": str(item)})
+                else:
+                    collected.append(item)
+                    write_event("delta", {"content": item})
+                await writer.drain()
+            write_event("done", {"response": "".join(collected)})
+        except (ConnectionError, asyncio.CancelledError):
+            raise
+        except Exception as e:
+            # 响应头已经发出，不能再返回500，改为发送error事件
+            write_event("error", {"error": str(e)})
+        finally:
+            cancelled.set()
+            try:
+                await asyncio.shield(future)
+            except Exception:
+                pass
+
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    # ---- 维护 ----
+
+    async def expire_sessions(self):
+        """定期清理闲置的登录令牌和对话"""
+        while True:
+            await asyncio.sleep(60)
+            now = time.monotonic()
+            for token, session in list(self.tokens.items()):
+                if now - session["last_used"] > self.session_ttl:
+                    del self.tokens[token]
+            for chat_id, chat in list(self.chats.items()):
+                if now - chat.last_used > self.session_ttl and not chat.lock.locked():
+                    del self.chats[chat_id]
+
+    async def serve(self, host="127.0.0.1", port=8080):
+        raise_file_limit()
+        server = await asyncio.start_server(self.handle_connection, host, port,
+                                            limit=MAX_HEADER_BYTES, backlog=1024)
+        janitor = asyncio.ensure_future(self.expire_sessions())
+        print(f"聊天服务已启动: http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            janitor.cancel()
+            self.executor.shutdown(wait=False)
+
+
+def raise_file_limit():
+    """把打开文件数软限制提高到硬限制，以容纳大量空闲连接"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="无界面的多用户聊天服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--db", default="user_database.db", help="用户数据库路径")
+    parser.add_argument("--workers", type=int, default=64, help="执行机器人调用的线程数")
+    parser.add_argument("--per-user-limit", type=int, default=2, help="每个用户同时进行的请求数")
+    args = parser.parse_args()
+
+    server = ChatServer(UserDatabase(args.db), worker_threads=args.workers, per_user_limit=args.per_user_limit)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
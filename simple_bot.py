@@ -1,39 +1,106 @@
 # simple_bot.py
-import re
 import random
 
+from intent_packs import DEFAULT_INTENT_DIR, get_registry
+
+
+def _content_length(text):
+    """Number of letters, digits and CJK characters, ignoring spaces and punctuation"""
+    return sum(1 for char in text if char.isalnum())
+
+
+def _is_latin(char):
+    return char.isascii() and char.isalnum()
+
+
+def _on_word_boundary(match):
+    """
+    False when a match starts or ends inside a Latin word, e.g. "hi" in
+    "this"; CJK neighbours count as boundaries, so "调用api接口" still matches
+    """
+    text, start, end = match.string, match.start(), match.end()
+    if start > 0 and start < end and _is_latin(text[start]) and _is_latin(text[start - 1]):
+        return False
+    if end < len(text) and start < end and _is_latin(text[end - 1]) and _is_latin(text[end]):
+        return False
+    return True
+
 
 class SimpleBot:
-    def __init__(self):
-        self.patterns = {
-            r'hello|hi|hey': ['Hello!', 'Hi there!', 'Hey! How can I help you?'],
-            r'how are you': ['I\'m doing well, thanks!', 'I\'m a simple assistant, ready to help.'],
-            r'bye|goodbye': ['Goodbye!', 'See you later!', 'Have a great day!'],
-            r'help': [
-                'I\'m a simple assistant with limited functionality. For advanced features, please provide a valid API key and ensure GPU support.'],
-            r'api|key|deepseek': [
-                'To use advanced features, you need to provide a valid Deepseek API key in your profile settings.'],
-            r'gpu|cuda': ['GPU support is required for advanced features. Please install necessary drivers.'],
-            r'login|account|register': ['You can manage your account from the login screen.']
-        }
-        self.default_responses = [
-            "I'm a simple assistant with limited functionality. For advanced features, please provide a valid API key and ensure GPU support.",
-            "I understand your message, but I have limited capabilities. Advanced features require API key and GPU support.",
-            "As a basic assistant, I can only provide simple responses. Please upgrade for more capabilities."
-        ]
+    def __init__(self, intent_dir=DEFAULT_INTENT_DIR, hot_reload=True, faq_index=None, faq_min_score=0.35):
+        # Intents are loaded from JSON/YAML packs and hot-reloaded when they change
+        self.intents = get_registry(intent_dir, hot_reload=hot_reload)
+
+        # Optional FAQ retrieval mode: a FAQIndex or the directory of a saved one.
+        # NumPy/SciPy are only imported when retrieval is enabled.
+        if isinstance(faq_index, str):
+            from faq_index import FAQIndex
+            faq_index = FAQIndex.load(faq_index)
+        self.faq_index = faq_index
+        self.faq_min_score = faq_min_score
+
+    @property
+    def patterns(self):
+        intents = self.intents.current
+        return dict(zip(intents.patterns, intents.responses))
+
+    @property
+    def default_responses(self):
+        return self.intents.current.default_responses
+
+    def classify(self, user_input):
+        """
+        Best local answer with a confidence in [0, 1], or None.
+
+        Returns (response, confidence, source) where source is "faq" or
+        "intent". FAQ confidence is the cosine score; intent confidence is
+        the share of the input's characters covered by the matched pattern,
+        ignoring spaces and punctuation, so "hi!" scores 1.0 while a question
+        that merely mentions "api" scores low. Characters rather than words
+        are counted because Chinese input has no spaces between words.
+        """
+        if self.faq_index is not None:
+            match = self.faq_index.best_answer(user_input, 0.0)
+            if match is not None and match[0] >= self.faq_min_score:
+                return match[1], match[0], "faq"
+
+        text = user_input.lower()
+        intents = self.intents.current
+        # Only the routing decision needs word boundaries; get_response keeps
+        # matching substrings the way the packs were written. Intents marked
+        # "routable": false (help and capability replies written for simple
+        # mode) are skipped so the router escalates them.
+        result = intents.matcher.search(
+            text, lambda index, match: intents.routable[index] and _on_word_boundary(match)
+        )
+        if result is None:
+            return None
+
+        index, (start, end) = result
+        covered = _content_length(text[start:end]) or 1
+        confidence = min(1.0, covered / max(_content_length(text), 1))
+        return random.choice(intents.responses[index]), confidence, "intent"
 
     def get_response(self, user_input):
         # Check if this is a command (starts with /)
         if user_input.startswith("/"):
             return self.handle_command(user_input)
 
+        # Answer from the FAQ corpus when a question is close enough
+        if self.faq_index is not None:
+            match = self.faq_index.best_answer(user_input, self.faq_min_score)
+            if match is not None:
+                return match[1]
+
         user_input = user_input.lower()
 
-        for pattern, responses in self.patterns.items():
-            if re.search(pattern, user_input):
-                return random.choice(responses)
+        # Take one reference so a concurrent reload can't swap packs mid-lookup
+        intents = self.intents.current
+        index = intents.matcher.match_index(user_input)
+        if index is not None:
+            return random.choice(intents.responses[index])
 
-        return random.choice(self.default_responses)
+        return random.choice(intents.default_responses)
 
     def handle_command(self, command):
         cmd = command.lower().strip()
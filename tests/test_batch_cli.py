@@ -0,0 +1,80 @@
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_cli import Checkpoint, process  # noqa: E402
+
+
+class EchoBackend:
+    """Stands in for SimpleBot: answers with the prompt, fails on "boom" """
+
+    def __init__(self):
+        self.prompts = []
+
+    def get_response(self, text):
+        self.prompts.append(text)
+        if text == "boom":
+            raise RuntimeError("backend failed")
+        return text.upper()
+
+
+class CheckpointTest(unittest.TestCase):
+    def test_watermark_advances_past_contiguous_lines(self):
+        checkpoint = Checkpoint(None)
+        for line_no in (0, 2, 3):
+            checkpoint.mark(line_no)
+        self.assertEqual((checkpoint.watermark, checkpoint.done), (1, {2, 3}))
+        checkpoint.mark(1)
+        self.assertEqual((checkpoint.watermark, checkpoint.done), (4, set()))
+        self.assertTrue(checkpoint.is_done(3))
+        self.assertFalse(checkpoint.is_done(4))
+
+
+class ProcessTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.checkpoint_path = os.path.join(self.tmp.name, "run.ckpt")
+
+    def run_lines(self, lines, backend, checkpoint):
+        output = io.StringIO()
+        counts = asyncio.run(process(lines, backend, output, checkpoint))
+        return counts, [json.loads(line) for line in output.getvalue().splitlines()]
+
+    def test_writes_one_result_per_line(self):
+        lines = ['"hello"', "", '{"id": 7, "messages": [{"role": "user", "content": "hi"}]}',
+                 "not json", '{"prompt": "boom"}']
+        counts, results = self.run_lines(lines, EchoBackend(), Checkpoint(None))
+
+        self.assertEqual(counts, (2, 2))
+        by_line = {result["line"]: result for result in results}
+        self.assertEqual(sorted(by_line), [0, 2, 3, 4])
+        self.assertEqual(by_line[0]["response"], "HELLO")
+        self.assertEqual((by_line[2]["id"], by_line[2]["response"]), (7, "HI"))
+        self.assertIn("无效的输入", by_line[3]["error"])
+        self.assertEqual(by_line[4]["error"], "backend failed")
+
+    def test_resume_skips_completed_lines(self):
+        lines = [json.dumps(f"prompt {i}") for i in range(6)]
+        self.run_lines(lines[:4], EchoBackend(), Checkpoint(self.checkpoint_path))
+
+        backend = EchoBackend()
+        checkpoint = Checkpoint(self.checkpoint_path)
+        self.assertEqual(checkpoint.watermark, 4)
+        counts, results = self.run_lines(lines, backend, checkpoint)
+        self.assertEqual(counts, (2, 0))
+        self.assertEqual([result["line"] for result in results], [4, 5])
+        self.assertEqual(backend.prompts, ["prompt 4", "prompt 5"])
+
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            self.assertEqual(json.load(f), {"watermark": 6, "done": []})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+
+import UI  # noqa: E402
+from conversation_store import ConversationStore  # noqa: E402
+
+app = QApplication.instance() or QApplication([])
+
+
+class ChatTabHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = ConversationStore(os.path.join(self.tmp.name, "chats.db"), flush_interval=0.01)
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(self.store.close)
+
+    def make_tab(self, message_count):
+        conversation_id = self.store.create_conversation(1, "chat")
+        for i in range(message_count):
+            self.store.append_message(conversation_id, "user", f"message {i}")
+        self.store.flush()
+        tab = UI.ChatTab(use_advanced=False, store=self.store, conversation_id=conversation_id, restored=True)
+        self.addCleanup(tab.deleteLater)
+        return tab
+
+    def wait_for_history(self, tab):
+        deadline = time.monotonic() + 5
+        while tab.history_worker is not None and time.monotonic() < deadline:
+            app.processEvents()
+            time.sleep(0.005)
+        self.assertIsNone(tab.history_worker)
+
+    def test_loads_in_the_background(self):
+        tab = self.make_tab(3)
+        tab.ensure_loaded()
+        self.assertIsNotNone(tab.history_worker)
+        self.wait_for_history(tab)
+        self.assertIn("message 2", tab.chat_history.toPlainText())
+        self.assertTrue(tab.load_earlier_button.isHidden())
+
+    def test_button_only_shown_when_older_messages_exist(self):
+        tab = self.make_tab(UI.MESSAGE_PAGE_SIZE)
+        tab.ensure_loaded()
+        self.wait_for_history(tab)
+        self.assertTrue(tab.load_earlier_button.isHidden())
+
+        tab = self.make_tab(UI.MESSAGE_PAGE_SIZE * 2 + 5)
+        tab.ensure_loaded()
+        self.wait_for_history(tab)
+        self.assertFalse(tab.load_earlier_button.isHidden())
+        tab.load_earlier()
+        self.wait_for_history(tab)
+        self.assertFalse(tab.load_earlier_button.isHidden())
+        tab.load_earlier()
+        self.wait_for_history(tab)
+        self.assertTrue(tab.load_earlier_button.isHidden())
+        self.assertIn("message 0", tab.chat_history.toPlainText())
+
+    def test_show_message_loads_through_the_target(self):
+        tab = self.make_tab(UI.MESSAGE_PAGE_SIZE + 10)
+        first_id = self.store.load_messages(tab.conversation_id, limit=UI.MESSAGE_PAGE_SIZE + 10)[0]["id"]
+        tab.show_message(first_id)
+        self.wait_for_history(tab)
+        self.assertEqual(tab.oldest_message_id, first_id)
+        self.assertTrue(tab.load_earlier_button.isHidden())
+
+        tab = self.make_tab(UI.MESSAGE_PAGE_SIZE + 10)
+        target_id = self.store.load_messages(tab.conversation_id, limit=UI.MESSAGE_PAGE_SIZE + 5)[0]["id"]
+        tab.show_message(target_id)
+        self.wait_for_history(tab)
+        self.assertEqual(tab.oldest_message_id, target_id)
+        self.assertFalse(tab.load_earlier_button.isHidden())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context_manager import (  # noqa: E402
+    MESSAGE_OVERHEAD_TOKENS, ContextManager, SummaryPolicy, estimate_message_tokens, estimate_tokens
+)
+
+
+def turns(count, content="x" * 40):
+    history = []
+    for i in range(count):
+        history.append({"role": "user", "content": f"{i} {content}"})
+        history.append({"role": "assistant", "content": f"{i} {content}"})
+    return history
+
+
+class EstimateTokensTest(unittest.TestCase):
+    def test_cjk_counts_per_character(self):
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("你好世界"), 4)
+        self.assertEqual(estimate_tokens("abcdefgh"), 2)
+        self.assertEqual(estimate_message_tokens({"role": "user", "content": None}), MESSAGE_OVERHEAD_TOKENS)
+
+
+class ContextManagerTest(unittest.TestCase):
+    def cost(self, messages):
+        return sum(estimate_message_tokens(message) for message in messages)
+
+    def test_history_within_budget_is_sent_whole(self):
+        history = [{"role": "system", "content": "be brief"}] + turns(3)
+        self.assertEqual(ContextManager(max_tokens=10000).build(history), history)
+
+    def test_trims_oldest_and_keeps_system_prompt(self):
+        system = {"role": "system", "content": "be brief"}
+        history = [system] + turns(20)
+        manager = ContextManager(max_tokens=120)
+        sent = manager.build(history)
+
+        self.assertIs(sent[0], system)
+        self.assertEqual(sent[-1], history[-1])
+        self.assertLessEqual(self.cost(sent), 120)
+        # The kept part is a contiguous suffix that starts on a user turn
+        self.assertEqual(sent[1:], history[len(history) - len(sent) + 1:])
+        self.assertEqual(sent[1]["role"], "user")
+
+    def test_newest_message_is_always_sent(self):
+        history = turns(2) + [{"role": "user", "content": "y" * 1000}]
+        self.assertEqual(ContextManager(max_tokens=10).build(history), [history[-1]])
+
+    def test_summary_policy_folds_dropped_turns(self):
+        history = turns(20)
+        sent = ContextManager(max_tokens=200, policy=SummaryPolicy(max_tokens=60)).build(history)
+        self.assertEqual(sent[0]["role"], "system")
+        self.assertIn("摘要", sent[0]["content"])
+        self.assertLessEqual(self.cost(sent), 200)
+
+    def test_incremental_counts_follow_rollback(self):
+        manager = ContextManager(max_tokens=10000)
+        history = turns(3)
+        self.assertEqual(manager.total_tokens(history), self.cost(history))
+        history.append({"role": "user", "content": "pending"})
+        manager.total_tokens(history)
+        del history[-1:]
+        history.append({"role": "user", "content": "a much longer replacement message"})
+        self.assertEqual(manager.total_tokens(history), self.cost(history))
+
+
+if __name__ == "__main__":
+    unittest.main()
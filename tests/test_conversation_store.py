@@ -0,0 +1,69 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import conversation_store  # noqa: E402
+from conversation_store import ConversationStore  # noqa: E402
+
+
+class SearchMessagesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = ConversationStore(os.path.join(self.tmp.name, "chats.db"), flush_interval=0.01)
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(self.store.close)
+
+    def conversation(self, user_id, *messages, title="chat"):
+        conversation_id = self.store.create_conversation(user_id, title)
+        for content in messages:
+            self.store.append_message(conversation_id, "user", content)
+        return conversation_id
+
+    def test_finds_every_term_and_only_the_users_messages(self):
+        mine = self.conversation(1, "python decorators explained", "rust borrow checker", "python generators")
+        self.conversation(2, "python decorators for someone else")
+
+        results = self.store.search_messages(1, "python decorators")
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]["conversation_id"], mine)
+        self.assertIn(conversation_store.SNIPPET_START, results[0]["snippet"])
+        self.assertEqual(len(self.store.search_messages(1, "python")), 2)
+        self.assertEqual(self.store.search_messages(1, "   "), [])
+
+    def test_short_terms_filter_results(self):
+        self.conversation(1, "use go for the server", "use rust for the server")
+        results = self.store.search_messages(1, "server go")
+        self.assertEqual(len(results), 1)
+        self.assertIn("go", results[0]["snippet"])
+
+    def test_other_users_matches_do_not_fill_the_rank_window(self):
+        original = conversation_store.RANK_WINDOW
+        conversation_store.RANK_WINDOW = 3
+        self.addCleanup(setattr, conversation_store, "RANK_WINDOW", original)
+
+        self.conversation(1, "deploy, deploy, deploy", "deploy once, then several unrelated words about lunch")
+        # Newer matches from another user
+        self.conversation(2, *[f"deploy log {i}" for i in range(10)])
+
+        # Ranked by BM25, not pushed into the newest-first tail
+        results = self.store.search_messages(1, "deploy")
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0]["snippet"].count("deploy"), 3)
+
+    def test_pages_continue_past_the_rank_window(self):
+        original = conversation_store.RANK_WINDOW
+        conversation_store.RANK_WINDOW = 3
+        self.addCleanup(setattr, conversation_store, "RANK_WINDOW", original)
+
+        self.conversation(1, *[f"message number {i}" for i in range(7)])
+        ids = set()
+        for offset in range(0, 7, 2):
+            ids.update(result["id"] for result in self.store.search_messages(1, "number", limit=2, offset=offset))
+        self.assertEqual(len(ids), 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
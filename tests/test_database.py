@@ -0,0 +1,242 @@
+import datetime
+import hashlib
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations  # noqa: E402
+import database  # noqa: E402
+import passwords  # noqa: E402
+from database import ConnectionManager, UserDatabase, get_connection_manager  # noqa: E402
+
+
+class DatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "users.db")
+        self.db = self.make_db()
+
+    def tearDown(self):
+        self.db.stop_token_sweeper()
+        self.tmp.cleanup()
+
+    def make_db(self, **options):
+        options.setdefault("sweep_interval", None)
+        return UserDatabase(self.db_path, **options)
+
+
+class ImportUsersTest(DatabaseTestCase):
+    def stored_hash(self, username):
+        return self.db.connections.execute(
+            "SELECT password_hash FROM users WHERE username = ?", (username,)).fetchone()[0]
+
+    def test_imports_with_the_normal_cost_by_default(self):
+        result = self.db.import_users([{"username": "alice", "email": "a@example.com", "password": "pw1"}])
+        self.assertEqual(result, {"imported": 1, "conflicts": []})
+        self.assertFalse(passwords.needs_rehash(self.stored_hash("alice")))
+        self.assertEqual(self.db.authenticate("alice", "pw1")["username"], "alice")
+
+    def test_precomputed_hashes_are_validated(self):
+        rows = [
+            {"username": "bob", "email": "b@example.com", "password_hash": passwords.hash_password("pw2", "bulk")},
+            {"username": "carol", "email": "c@example.com", "password_hash": "plaintext"},
+            {"username": "dave", "email": "d@example.com", "password_hash": "scrypt$3$8$1$c2FsdA$a2V5"},
+        ]
+        result = self.db.import_users(rows)
+        self.assertEqual(result["imported"], 1)
+        self.assertEqual([(row_no, name) for row_no, name, _reason in result["conflicts"]],
+                         [(2, "carol"), (3, "dave")])
+        self.assertIsNotNone(self.db.authenticate("bob", "pw2"))
+        # The cheap imported hash is upgraded on first login
+        self.assertFalse(passwords.needs_rehash(self.stored_hash("bob")))
+
+    def test_conflicts_are_reported_per_row(self):
+        self.db.register_user("erin", "pw", "e@example.com")
+        rows = [
+            {"username": "erin", "email": "other@example.com", "password": "x"},
+            {"username": "frank", "email": "f@example.com", "password": "x"},
+            {"username": "frank", "email": "f2@example.com", "password": "x"},
+            {"username": "gina", "email": "", "password": "x"},
+        ]
+        result = self.db.import_users(rows, cost="bulk")
+        self.assertEqual(result["imported"], 1)
+        self.assertEqual([row_no for row_no, _name, _reason in result["conflicts"]], [1, 3, 4])
+
+
+class ResetTokenTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.db.register_user("alice", "pw", "a@example.com")
+
+    def expire_tokens(self):
+        with self.db.connections.transaction() as conn:
+            conn.execute("UPDATE password_reset_tokens SET expires_at = ?", (int(time.time()) - 1,))
+
+    def token_count(self):
+        return self.db.connections.execute("SELECT COUNT(*) FROM password_reset_tokens").fetchone()[0]
+
+    def test_tokens_are_stored_hashed_and_single_use(self):
+        self.assertIsNone(self.db.generate_reset_token("nobody@example.com"))
+        first = self.db.generate_reset_token("a@example.com")
+        token = self.db.generate_reset_token("a@example.com")
+        stored = [row[0] for row in self.db.connections.execute("SELECT token_hash FROM password_reset_tokens")]
+        self.assertEqual(stored, [passwords.hash_token(token)])
+
+        self.assertFalse(self.db.reset_password(first, "new-pw"))
+        self.assertTrue(self.db.reset_password(token, "new-pw"))
+        self.assertFalse(self.db.reset_password(token, "other-pw"))
+        self.assertIsNotNone(self.db.authenticate("alice", "new-pw"))
+
+    def test_expired_tokens_are_rejected_and_purged(self):
+        token = self.db.generate_reset_token("a@example.com")
+        self.expire_tokens()
+        self.assertFalse(self.db.reset_password(token, "new-pw"))
+        self.assertEqual(self.db.purge_expired_tokens(batch_size=1), 1)
+        self.assertEqual(self.token_count(), 0)
+
+    def test_one_sweeper_per_file(self):
+        sweeper = self.db.start_token_sweeper(interval=0.01)
+        self.assertIs(self.make_db(sweep_interval=0.01).start_token_sweeper(), sweeper)
+
+        self.db.generate_reset_token("a@example.com")
+        self.expire_tokens()
+        deadline = time.monotonic() + 5
+        while self.token_count() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.token_count(), 0)
+
+        self.db.stop_token_sweeper()
+        self.assertFalse(sweeper._thread.is_alive())
+        self.assertNotIn(self.db.connections, database._sweepers)
+
+
+class ConnectionManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db_path = os.path.join(self.tmp.name, "pool.db")
+        self.connections = ConnectionManager(self.db_path)
+        self.addCleanup(self.connections.close)
+        self.connections.execute("CREATE TABLE items (name TEXT)")
+
+    def test_one_connection_per_thread(self):
+        conn = self.connections.connection()
+        self.assertIs(self.connections.connection(), conn)
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+
+        other = []
+
+        def run():
+            other.append(self.connections.connection())
+            self.connections.close()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], conn)
+
+    def test_managers_are_shared_per_file(self):
+        manager = get_connection_manager(self.db_path)
+        self.assertIs(get_connection_manager(os.path.join(self.tmp.name, ".", "pool.db")), manager)
+        self.assertIsNot(get_connection_manager(os.path.join(self.tmp.name, "other.db")), manager)
+
+    def test_transaction_rolls_back_on_error(self):
+        with self.assertRaises(ValueError):
+            with self.connections.transaction() as conn:
+                conn.execute("INSERT INTO items VALUES ('lost')")
+                raise ValueError
+        with self.connections.transaction() as conn:
+            conn.execute("INSERT INTO items VALUES ('kept')")
+            # Nested calls join the outer transaction
+            with self.connections.transaction() as inner:
+                self.assertIs(inner, conn)
+                inner.execute("INSERT INTO items VALUES ('nested')")
+        names = [row[0] for row in self.connections.execute("SELECT name FROM items ORDER BY name")]
+        self.assertEqual(names, ["kept", "nested"])
+        self.assertFalse(self.connections.connection().in_transaction)
+
+
+class BaselineUpgradeTest(unittest.TestCase):
+    # The users table as created before schema migrations existed
+    BASELINE_SCHEMA = '''
+    CREATE TABLE users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        api_key TEXT,
+        reset_token TEXT,
+        reset_token_expiry TEXT
+    )
+    '''
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db_path = os.path.join(self.tmp.name, "users.db")
+
+        now = datetime.datetime.now()
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(self.BASELINE_SCHEMA)
+        conn.executemany(
+            "INSERT INTO users (username, password_hash, email, api_key, reset_token, reset_token_expiry) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                ("alice", hashlib.sha256(b"old-pw").hexdigest(), "a@example.com", "sk-a",
+                 "live-token", (now + datetime.timedelta(hours=1)).isoformat()),
+                ("bob", hashlib.sha256(b"bob-pw").hexdigest(), "b@example.com", "",
+                 "stale-token", (now - datetime.timedelta(hours=1)).isoformat()),
+            ]
+        )
+        conn.commit()
+        conn.close()
+
+    def open_db(self):
+        db = UserDatabase(self.db_path, sweep_interval=None)
+        self.addCleanup(db.stop_token_sweeper)
+        return db
+
+    def test_upgrade_reaches_the_latest_version(self):
+        db = self.open_db()
+        conn = db.connections
+        self.assertEqual(migrations.current_version(conn.connection()), migrations.MIGRATIONS[-1][0])
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.assertTrue({"password_reset_tokens", "usage_events", "usage_daily", "messages_fts"} <= tables)
+        if sqlite3.sqlite_version_info >= (3, 35, 0):
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+            self.assertFalse(columns & {"reset_token", "reset_token_expiry", "reset_token_expires_at"})
+
+    def test_outstanding_tokens_are_carried_over_hashed(self):
+        db = self.open_db()
+        rows = db.connections.execute("SELECT token_hash, expires_at FROM password_reset_tokens").fetchall()
+        self.assertEqual([row[0] for row in rows], [passwords.hash_token("live-token")])
+        self.assertGreater(rows[0][1], time.time())
+
+        self.assertFalse(db.reset_password("stale-token", "new-pw"))
+        self.assertTrue(db.reset_password("live-token", "new-pw"))
+        self.assertIsNotNone(db.authenticate("alice", "new-pw"))
+
+    def test_legacy_hashes_still_log_in_and_are_upgraded(self):
+        db = self.open_db()
+        user = db.authenticate("bob", "bob-pw")
+        self.assertEqual((user["username"], user["email"]), ("bob", "b@example.com"))
+        stored = db.connections.execute("SELECT password_hash FROM users WHERE username = 'bob'").fetchone()[0]
+        self.assertFalse(passwords.needs_rehash(stored))
+        self.assertIsNone(db.authenticate("bob", "wrong"))
+
+    def test_migrating_again_changes_nothing(self):
+        db = self.open_db()
+        db.connections.migrated = False
+        migrations.migrate(db.connections)
+        count = db.connections.execute("SELECT COUNT(*) FROM schema_version").fetchone()[0]
+        self.assertEqual(count, len(migrations.MIGRATIONS))
+
+
+if __name__ == "__main__":
+    unittest.main()
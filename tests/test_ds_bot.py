@@ -0,0 +1,138 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import client_pool  # noqa: E402
+from DS_bot import BatchResult, DS_Bot  # noqa: E402
+
+
+def chunk(content):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))], usage=None)
+
+
+class FakeStream:
+    """Iterable of completion chunks that remembers whether it was closed"""
+
+    def __init__(self, contents):
+        self.contents = contents
+        self.closed = False
+
+    def __iter__(self):
+        for content in self.contents:
+            yield chunk(content)
+
+    def close(self):
+        self.closed = True
+
+
+def make_bot(**options):
+    options.setdefault("cache", False)
+    return DS_Bot(api_key="test-key", base_url="http://127.0.0.1:9/v1", **options)
+
+
+class StreamResponseTest(unittest.TestCase):
+    def setUp(self):
+        self.bot = make_bot()
+        self.stream = FakeStream(["Hel", "lo"])
+        self.bot._create_completion = lambda messages, stream: self.stream
+
+    def test_completed_stream_is_recorded(self):
+        self.assertEqual("".join(self.bot.stream_response("hi")), "Hello")
+        self.assertEqual(self.bot.conversation_history,
+                         [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "Hello"}])
+
+    def test_closing_early_rolls_back_the_turn(self):
+        chunks = self.bot.stream_response("hi")
+        self.assertEqual(next(chunks), "Hel")
+        chunks.close()
+        self.assertEqual(self.bot.conversation_history, [])
+        self.assertTrue(self.stream.closed)
+
+
+class FakeAsyncClient:
+    def __init__(self):
+        self.closed = threading.Event()
+
+    async def close(self):
+        self.closed.set()
+
+
+class GetResponsesTest(unittest.TestCase):
+    def setUp(self):
+        self.bot = make_bot()
+        self.started = []
+        self.cancelled = []
+        self.client = FakeAsyncClient()
+        original = client_pool.create_async_client
+        client_pool.create_async_client = lambda *args, **kwargs: self.client
+        self.addCleanup(setattr, client_pool, "create_async_client", original)
+
+        async def complete(client, index, item, use_cache):
+            self.started.append(index)
+            try:
+                await asyncio.sleep(0.01 if index < 2 else 5)
+            except asyncio.CancelledError:
+                self.cancelled.append(index)
+                raise
+            return BatchResult(index, item, f"reply {item}", None)
+
+        self.bot._acomplete_item = complete
+
+    def test_ordered_results(self):
+        results = list(self.bot.get_responses(["a", "b"], concurrency=2, ordered=True))
+        self.assertEqual([result.response for result in results], ["reply a", "reply b"])
+
+    def test_stopping_early_submits_nothing_more(self):
+        results = self.bot.get_responses(iter(range(1000)), concurrency=2)
+        next(results)
+        results.close()
+        self.assertTrue(self.client.closed.wait(2))
+        # The slow requests in flight were cancelled and nothing new was started
+        self.assertLessEqual(len(self.started), 4)
+        self.assertEqual(set(self.started) - {0, 1}, set(self.cancelled) - {0, 1})
+
+class ThreadRecordingCache:
+    def __init__(self):
+        self.values = {}
+        self.threads = []
+
+    def get(self, key, count=True):
+        self.threads.append(threading.current_thread())
+        return self.values.get(key)
+
+    def put(self, key, value):
+        self.threads.append(threading.current_thread())
+        self.values[key] = value
+
+
+class FakeCompletions:
+    async def create(self, **kwargs):
+        message = SimpleNamespace(content="answer")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+class BatchCacheTest(unittest.TestCase):
+    def test_cache_runs_off_the_event_loop_thread(self):
+        cache = ThreadRecordingCache()
+        bot = make_bot(cache=cache)
+        client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+
+        async def run():
+            first = await bot._acomplete_item(client, 0, "question", True)
+            second = await bot._acomplete_item(client, 1, "question", True)
+            return first, second, threading.current_thread()
+
+        first, second, loop_thread = asyncio.run(run())
+        self.assertEqual((first.response, second.response), ("answer", "answer"))
+        self.assertEqual(len(cache.threads), 3)  # miss, put, hit
+        self.assertNotIn(loop_thread, cache.threads)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from faq_index import FAQIndex, read_corpus  # noqa: E402
+from simple_bot import SimpleBot  # noqa: E402
+
+
+PAIRS = [
+    ("How do I reset my password?", "Use the forgot password link."),
+    ("What is a Python decorator?", "A function that wraps another function."),
+    ("如何计算三角形的面积？", "底乘高除以二。"),
+    ("When is the homework due?", "Every Friday at noon."),
+]
+
+
+class FAQIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = FAQIndex.build(PAIRS, n_features=2 ** 14)
+
+    def test_best_match_ranks_first(self):
+        results = self.index.search("how can I reset the password", k=2)
+        self.assertEqual(results[0][2], "Use the forgot password link.")
+        self.assertGreaterEqual(results[0][0], results[1][0])
+        self.assertEqual(self.index.best_answer("三角形面积怎么算")[1], "底乘高除以二。")
+
+    def test_empty_or_unrelated_queries(self):
+        self.assertEqual(self.index.search("   "), [])
+        self.assertIsNone(self.index.best_answer("zzzz", min_score=0.5))
+        self.assertEqual(FAQIndex.build([], n_features=2 ** 10).search("anything"), [])
+
+    def test_saved_index_gives_the_same_results(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.index.save(directory)
+            for mmap in (True, False):
+                loaded = FAQIndex.load(directory, mmap=mmap)
+                self.assertEqual(len(loaded), len(PAIRS))
+                self.assertEqual(loaded.questions[2], PAIRS[2][0])
+                for query in ("python decorator", "homework due friday"):
+                    expected = self.index.search(query, k=3)
+                    actual = loaded.search(query, k=3)
+                    self.assertEqual([r[1:] for r in actual], [r[1:] for r in expected])
+                    for (a, _, _), (b, _, _) in zip(actual, expected):
+                        self.assertAlmostEqual(a, b, places=5)
+                # Release the memory maps before the directory is removed
+                del loaded
+
+    def test_reads_csv_and_jsonl_corpora(self):
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, "faq.csv")
+            with open(csv_path, "w", encoding="utf-8", newline="") as f:
+                f.write('question,answer\n"Hi, there?",Hello\n')
+            jsonl_path = os.path.join(directory, "faq.jsonl")
+            with open(jsonl_path, "w", encoding="utf-8") as f:
+                f.write('{"question": "q1", "answer": "a1"}\n\n')
+            self.assertEqual(list(read_corpus(csv_path)), [("Hi, there?", "Hello")])
+            self.assertEqual(list(read_corpus(jsonl_path)), [("q1", "a1")])
+
+
+class SimpleBotFAQTest(unittest.TestCase):
+    def test_answers_from_the_faq_above_the_threshold(self):
+        bot = SimpleBot(hot_reload=False, faq_index=FAQIndex.build(PAIRS, n_features=2 ** 14), faq_min_score=0.5)
+        self.assertEqual(bot.get_response("What is a python decorator?"), "A function that wraps another function.")
+        response, confidence, source = bot.classify("What is a python decorator?")
+        self.assertEqual(source, "faq")
+        self.assertGreaterEqual(confidence, 0.5)
+        # Below the threshold the intent packs answer as before
+        self.assertGreater(bot.faq_index.search("hello", k=1)[0][0], 0)
+        self.assertEqual(bot.classify("hello")[2], "intent")
+        self.assertNotIn(bot.get_response("hello"), [answer for _, answer in PAIRS])
+
+
+if __name__ == "__main__":
+    unittest.main()
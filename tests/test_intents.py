@@ -0,0 +1,117 @@
+import json
+import os
+import re
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent_matcher import IntentMatcher, required_literals  # noqa: E402
+from intent_packs import DEFAULT_INTENT_DIR, build_intent_set  # noqa: E402
+from simple_bot import SimpleBot  # noqa: E402
+
+
+def write_pack(pack_dir, intents, name="pack.json", priority=0):
+    with open(os.path.join(pack_dir, name), "w", encoding="utf-8") as f:
+        json.dump({"name": name, "priority": priority, "intents": intents,
+                   "default_responses": ["default"]}, f, ensure_ascii=False)
+
+
+class IntentMatcherTest(unittest.TestCase):
+    def test_first_match_in_priority_order(self):
+        matcher = IntentMatcher(["bye|goodbye", "hello|hi", r"\d+ apples"])
+        self.assertEqual(matcher.match_index("hi, goodbye"), 0)
+        self.assertEqual(matcher.match_index("3 apples"), 2)
+        self.assertIsNone(matcher.match_index("zzz"))
+
+    def test_agrees_with_per_pattern_search(self):
+        patterns = ["api|key", r"\b(?:gpu|cuda)\b", "[ab]c", r"x\.y", "(?:a)(?:b)", "好|你好"]
+        matcher = IntentMatcher(patterns)
+        for text in ("abc", "x.y", "xzy", "cuda!", "nocudas", "你好", "ab", "keyboard", ""):
+            expected = next((i for i, p in enumerate(patterns) if re.search(p, text)), None)
+            self.assertEqual(matcher.match_index(text), expected, text)
+
+    def test_accept_can_skip_to_later_occurrences_and_patterns(self):
+        matcher = IntentMatcher(["hi", "this"])
+        only_words = lambda index, match: match.string[match.start() - 1:match.start()] in ("", " ")
+        self.assertEqual(matcher.search("this hi", only_words), (0, (5, 7)))
+        self.assertEqual(matcher.search("this", only_words), (1, (0, 4)))
+
+    def test_overlapping_keywords_are_all_found(self):
+        # "he" ends inside "she" and "hers"; the trie's failure links must report it
+        matcher = IntentMatcher(["hers", "he", "she"])
+        self.assertEqual(matcher.match_index("ushers"), 0)
+        self.assertEqual(matcher.match_index("ushe"), 1)
+
+    def test_case_insensitive_flags(self):
+        matcher = IntentMatcher(["hello", "straße"], re.IGNORECASE)
+        self.assertEqual(matcher.match_index("HeLLo"), 0)
+        # Non-ASCII literals are left to re's own case folding
+        self.assertEqual(matcher.match_index("STRASSE"), None)
+        self.assertEqual(matcher.match_index("STRAßE"), 1)
+
+    def test_required_literals(self):
+        self.assertEqual(required_literals("hello|hi"), ["hello", "hi"])
+        self.assertEqual(required_literals(r"\b(?:api|key)\b"), ["api", "key"])
+        self.assertIsNone(required_literals("[ab]c"))
+        self.assertIsNone(required_literals("colou?r"))
+
+    def test_default_packs_agree_with_per_pattern_search(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            intents = build_intent_set(DEFAULT_INTENT_DIR, cache_dir=cache_dir)
+        texts = ["hello", "hi there", "what is an api key", "goodbye!", "你好", "谢谢", "help me with gpu",
+                 "thanks a lot", "this is something else", "", "/help"]
+        for text in texts:
+            expected = next((i for i, p in enumerate(intents.patterns) if re.search(p, text)), None)
+            self.assertEqual(intents.matcher.match_index(text), expected, text)
+
+
+class IntentPackTest(unittest.TestCase):
+    def test_pack_patterns_keep_unicode_semantics(self):
+        with tempfile.TemporaryDirectory() as pack_dir:
+            write_pack(pack_dir, [{"name": "cjk", "pattern": r"你好\w", "responses": ["cjk"]}])
+            bot = SimpleBot(intent_dir=pack_dir, hot_reload=False)
+            self.assertEqual(bot.get_response("你好啊"), "cjk")
+
+    def test_higher_priority_pack_matches_first(self):
+        with tempfile.TemporaryDirectory() as pack_dir:
+            write_pack(pack_dir, [{"pattern": "hello", "responses": ["low"]}], "low.json", 0)
+            write_pack(pack_dir, [{"pattern": "hello", "responses": ["high"]}], "high.json", 10)
+            bot = SimpleBot(intent_dir=pack_dir, hot_reload=False)
+            self.assertEqual(bot.get_response("hello"), "high")
+
+
+class IntentCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.pack_dir = os.path.join(self.tmp.name, "packs")
+        self.cache_dir = os.path.join(self.tmp.name, "cache")
+        os.mkdir(self.pack_dir)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_cached_set_keeps_its_index_and_compiles_lazily(self):
+        write_pack(self.pack_dir, [{"pattern": "hello|hi", "responses": ["greet"]},
+                                   {"pattern": "bye", "responses": ["bye"]}])
+        built = build_intent_set(self.pack_dir, self.cache_dir)
+        self.assertTrue(os.listdir(self.cache_dir))
+        self.assertFalse(os.path.exists(os.path.join(self.pack_dir, "__pycache__")))
+
+        cached = build_intent_set(self.pack_dir, self.cache_dir)
+        self.assertIsNot(cached, built)
+        self.assertEqual(cached.source_hash, built.source_hash)
+        self.assertEqual(cached.matcher._compiled, [None, None])
+        self.assertEqual(cached.matcher.match_index("say bye"), 1)
+        self.assertEqual(cached.matcher._compiled[0], None)
+
+    def test_edited_pack_invalidates_the_cache(self):
+        write_pack(self.pack_dir, [{"pattern": "hello", "responses": ["old"]}])
+        build_intent_set(self.pack_dir, self.cache_dir)
+        write_pack(self.pack_dir, [{"pattern": "hello", "responses": ["brand new"]}])
+        self.assertEqual(build_intent_set(self.pack_dir, self.cache_dir).responses, [["brand new"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
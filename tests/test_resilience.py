@@ -0,0 +1,130 @@
+import os
+import sys
+import time
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, call_with_retry  # noqa: E402
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+def failing(*errors, result="ok"):
+    """fn(timeout) that raises the given errors in turn, then returns result"""
+    errors = list(errors)
+    calls = []
+
+    def fn(timeout):
+        calls.append(timeout)
+        if errors:
+            raise errors.pop(0)
+        return result
+
+    fn.calls = calls
+    return fn
+
+
+FAST = RetryPolicy(max_attempts=3, base_delay=0.001, max_delay=0.001)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_opens_after_threshold_and_probes_after_timeout(self):
+        breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        breaker.before_call()
+        breaker.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+        time.sleep(0.06)
+        breaker.before_call()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        # Only one probe at a time
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success()
+        self.assertEqual((breaker.state, breaker.failures), (CircuitBreaker.CLOSED, 0))
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+
+    def test_inconclusive_probe_allows_another_probe(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        breaker.before_call()
+        breaker.record_inconclusive()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        breaker.before_call()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+
+
+class CallWithRetryTest(unittest.TestCase):
+    def test_retries_retryable_errors(self):
+        breaker = CircuitBreaker("test", failure_threshold=5)
+        fn = failing(StatusError(503), ConnectionError())
+        self.assertEqual(call_with_retry(fn, FAST, breaker), "ok")
+        self.assertEqual(len(fn.calls), 3)
+        self.assertEqual(breaker.failures, 0)
+
+    def test_gives_up_after_max_attempts(self):
+        breaker = CircuitBreaker("test", failure_threshold=5)
+        fn = failing(StatusError(500), StatusError(500), StatusError(500))
+        with self.assertRaises(StatusError):
+            call_with_retry(fn, FAST, breaker)
+        self.assertEqual(breaker.failures, 3)
+
+    def test_non_retryable_error_leaves_breaker_alone(self):
+        breaker = CircuitBreaker("test", failure_threshold=5)
+        breaker.record_failure()
+        breaker.record_failure()
+        fn = failing(StatusError(401))
+        with self.assertRaises(StatusError):
+            call_with_retry(fn, FAST, breaker)
+        self.assertEqual(len(fn.calls), 1)
+        self.assertEqual((breaker.state, breaker.failures), (CircuitBreaker.CLOSED, 2))
+
+    def test_non_retryable_error_does_not_close_a_half_open_breaker(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+        with self.assertRaises(StatusError):
+            call_with_retry(failing(StatusError(401)), FAST, breaker)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_negative_retry_after_is_clamped(self):
+        self.assertEqual(FAST.backoff(0, StatusError(429, {"retry-after": "-5"})), 0.0)
+        self.assertEqual(FAST.backoff(0, StatusError(429, {"retry-after-ms": "1500"})), 1.5)
+
+    def test_streams_are_judged_when_they_end(self):
+        breaker = CircuitBreaker("test", failure_threshold=5)
+
+        def broken_stream():
+            yield "a"
+            raise StatusError(502)
+
+        chunks = call_with_retry(lambda timeout: broken_stream(), FAST, breaker, stream=True)
+        self.assertEqual(breaker.failures, 0)
+        with self.assertRaises(StatusError):
+            list(chunks)
+        self.assertEqual(breaker.failures, 1)
+
+        chunks = call_with_retry(lambda timeout: iter(["a", "b"]), FAST, breaker, stream=True)
+        self.assertEqual(list(chunks), ["a", "b"])
+        self.assertEqual(breaker.failures, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from response_cache import ResponseCache, make_cache_key  # noqa: E402
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "cache.db")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_entries_expire_after_ttl(self):
+        cache = ResponseCache(self.path, ttl=0.05)
+        cache.put("k", "v")
+        self.assertEqual(cache.get("k"), "v")
+        time.sleep(0.06)
+        self.assertIsNone(cache.get("k"))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_lru_eviction_by_count_and_bytes(self):
+        cache = ResponseCache(None, max_entries=2, max_bytes=10)
+        cache.put("a", "1")
+        cache.put("b", "2")
+        cache.get("a")
+        cache.put("c", "3")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), ("1", "3"))
+
+        cache.put("big", "x" * 9)
+        self.assertLessEqual(cache.stats()["bytes"], 10)
+        self.assertEqual(cache.get("big"), "x" * 9)
+        cache.put("huge", "x" * 11)
+        self.assertIsNone(cache.get("huge"))
+
+    def test_disk_level_survives_restart(self):
+        ResponseCache(self.path).put("k", "v")
+        reopened = ResponseCache(self.path)
+        self.assertEqual(reopened.get("k"), "v")
+        self.assertEqual(reopened.stats()["disk_hits"], 1)
+
+    def test_key_ignores_whitespace_differences(self):
+        a = make_cache_key("m", 0, 100, [{"role": "user", "content": "hello  world"}])
+        b = make_cache_key("m", 0.0, 100, [{"role": "user", "content": " hello world\n"}])
+        c = make_cache_key("m", 0, 200, [{"role": "user", "content": "hello world"}])
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, c)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from router import RoutingStats, TieredRouter  # noqa: E402
+from simple_bot import SimpleBot  # noqa: E402
+
+
+class RecordingRemote:
+    """Stands in for DS_Bot and records which inputs were escalated"""
+
+    def __init__(self):
+        self.calls = []
+        self.history = []
+
+    def peek_cache(self, user_input):
+        return None
+
+    def add_message(self, role, content):
+        self.history.append((role, content))
+
+    def get_response(self, user_input, **kwargs):
+        self.calls.append(user_input)
+        return "remote answer"
+
+    def stream_response(self, user_input, **kwargs):
+        self.calls.append(user_input)
+        yield "remote answer"
+
+
+class TieredRouterTest(unittest.TestCase):
+    def setUp(self):
+        self.remote = RecordingRemote()
+        self.router = TieredRouter(SimpleBot(hot_reload=False), self.remote, stats=RoutingStats())
+
+    def assert_escalated(self, user_input):
+        tier, response, _confidence = self.router.route(user_input)
+        self.assertEqual(tier, "remote", user_input)
+        self.assertIsNone(response)
+        self.assertEqual(self.router.get_response(user_input), "remote answer")
+        self.assertEqual(self.remote.calls, [user_input])
+        # Nothing canned is written into the remote bot's history
+        self.assertEqual(self.remote.history, [])
+
+    def test_chinese_question_mentioning_keyword_escalates(self):
+        self.assert_escalated("如何用python调用api接口？")
+
+    def test_keyword_inside_latin_word_escalates(self):
+        self.assert_escalated("解释一下this关键字")
+
+    def test_keyword_inside_longer_word_escalates(self):
+        self.assert_escalated("what is a monkey patch")
+
+    def test_streaming_chinese_question_escalates(self):
+        self.assertEqual(list(self.router.stream_response("用cuda加速矩阵乘法的原理是什么")), ["remote answer"])
+        self.assertEqual(len(self.remote.calls), 1)
+
+    def test_short_greeting_answered_locally(self):
+        for user_input in ("hello", "hi!", "bye"):
+            tier, response, confidence = self.router.route(user_input)
+            self.assertEqual(tier, "intent", user_input)
+            self.assertEqual(confidence, 1.0)
+        self.assertEqual(self.remote.calls, [])
+
+
+class AdvancedModeRoutingTest(unittest.TestCase):
+    """The router only runs in advanced mode, where simple-mode help and capability replies are wrong"""
+
+    def setUp(self):
+        self.remote = RecordingRemote()
+        self.router = TieredRouter(SimpleBot(hot_reload=False), self.remote, stats=RoutingStats())
+
+    def test_help_and_capability_questions_escalate(self):
+        for user_input in ("help", "api key", "deepseek", "gpu", "cuda", "how are you?"):
+            tier, response, _confidence = self.router.route(user_input)
+            self.assertEqual(tier, "remote", user_input)
+            self.assertIsNone(response)
+
+    def test_no_simple_mode_reply_reaches_the_user(self):
+        for user_input in ("help", "api key", "gpu"):
+            reply = self.router.get_response(user_input)
+            self.assertEqual(reply, "remote answer")
+            self.assertNotIn("simple assistant", reply)
+        self.assertEqual(self.remote.calls, ["help", "api key", "gpu"])
+
+    def test_simple_mode_still_answers_capability_questions(self):
+        bot = SimpleBot(hot_reload=False)
+        self.assertIn("API key", bot.get_response("api key"))
+        self.assertIn("simple assistant", bot.get_response("help"))
+
+
+class ClassifyConfidenceTest(unittest.TestCase):
+    def setUp(self):
+        self.bot = SimpleBot(hot_reload=False)
+
+    def test_confidence_counts_characters_not_words(self):
+        _response, confidence, _source = self.bot.classify("在python里怎么打印hello？")
+        self.assertLess(confidence, 0.3)
+
+    def test_latin_keywords_need_word_boundaries(self):
+        self.assertIsNone(self.bot.classify("解释一下this关键字"))
+        self.assertIsNone(self.bot.classify("rapid keyboard"))
+        self.assertIsNotNone(self.bot.classify("说hello"))
+
+
+if __name__ == "__main__":
+    unittest.main()
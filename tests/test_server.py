@@ -0,0 +1,230 @@
+import asyncio
+import http.client
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import usage_ledger  # noqa: E402
+from database import UserDatabase  # noqa: E402
+from remote_client import RemoteClient, RemoteError  # noqa: E402
+from server import ChatServer  # noqa: E402
+
+
+class SlowStreamBot:
+    """Streams one chunk, then waits to be released; tracks overlapping calls"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.active = 0
+        self.max_active = 0
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def _enter(self):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+
+    def _exit(self):
+        with self.lock:
+            self.active -= 1
+
+    def stream_response(self, message, **kwargs):
+        self._enter()
+        try:
+            yield "first"
+            self.release.wait(5)
+            yield "second"
+        finally:
+            self.closed = True
+            self._exit()
+
+    def get_response(self, message):
+        self._enter()
+        try:
+            return "plain"
+        finally:
+            self._exit()
+
+
+class EchoBot:
+    """Replies with the message and records the context the server replays into it"""
+
+    def __init__(self):
+        self.history = []
+
+    def add_message(self, role, content):
+        self.history.append((role, content))
+
+    def get_response(self, message):
+        return f"echo {message}"
+
+
+class ChatServerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = UserDatabase(os.path.join(self.tmp.name, "users.db"), sweep_interval=3600)
+        self.server = ChatServer(self.db, worker_threads=4, per_user_limit=4)
+
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        async def start():
+            self.listener = await asyncio.start_server(self.server.handle_connection, "127.0.0.1", 0)
+            self.port = self.listener.sockets[0].getsockname()[1]
+            started.set()
+
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(start(), self.loop)
+        self.assertTrue(started.wait(5))
+
+    def tearDown(self):
+        async def stop():
+            self.listener.close()
+            await self.listener.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(stop(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.loop.close()
+        self.server.executor.shutdown(wait=True)
+        ledger = usage_ledger._ledgers.pop(self.db.db_path, None)
+        if ledger is not None:
+            ledger.close()
+        self.db.stop_token_sweeper()
+        self.tmp.cleanup()
+
+    def request(self, method, path, payload=None, token=None, headers=None):
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+        all_headers = {"Content-Type": "application/json"}
+        if token:
+            all_headers["Authorization"] = f"Bearer {token}"
+        all_headers.update(headers or {})
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        conn.request(method, path, body, all_headers)
+        response = conn.getresponse()
+        data = response.read()
+        conn.close()
+        if response.getheader("Content-Type", "").startswith("application/json"):
+            data = json.loads(data)
+        return response.status, data
+
+    def login(self):
+        status, _ = self.request("POST", "/api/register",
+                                 {"username": "alice", "password": "secret1", "email": "a@example.com"})
+        self.assertEqual(status, 200)
+        status, data = self.request("POST", "/api/login", {"username": "alice", "password": "secret1"})
+        self.assertEqual(status, 200)
+        return data["token"]
+
+    def test_login_chat_and_reply(self):
+        token = self.login()
+        status, data = self.request("POST", "/api/chats", {}, token)
+        self.assertEqual(status, 200)
+        self.assertFalse(data["advanced"])
+
+        status, data = self.request("POST", f"/api/chats/{data['chat_id']}/messages", {"message": "hello"}, token)
+        self.assertEqual(status, 200)
+        self.assertTrue(data["response"])
+
+    def test_stream_sends_delta_and_done_events(self):
+        token = self.login()
+        _, chat = self.request("POST", "/api/chats", {}, token)
+        status, body = self.request("POST", f"/api/chats/{chat['chat_id']}/messages",
+                                    {"message": "hello", "stream": True}, token)
+        self.assertEqual(status, 200)
+        text = body.decode("utf-8")
+        self.assertIn("event: delta", text)
+        self.assertIn("event: done", text)
+
+    def test_auth_errors(self):
+        self.assertEqual(self.request("GET", "/api/usage")[0], 401)
+        self.assertEqual(self.request("GET", "/api/usage", token="bogus")[0], 401)
+        self.assertEqual(self.request("POST", "/api/login", {"username": "nobody", "password": "x"})[0], 401)
+
+    def test_usage_and_unknown_chat(self):
+        token = self.login()
+        status, usage = self.request("GET", "/api/usage", token=token)
+        self.assertEqual(status, 200)
+        self.assertEqual(usage["requests"], 0)
+        status, _ = self.request("POST", "/api/chats/" + "0" * 32 + "/messages", {"message": "hi"}, token)
+        self.assertEqual(status, 404)
+
+    def test_bad_requests(self):
+        token = self.login()
+        _, chat = self.request("POST", "/api/chats", {}, token)
+        path = f"/api/chats/{chat['chat_id']}/messages"
+        self.assertEqual(self.request("POST", path, {"message": "  "}, token)[0], 400)
+
+        for length in ("abc", "-5", "1e3"):
+            with socket.create_connection(("127.0.0.1", self.port), timeout=5) as sock:
+                sock.sendall(f"POST /api/login HTTP/1.1\r\nContent-Length: {length}\r\n\r\n".encode("latin-1"))
+                self.assertTrue(sock.recv(1024).startswith(b"HTTP/1.1 400"), length)
+
+    def test_disconnect_keeps_chat_locked_until_stream_finishes(self):
+        token = self.login()
+        bot = SlowStreamBot()
+        self.server.create_bot = lambda user: bot
+        _, chat = self.request("POST", "/api/chats", {}, token)
+        path = f"/api/chats/{chat['chat_id']}/messages"
+
+        body = json.dumps({"message": "hi", "stream": True}).encode("utf-8")
+        with socket.create_connection(("127.0.0.1", self.port), timeout=5) as sock:
+            sock.sendall(f"POST {path} HTTP/1.1\r\nAuthorization: Bearer {token}\r\n"
+                         f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+            received = b""
+            while b"event: delta" not in received:
+                received += sock.recv(1024)
+
+        # The next request on this chat must wait for the abandoned stream
+        threading.Timer(0.2, bot.release.set).start()
+        status, data = self.request("POST", path, {"message": "again"}, token)
+        self.assertEqual((status, data["response"]), (200, "plain"))
+        self.assertEqual(bot.max_active, 1)
+        deadline = time.monotonic() + 5
+        while not bot.closed and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(bot.closed)
+
+
+    def test_remote_client_recovers_after_server_restart(self):
+        self.login()
+        bots = []
+        self.server.create_bot = lambda user: bots.append(EchoBot()) or bots[-1]
+        client = RemoteClient(f"http://127.0.0.1:{self.port}", timeout=5)
+        self.assertIsNotNone(client.authenticate("alice", "secret1"))
+
+        bot = client.create_bot()
+        bot.add_message("user", "restored question")
+        self.assertEqual(bot.get_response("one"), "echo one")
+        self.assertEqual(bot.pending_history, [])
+
+        # A restart forgets every token and chat
+        self.server.tokens.clear()
+        self.server.chats.clear()
+        self.assertEqual(bot.get_response("two"), "echo two")
+        self.assertEqual(len(bots), 2)
+        self.assertEqual(bots[1].history, [("user", "restored question"), ("user", "one"), ("assistant", "echo one")])
+
+    def test_pending_history_survives_a_failed_send(self):
+        self.login()
+        client = RemoteClient(f"http://127.0.0.1:{self.port}", timeout=5)
+        client.authenticate("alice", "secret1")
+        bot = client.create_bot()
+        bot.add_message("assistant", "earlier reply")
+        self.server.per_user_limit = 0
+        with self.assertRaises(RemoteError):
+            bot.get_response("hello")
+        self.assertEqual(bot.pending_history, [{"role": "assistant", "content": "earlier reply"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
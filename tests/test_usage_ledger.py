@@ -0,0 +1,105 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from usage_ledger import UsageLedger, day_of  # noqa: E402
+
+
+class UsageLedgerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "usage.db")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_ledger(self, **options):
+        ledger = UsageLedger(self.db_path, **options)
+        self.addCleanup(ledger.close)
+        return ledger
+
+    def test_rollups_persist_after_flush(self):
+        ledger = self.make_ledger()
+        ledger.record(1, model="deepseek-chat", prompt_tokens=10, completion_tokens=5, latency_ms=100.0)
+        ledger.record(1, prompt_tokens=1, cache_hit=True)
+        ledger.record(1, error="timeout")
+        ledger.record(2, prompt_tokens=7)
+        ledger.flush()
+
+        today = day_of(time.time())
+        rows = ledger.usage_between(1, today, today)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["requests"], 3)
+        self.assertEqual(rows[0]["errors"], 1)
+        self.assertEqual(rows[0]["cache_hits"], 1)
+        self.assertEqual(rows[0]["prompt_tokens"], 11)
+        self.assertEqual(ledger.usage_for_day(2)["prompt_tokens"], 7)
+
+    def test_unflushed_events_are_counted(self):
+        ledger = self.make_ledger(flush_interval=60.0)
+        # Hold the writer back so the events stay pending
+        with ledger._commit_lock:
+            for _ in range(5):
+                ledger.record(1, prompt_tokens=2)
+            time.sleep(0.05)
+        self.assertEqual(ledger.usage_for_day(1)["prompt_tokens"], 10)
+        ledger.flush()
+        self.assertEqual(ledger.usage_for_day(1)["prompt_tokens"], 10)
+
+    def test_usage_for_day_never_double_counts(self):
+        ledger = self.make_ledger(flush_interval=0.001, batch_size=20)
+        recorded = [0]
+        stop = threading.Event()
+        count_lock = threading.Lock()
+
+        def produce():
+            while not stop.is_set():
+                with count_lock:
+                    ledger.record(1, prompt_tokens=1)
+                    recorded[0] += 1
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        try:
+            deadline = time.monotonic() + 1.0
+            while time.monotonic() < deadline:
+                with count_lock:
+                    before = recorded[0]
+                seen = ledger.usage_for_day(1)["requests"]
+                with count_lock:
+                    after = recorded[0]
+                self.assertGreaterEqual(seen, before)
+                self.assertLessEqual(seen, after)
+        finally:
+            stop.set()
+            producer.join()
+        ledger.flush()
+        self.assertEqual(ledger.usage_for_day(1)["requests"], recorded[0])
+
+    def test_record_does_not_wait_for_a_commit(self):
+        ledger = self.make_ledger()
+        # Simulate a slow COMMIT: the writer holds the commit lock
+        with ledger._commit_lock:
+            started = time.perf_counter()
+            for _ in range(100):
+                ledger.record(1, prompt_tokens=1)
+            self.assertLess(time.perf_counter() - started, 0.5)
+        ledger.flush()
+        self.assertEqual(ledger.usage_for_day(1)["requests"], 100)
+
+    def test_events_survive_close(self):
+        ledger = UsageLedger(self.db_path, flush_interval=60.0)
+        for _ in range(1000):
+            ledger.record(3, completion_tokens=1)
+        ledger.close()
+        reopened = self.make_ledger()
+        self.assertEqual(reopened.usage_for_day(3)["completion_tokens"], 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
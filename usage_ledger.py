@@ -0,0 +1,203 @@
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+import migrations
+from database import get_connection_manager
+
+
+ROLLUP_FIELDS = ("requests", "errors", "cache_hits", "prompt_tokens", "completion_tokens", "latency_ms")
+
+
+def day_of(timestamp):
+    """UTC calendar day used as the rollup key"""
+    return time.strftime("%Y-%m-%d", time.gmtime(timestamp))
+
+
+class UsageLedger:
+    def __init__(self, db_path="user_database.db", flush_interval=1.0, batch_size=500):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.connections = get_connection_manager(db_path)
+        migrations.migrate(self.connections)
+
+        # Events queued but not yet committed, per (user_id, day), so quota
+        # checks see usage that is still in flight. _lock only ever guards
+        # these dict updates, so record() never waits on disk.
+        self._lock = threading.Lock()
+        self._unflushed = defaultdict(lambda: dict.fromkeys(ROLLUP_FIELDS, 0))
+        # Held by the writer around COMMIT and by usage_for_day around its two
+        # reads, so a reader sees a batch either committed or pending, never both
+        self._commit_lock = threading.Lock()
+
+        # Same batching scheme as ConversationStore: record() only enqueues
+        self._queue = queue.Queue()
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name="UsageLedgerWriter", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def record(self, user_id, model=None, prompt_tokens=0, completion_tokens=0, latency_ms=None,
+               cache_hit=False, error=None, ts=None, **extra):
+        """Queue one request; accepts the record dicts produced by metrics.registry.record"""
+        if self._closed:
+            return
+        event = (user_id, ts or time.time(), model, prompt_tokens or 0, completion_tokens or 0,
+                 latency_ms or 0.0, 1 if cache_hit else 0, 1 if error else 0)
+        with self._lock:
+            self._add(self._unflushed[(user_id, day_of(event[1]))], event, 1)
+        self._queue.put(event)
+
+    def recorder(self, user_id):
+        """Callback for DS_Bot(on_usage=...) that charges one user"""
+        return lambda usage: self.record(user_id, **usage)
+
+    @staticmethod
+    def _add(totals, event, sign):
+        totals["requests"] += sign
+        totals["errors"] += sign * event[7]
+        totals["cache_hits"] += sign * event[6]
+        totals["prompt_tokens"] += sign * event[3]
+        totals["completion_tokens"] += sign * event[4]
+        totals["latency_ms"] += sign * event[5]
+
+    def _write_loop(self):
+        while True:
+            op = self._queue.get()
+            if op is None:
+                break
+
+            batch = [op]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size and not isinstance(batch[-1], threading.Event):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    op = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if op is None:
+                    stop = True
+                    break
+                batch.append(op)
+
+            self._write_batch(batch)
+            if stop:
+                break
+        self.connections.close()
+
+    def _write_batch(self, batch):
+        waiters = [op for op in batch if isinstance(op, threading.Event)]
+        events = [op for op in batch if not isinstance(op, threading.Event)]
+
+        # Fold the batch into one rollup row per (user, day) before touching disk
+        rollups = defaultdict(lambda: dict.fromkeys(ROLLUP_FIELDS, 0))
+        for event in events:
+            self._add(rollups[(event[0], day_of(event[1]))], event, 1)
+
+        holding_commit_lock = False
+        try:
+            with self.connections.transaction() as conn:
+                conn.executemany(
+                    "INSERT INTO usage_events (user_id, created_at, model, prompt_tokens, completion_tokens, "
+                    "latency_ms, cache_hit, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    events
+                )
+                conn.executemany(
+                    "INSERT INTO usage_daily (user_id, day, requests, errors, cache_hits, prompt_tokens, "
+                    "completion_tokens, latency_ms) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (user_id, day) DO UPDATE SET "
+                    "requests = requests + excluded.requests, "
+                    "errors = errors + excluded.errors, "
+                    "cache_hits = cache_hits + excluded.cache_hits, "
+                    "prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+                    "completion_tokens = completion_tokens + excluded.completion_tokens, "
+                    "latency_ms = latency_ms + excluded.latency_ms",
+                    [(user_id, day) + tuple(totals[f] for f in ROLLUP_FIELDS)
+                     for (user_id, day), totals in rollups.items()]
+                )
+                # COMMIT runs when the with block exits, under the commit lock
+                self._commit_lock.acquire()
+                holding_commit_lock = True
+        except sqlite3.Error as e:
+            print(f"Failed to save usage records: {e}")
+        finally:
+            # Failed batches are dropped too, so their totals leave the pending counts either way
+            with self._lock:
+                self._discard_pending(rollups)
+            if holding_commit_lock:
+                self._commit_lock.release()
+            for waiter in waiters:
+                waiter.set()
+
+    def _discard_pending(self, rollups):
+        for key, totals in rollups.items():
+            pending = self._unflushed[key]
+            for field in ROLLUP_FIELDS:
+                pending[field] -= totals[field]
+            if not pending["requests"]:
+                del self._unflushed[key]
+
+    def flush(self, timeout=None):
+        """Block until every queued event has been committed"""
+        if self._closed:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        """Write out everything still queued; called automatically at exit"""
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+
+    def usage_for_day(self, user_id, day=None):
+        """Totals for one user and UTC day from the rollup table plus unflushed events"""
+        day = day or day_of(time.time())
+        # No commit can land between the two reads while the commit lock is held
+        with self._commit_lock:
+            row = self.connections.execute(
+                "SELECT requests, errors, cache_hits, prompt_tokens, completion_tokens, latency_ms "
+                "FROM usage_daily WHERE user_id = ? AND day = ?",
+                (user_id, day)
+            ).fetchone()
+            with self._lock:
+                pending = dict(self._unflushed.get((user_id, day)) or {})
+        totals = dict(zip(ROLLUP_FIELDS, row or (0,) * len(ROLLUP_FIELDS)))
+        for field, value in pending.items():
+            totals[field] += value
+        return totals
+
+    def usage_between(self, user_id, first_day, last_day):
+        """Per-day rollups for a date range, e.g. a billing period"""
+        self.flush()
+        rows = self.connections.execute(
+            "SELECT day, requests, errors, cache_hits, prompt_tokens, completion_tokens, latency_ms "
+            "FROM usage_daily WHERE user_id = ? AND day BETWEEN ? AND ? ORDER BY day",
+            (user_id, first_day, last_day)
+        ).fetchall()
+        return [dict(zip(("day",) + ROLLUP_FIELDS, row)) for row in rows]
+
+
+_ledgers = {}
+_ledgers_lock = threading.Lock()
+
+
+def get_ledger(db_path="user_database.db"):
+    """Shared ledger per database file, so all bots feed one writer thread"""
+    with _ledgers_lock:
+        ledger = _ledgers.get(db_path)
+        if ledger is None:
+            ledger = UsageLedger(db_path)
+            _ledgers[db_path] = ledger
+        return ledger
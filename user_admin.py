@@ -0,0 +1,45 @@
+import argparse
+import sys
+import time
+
+import passwords
+from database import EXPORT_FIELDS, SECRET_EXPORT_FIELDS, UserDatabase, read_user_rows, write_user_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量导入/导出用户账号")
+    parser.add_argument("--db", default="user_database.db", help="用户数据库路径")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="从.csv/.jsonl文件导入用户")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--batch-size", type=int, default=2000, help="每个事务插入的行数")
+    import_parser.add_argument("--workers", type=int, help="哈希线程数（默认CPU核数）")
+    import_parser.add_argument("--cost", choices=sorted(passwords.COSTS),
+                               help="导入时的密码哈希强度（默认与注册相同）；较弱的强度在首次登录时升级")
+
+    export_parser = subparsers.add_parser("export", help="导出用户到.csv/.jsonl文件")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--include-secrets", action="store_true",
+                               help="同时导出API密钥和密码哈希（可用于迁移到另一个数据库）")
+
+    args = parser.parse_args()
+    db = UserDatabase(args.db)
+    started = time.perf_counter()
+
+    if args.command == "import":
+        result = db.import_users(read_user_rows(args.path), cost=args.cost,
+                                 batch_size=args.batch_size, workers=args.workers)
+        for row_no, username, reason in result["conflicts"]:
+            print(f"第{row_no}行 {username}: {reason}", file=sys.stderr)
+        print(f"导入 {result['imported']} 个用户，冲突 {len(result['conflicts'])} 行，"
+              f"用时 {time.perf_counter() - started:.1f}s")
+        sys.exit(1 if result["conflicts"] else 0)
+    else:
+        fields = EXPORT_FIELDS + (SECRET_EXPORT_FIELDS if args.include_secrets else ())
+        count = write_user_rows(args.path, db.export_users(args.include_secrets), fields)
+        print(f"导出 {count} 个用户，用时 {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import time
+import traceback
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+# 机器人调用以网络等待为主，线程数可以高于CPU核数
+MAX_BOT_THREADS = 8
+
+_thread_pool = None
+
+
+def get_thread_pool():
+    """获取机器人调用专用的线程池（进程内共享）"""
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = QThreadPool()
+        _thread_pool.setMaxThreadCount(MAX_BOT_THREADS)
+    return _thread_pool
+
+
+class WorkerSignals(QObject):
+    """后台任务向GUI线程回传结果所用的信号"""
+    finished = pyqtSignal(object)
+    error = pyqtSignal(str)
+    chunk = pyqtSignal(str)
+
+
+class FunctionWorker(QRunnable):
+    """在线程池中执行任意函数，通过信号返回结果或错误"""
+
+    def __init__(self, fn, *args, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+        self.enqueued_at = time.perf_counter()
+
+    def run(self):
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            traceback.print_exc()
+            self.signals.error.emit(str(e))
+        else:
+            self.signals.finished.emit(result)
+
+
+class BotWorker(FunctionWorker):
+    """在后台线程中获取机器人回复"""
+
+    def __init__(self, bot, message):
+        super().__init__(bot.get_response, message)
+        self.bot = bot
+        self.message = message
+
+
+class StreamWorker(FunctionWorker):
+    """在后台线程中逐块获取机器人回复，每个文本块通过chunk信号发送"""
+
+    def __init__(self, bot, message):
+        super().__init__(self._stream, bot, message)
+        self.bot = bot
+        self.message = message
+
+    def _stream(self, bot, message):
+        collected_chunks = []
+        for content_chunk in bot.stream_response(message, enqueued_at=self.enqueued_at):
+            collected_chunks.append(content_chunk)
+            self.signals.chunk.emit(content_chunk)
+        return "".join(collected_chunks)
+
+
+def submit(worker):
+    """提交后台任务到共享线程池"""
+    get_thread_pool().start(worker)
+    return worker